@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# benchmarks/bench_batch_schedule.py
+"""
+Benchmark: batch makespan with FIFO (name order) vs. longest-processing-time-first dispatch.
+
+A synthetic batch mixes many small files with a few large ones. The real processing time of
+each file is its estimated cost (scheduler.cost_from_size) times a random estimation error, so
+LPT works from imperfect estimates just like in production. Every batch is scheduled on
+`--workers` workers both ways; --sleep-scale also runs the batch with real threads.
+
+Usage:
+    python benchmarks/bench_batch_schedule.py [--files 40] [--workers 4] [--batches 200] [--sleep-scale 0]
+"""
+
+import argparse
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from compressor import scheduler
+
+
+def make_batch(files, rng, target_size_mb=2.0):
+    """Return [(name, estimated_cost, actual_duration)] in name order."""
+    batch = []
+    for index in range(files):
+        if rng.random() < 0.08:
+            size_mb = rng.uniform(80, 250)   # the occasional huge scan
+        else:
+            size_mb = rng.lognormvariate(2.0, 0.8)
+        pages = max(1, round(size_mb / rng.uniform(0.15, 0.6)))
+        cost = scheduler.cost_from_size(size_mb, pages, target_size_mb)
+        batch.append((f"file{index:03d}.pdf", cost, cost * rng.lognormvariate(0, 0.3)))
+    rng.shuffle(batch)  # name order is unrelated to size
+    return sorted(batch)
+
+
+def run_threads(durations, workers, scale):
+    """Wall time of actually running the jobs (sleeping duration * scale) on a thread pool."""
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(lambda d: time.sleep(d * scale), durations))
+    return time.monotonic() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=40)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--batches", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--sleep-scale", type=float, default=0.0,
+                        help="Also run one batch with real threads, sleeping cost * scale seconds per file")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    totals = {'fifo': 0.0, 'lpt': 0.0, 'bound': 0.0}
+    lpt_wins = 0
+    for _ in range(args.batches):
+        batch = make_batch(args.files, rng)
+        fifo = scheduler.simulate_makespan([d for _, _, d in batch], args.workers)
+        ordered = scheduler.lpt_order(batch, [c for _, c, _ in batch])
+        lpt = scheduler.simulate_makespan([d for _, _, d in ordered], args.workers)
+        durations = [d for _, _, d in batch]
+        bound = max(sum(durations) / args.workers, max(durations))
+        totals['fifo'] += fifo
+        totals['lpt'] += lpt
+        totals['bound'] += bound
+        lpt_wins += lpt <= fifo
+
+    print(f"{args.batches} batches of {args.files} files on {args.workers} workers (simulated)")
+    print(f"  FIFO makespan: {totals['fifo'] / args.batches:10.1f}  ({totals['fifo'] / totals['bound']:.3f}x lower bound)")
+    print(f"  LPT makespan:  {totals['lpt'] / args.batches:10.1f}  ({totals['lpt'] / totals['bound']:.3f}x lower bound)")
+    print(f"  LPT speedup:   {totals['fifo'] / totals['lpt']:.2f}x, LPT not worse in {lpt_wins}/{args.batches} batches")
+
+    if args.sleep_scale > 0:
+        batch = make_batch(args.files, rng)
+        fifo = run_threads([d for _, _, d in batch], args.workers, args.sleep_scale)
+        ordered = scheduler.lpt_order(batch, [c for _, c, _ in batch])
+        lpt = run_threads([d for _, _, d in ordered], args.workers, args.sleep_scale)
+        print(f"Threaded run: FIFO {fifo:.2f}s, LPT {lpt:.2f}s ({fifo / lpt:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
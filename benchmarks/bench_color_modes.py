@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# benchmarks/bench_color_modes.py
+"""
+Benchmark: all-colour rendering vs. per-page colour modes (--color-mode auto) on a real PDF.
+
+Both runs render, OCR and rebuild the whole document once with the same parameters (no page
+cache); the report compares the page image data written, the output size and the wall time.
+Needs the external tools (pdftoppm, pdfimages, tesseract, recode_pdf).
+
+Usage:
+    python benchmarks/bench_color_modes.py input.pdf [--dpi 300] [--bg-downsample 2] [--image-format pnm]
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from compressor import pipeline, scratch
+from compressor.session import DocumentSession
+
+
+def run_once(pdf_path, color_mode, args, output_dir):
+    """Render, OCR and rebuild once. Returns (seconds, image bytes, output bytes) or None."""
+    ledger = scratch.ledger()
+    rendered = ledger.written.get('render', 0)
+    start = time.monotonic()
+    session = DocumentSession(pdf_path, ocr_jobs=args.ocr_jobs, image_format=args.image_format, color_mode=color_mode)
+    try:
+        staged = session.stage(args.dpi)
+        if staged is None:
+            return None
+        stage_dir, image_files, hocr_file = staged
+        output = output_dir / f"{color_mode}.pdf"
+        params = {'dpi': args.dpi, 'bg_downsample': args.bg_downsample}
+        if not pipeline.reconstruct_pdf(image_files, hocr_file, stage_dir, params, output):
+            return None
+        return time.monotonic() - start, ledger.written.get('render', 0) - rendered, output.stat().st_size
+    finally:
+        session.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdf", type=Path)
+    parser.add_argument("--dpi", type=int, default=300)
+    parser.add_argument("--bg-downsample", type=int, default=2)
+    parser.add_argument("--image-format", choices=list(pipeline.IMAGE_FORMATS), default="pnm")
+    parser.add_argument("--ocr-jobs", type=int, default=None)
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="bench_color_modes_") as output_dir:
+        for color_mode in ("color", "auto"):
+            results[color_mode] = run_once(args.pdf, color_mode, args, Path(output_dir))
+            if results[color_mode] is None:
+                sys.exit(f"The {color_mode} run failed, see the log")
+
+    baseline = results["color"]
+    print(f"{args.pdf.name} at {args.dpi} DPI, {args.image_format} page images")
+    for color_mode, (seconds, image_bytes, output_bytes) in results.items():
+        print(f"  {color_mode:6s} {seconds:8.1f}s  page images {image_bytes / 1024 ** 2:8.1f}MB "
+              f"({image_bytes / max(baseline[1], 1):.0%})  output {output_bytes / 1024 ** 2:7.2f}MB "
+              f"({output_bytes / max(baseline[2], 1):.0%})")
+    print(f"  auto speedup: {baseline[0] / results['auto'][0]:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# benchmarks/bench_hocr_merge.py
+"""
+Microbenchmark: streaming hOCR merger vs. the previous character-scanning div matcher.
+
+Usage:
+    python benchmarks/bench_hocr_merge.py [--pages 200] [--words 2000] [--repeat 3]
+"""
+
+import argparse
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from compressor import hocr
+
+
+def make_page(page_no, words, rng):
+    """Generate a dense, tesseract-like hOCR page with `words` words."""
+    lines = [
+        '<?xml version="1.0" encoding="UTF-8"?>\n<html><head><title></title></head>\n<body>\n',
+        f"  <div class='ocr_page' id='page_{page_no}' title='image \"page-{page_no}.tif\"; bbox 0 0 4960 7016; ppageno 0'>\n",
+    ]
+    per_line = 12
+    for block in range(0, words, per_line * 10):
+        lines.append(f"   <div class='ocr_carea' id='block_{page_no}_{block}' title=\"bbox 0 0 4960 7016\">\n")
+        lines.append(f"    <p class='ocr_par' id='par_{page_no}_{block}' lang='eng'>\n")
+        for line in range(block, min(block + per_line * 10, words), per_line):
+            lines.append(f"     <span class='ocr_line' id='line_{page_no}_{line}' title=\"bbox 0 {line} 4960 {line + 40}\">")
+            for word in range(line, min(line + per_line, words)):
+                text = ''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(2, 10)))
+                lines.append(f"<span class='ocrx_word' id='word_{page_no}_{word}' title='bbox {word} 0 {word + 30} 40; x_wconf 93'>{text}</span> ")
+            lines.append("</span>\n")
+        lines.append("    </p>\n   </div>\n")
+    lines.append("  </div>\n</body>\n</html>\n")
+    return ''.join(lines)
+
+
+def legacy_merge(hocr_files, output_path):
+    """The merger used before the streaming implementation (kept here for comparison)."""
+    with open(output_path, 'w', encoding='utf-8') as outfile:
+        outfile.write(hocr.HOCR_HEADER)
+        for hocr_file in hocr_files:
+            with open(hocr_file, 'r', encoding='utf-8') as infile:
+                content = infile.read()
+                start_idx = content.find('<div class=\'ocr_page\'')
+                if start_idx != -1:
+                    page_content = content[start_idx:]
+                    div_count = 0
+                    end_idx = -1
+                    for i, char in enumerate(page_content):
+                        if page_content[i:i+5] == '<div ':
+                            div_count += 1
+                        elif page_content[i:i+6] == '</div>':
+                            div_count -= 1
+                            if div_count == 0:
+                                end_idx = i + 6
+                                break
+                    if end_idx != -1:
+                        outfile.write(page_content[:end_idx] + '\n')
+                    else:
+                        first_end = page_content.find('</div>')
+                        if first_end != -1:
+                            outfile.write(page_content[:first_end + 6] + '\n')
+        outfile.write(hocr.HOCR_FOOTER)
+
+
+def best_of(repeat, func, *args):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="hOCR merge microbenchmark")
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--words", type=int, default=2000, help="Words per page")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    work_dir = Path(tempfile.mkdtemp())
+    try:
+        rng = random.Random(42)
+        hocr_files = []
+        for page_no in range(1, args.pages + 1):
+            path = work_dir / f"page-{page_no:04d}.hocr"
+            path.write_text(make_page(page_no, args.words, rng), encoding='utf-8')
+            hocr_files.append(path)
+        input_mb = sum(p.stat().st_size for p in hocr_files) / (1024 * 1024)
+
+        legacy_out = work_dir / "legacy.hocr"
+        streaming_out = work_dir / "streaming.hocr"
+        legacy_time = best_of(args.repeat, legacy_merge, hocr_files, legacy_out)
+        streaming_time = best_of(args.repeat, hocr.merge_hocr_files, hocr_files, streaming_out)
+
+        identical = legacy_out.read_bytes() == streaming_out.read_bytes()
+        print(f"Input: {args.pages} pages, {input_mb:.1f}MB of hOCR")
+        print(f"legacy    : {legacy_time:.3f}s ({input_mb / legacy_time:.1f}MB/s)")
+        print(f"streaming : {streaming_time:.3f}s ({input_mb / streaming_time:.1f}MB/s)")
+        print(f"speedup   : {legacy_time / streaming_time:.1f}x, identical output: {identical}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
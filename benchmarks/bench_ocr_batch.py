@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# benchmarks/bench_ocr_batch.py
+"""
+Benchmark: one tesseract process per page vs. batched tesseract processes (--ocr-batch-pages).
+
+The pages of a real PDF are rendered once; then the same page images are OCRed (no page cache)
+with every batch size given, and the report shows the wall time per page and the speedup over
+one process per page. Needs the external tools (pdftoppm, tesseract).
+
+Usage:
+    python benchmarks/bench_ocr_batch.py input.pdf [--dpi 300] [--jobs 1] [--batch-pages 1 4 8 16] [--repeat 3]
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from compressor import pipeline
+
+
+def time_ocr(image_files, work_dir, jobs, batch_pages):
+    """OCR all page images once into a fresh directory. Returns the wall time, or None on failure."""
+    output_dir = Path(tempfile.mkdtemp(prefix=f"batch{batch_pages}_", dir=work_dir))
+    start = time.monotonic()
+    if pipeline.ocr_images(image_files, output_dir, jobs=jobs, batch_pages=batch_pages) is None:
+        return None
+    return time.monotonic() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdf", type=Path)
+    parser.add_argument("--dpi", type=int, default=300)
+    parser.add_argument("--jobs", type=int, default=1, help="tesseract processes at once")
+    parser.add_argument("--batch-pages", type=int, nargs="+", default=[1, 4, 8, 16])
+    parser.add_argument("--repeat", type=int, default=3, help="runs per batch size, the fastest counts")
+    args = parser.parse_args()
+
+    batch_sizes = sorted(set([1] + args.batch_pages))
+    with tempfile.TemporaryDirectory(prefix="bench_ocr_batch_") as work_dir:
+        render_dir = Path(work_dir) / "render"
+        render_dir.mkdir()
+        image_files = pipeline.deconstruct_pdf_to_images(args.pdf, render_dir, args.dpi)
+        if not image_files:
+            sys.exit("Rendering failed, see the log")
+        results = {}
+        for batch_pages in batch_sizes:
+            runs = [time_ocr(image_files, work_dir, args.jobs, batch_pages) for _ in range(args.repeat)]
+            if None in runs:
+                sys.exit(f"OCR with {batch_pages} pages per process failed, see the log")
+            results[batch_pages] = min(runs)
+
+    pages = len(image_files)
+    baseline = results[1]
+    print(f"{args.pdf.name}: {pages} pages at {args.dpi} DPI, {args.jobs} tesseract processes at once")
+    for batch_pages, seconds in results.items():
+        print(f"  {batch_pages:3d} pages/process {seconds:8.2f}s  {seconds / pages * 1000:8.0f}ms/page  "
+              f"speedup {baseline / seconds:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+# benchmarks/bench_pipeline.py
+"""
+Reproducible benchmark of the DAR pipeline stages on the synthetic corpus (benchmarks/corpus.py).
+
+`run` generates the corpus and times, per document and repetition, each stage on its own:
+    deconstruct  pipeline.deconstruct_pdf_to_images
+    analyze      pipeline.analyze_images_to_hocr (on the deconstructed images)
+    reconstruct  pipeline.reconstruct_pdf (on those images and hOCR)
+    split        splitter.split_pdf (first half of the pages)
+    process_file orchestrator.process_file, end to end (documents of at least 2MB, no page cache)
+and writes the wall times, the corpus digests and the environment to a JSON file.
+
+`compare` reads two result files and flags every stage whose median time grew by more than the
+threshold (and by more than --min-seconds); it exits with status 1 if there is a regression.
+Needs the external tools (pdftoppm, tesseract, recode_pdf, qpdf).
+
+Usage:
+    python benchmarks/bench_pipeline.py run results.json [--small] [--repeat 3] [--dpi 300] [--stages deconstruct analyze]
+    python benchmarks/bench_pipeline.py compare base.json new.json [--threshold 0.1] [--min-seconds 0.05]
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import corpus
+import main as cli
+import orchestrator
+from compressor import commands, pipeline, resources, splitter, strategy, utils
+
+SCHEMA = 1
+STAGES = ('deconstruct', 'analyze', 'reconstruct', 'split', 'process_file')
+REBUILD_PARAMS = {'dpi': 300, 'bg_downsample': 2}
+
+
+def timed(function, *args, **kwargs):
+    """Call function; returns (seconds, result)."""
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def run_stages(pdf_path, page_count, settings, stages):
+    """One repetition of the staged pipeline on one document. Returns {stage: seconds}."""
+    times = {}
+    with tempfile.TemporaryDirectory(prefix="bench_pipeline_") as work_dir:
+        work_dir = Path(work_dir)
+        if stages & {'deconstruct', 'analyze', 'reconstruct'}:
+            times['deconstruct'], image_files = timed(pipeline.deconstruct_pdf_to_images, pdf_path, work_dir, settings['dpi'],
+                                                      image_format=settings['image_format'])
+            if not image_files:
+                raise RuntimeError(f"deconstruct failed for {pdf_path.name}")
+        if stages & {'analyze', 'reconstruct'}:
+            times['analyze'], hocr_file = timed(pipeline.analyze_images_to_hocr, image_files, work_dir, jobs=settings['ocr_jobs'],
+                                                dpi=settings['dpi'], batch_pages=settings['ocr_batch_pages'])
+            if not hocr_file:
+                raise RuntimeError(f"analyze failed for {pdf_path.name}")
+        if 'reconstruct' in stages:
+            params = dict(REBUILD_PARAMS, dpi=settings['dpi'])
+            times['reconstruct'], rebuilt = timed(pipeline.reconstruct_pdf, image_files, hocr_file, work_dir, params, work_dir / "rebuilt.pdf")
+            if not rebuilt:
+                raise RuntimeError(f"reconstruct failed for {pdf_path.name}")
+        if 'split' in stages:
+            times['split'], split = timed(splitter.split_pdf, pdf_path, work_dir / "part.pdf", 1, max(1, page_count // 2))
+            if not split:
+                raise RuntimeError(f"split failed for {pdf_path.name}")
+    return {stage: seconds for stage, seconds in times.items() if stage in stages}
+
+
+def run_end_to_end(pdf_path, settings):
+    """process_file with the command line defaults, half the input size as target. Returns seconds."""
+    with tempfile.TemporaryDirectory(prefix="bench_process_") as output_dir:
+        target_mb = utils.get_file_size_mb(pdf_path) / 2
+        args = cli.create_argument_parser().parse_args(
+            ["--input", str(pdf_path), "--output-dir", output_dir, "--target-size", f"{target_mb:.3f}",
+             "--allow-splitting", "--no-cache"] + settings['process_args'])
+        if not orchestrator.validate_arguments(args):
+            raise RuntimeError("invalid process_file arguments")
+        seconds, success = timed(orchestrator.process_file, pdf_path, args)
+        if not success:
+            logging.warning(f"process_file did not reach the target for {pdf_path.name}")
+        return seconds
+
+
+def summarize(runs):
+    return {'runs': [round(seconds, 4) for seconds in runs], 'median': round(statistics.median(runs), 4), 'min': round(min(runs), 4)}
+
+
+def _tool_version(command):
+    try:
+        result = subprocess.run(command, capture_output=True, text=True, timeout=30)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    lines = (result.stdout or result.stderr).strip().splitlines()
+    return lines[0] if lines else None
+
+
+def environment():
+    """Machine, Python, tool versions and revision of the run."""
+    revision = _tool_version(["git", "-C", str(Path(__file__).resolve().parents[1]), "rev-parse", "--short", "HEAD"])
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'revision': revision,
+        'tools': {tool: _tool_version(command) for tool, command in (
+            ('pdftoppm', ["pdftoppm", "-v"]), ('tesseract', ["tesseract", "--version"]),
+            ('recode_pdf', ["recode_pdf", "--version"]), ('qpdf', ["qpdf", "--version"]))},
+    }
+
+
+def run(args):
+    stages = set(args.stages)
+    settings = {
+        'dpi': args.dpi,
+        'repeat': args.repeat,
+        'image_format': args.image_format,
+        'ocr_jobs': args.ocr_jobs,
+        'ocr_batch_pages': args.ocr_batch_pages,
+        'process_args': args.process_args.split() if args.process_args else [],
+    }
+    resources.configure(args.cpus, None)
+    commands.configure({}, None)
+    results = {'schema': SCHEMA, 'created': time.strftime("%Y-%m-%dT%H:%M:%S"), 'environment': environment(),
+               'settings': settings, 'documents': {}}
+    documents = corpus.SMALL_CORPUS if args.small else corpus.CORPUS
+    with tempfile.TemporaryDirectory(prefix="bench_corpus_") as corpus_dir:
+        paths = corpus.generate(corpus_dir, documents)
+        for document in documents:
+            pdf_path = paths[document.name]
+            page_count = len(document.kinds)
+            runs = {stage: [] for stage in STAGES if stage in stages}
+            end_to_end = 'process_file' in stages and strategy.determine_tier(utils.get_file_size_mb(pdf_path)) > 0
+            if not end_to_end:
+                runs.pop('process_file', None)
+            for repetition in range(args.repeat):
+                for stage, seconds in run_stages(pdf_path, page_count, settings, stages).items():
+                    runs[stage].append(seconds)
+                if end_to_end:
+                    runs['process_file'].append(run_end_to_end(pdf_path, settings))
+                print(f"{document.name}: repetition {repetition + 1}/{args.repeat} done", file=sys.stderr)
+            results['documents'][document.name] = {
+                'pages': page_count,
+                'size_bytes': pdf_path.stat().st_size,
+                'sha256': corpus.digest(pdf_path),
+                'stages': {stage: summarize(times) for stage, times in runs.items()},
+            }
+    Path(args.output).write_text(json.dumps(results, indent=2) + "\n", encoding='utf-8')
+    print_results(results)
+    print(f"Results written to {args.output}")
+
+
+def print_results(results):
+    for name, document in results['documents'].items():
+        print(f"{name} ({document['pages']} pages, {document['size_bytes'] / 1024 ** 2:.2f}MB)")
+        for stage, summary in document['stages'].items():
+            print(f"  {stage:13s} median {summary['median']:9.3f}s  min {summary['min']:9.3f}s")
+
+
+def compare_results(base, new, threshold=0.1, min_seconds=0.05):
+    """
+    Compare two result dictionaries. Returns (rows, regressions, warnings): rows are
+    (document, stage, base median, new median, ratio); regressions the subset of rows whose
+    median grew by more than threshold and min_seconds.
+    """
+    rows, regressions, warnings = [], [], []
+    if base.get('settings') != new.get('settings'):
+        warnings.append("The runs used different settings")
+    for name, base_document in base['documents'].items():
+        new_document = new['documents'].get(name)
+        if new_document is None:
+            warnings.append(f"{name} is missing from the new results")
+            continue
+        if base_document.get('sha256') != new_document.get('sha256'):
+            warnings.append(f"{name} differs between the runs (corpus changed), its times are not comparable")
+        for stage, base_summary in base_document['stages'].items():
+            new_summary = new_document['stages'].get(stage)
+            if new_summary is None:
+                continue
+            base_median, new_median = base_summary['median'], new_summary['median']
+            ratio = new_median / base_median if base_median > 0 else float('inf')
+            row = (name, stage, base_median, new_median, ratio)
+            rows.append(row)
+            if ratio > 1 + threshold and new_median - base_median > min_seconds:
+                regressions.append(row)
+    return rows, regressions, warnings
+
+
+def compare(args):
+    base = json.loads(Path(args.base).read_text(encoding='utf-8'))
+    new = json.loads(Path(args.new).read_text(encoding='utf-8'))
+    rows, regressions, warnings = compare_results(base, new, args.threshold, args.min_seconds)
+    for warning in warnings:
+        print(f"warning: {warning}")
+    for row in rows:
+        name, stage, base_median, new_median, ratio = row
+        flag = "  REGRESSION" if row in regressions else ""
+        print(f"{name:10s} {stage:13s} {base_median:9.3f}s -> {new_median:9.3f}s  {ratio:6.2f}x{flag}")
+    if regressions:
+        print(f"{len(regressions)} regression(s) above {args.threshold:.0%}")
+        sys.exit(1)
+    print("No regressions")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands_parser = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands_parser.add_parser("run", help="benchmark the corpus and write a result file")
+    run_parser.add_argument("output")
+    run_parser.add_argument("--small", action="store_true", help="only the documents with up to 12 pages")
+    run_parser.add_argument("--repeat", type=int, default=3)
+    run_parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    run_parser.add_argument("--dpi", type=int, default=300)
+    run_parser.add_argument("--image-format", choices=list(pipeline.IMAGE_FORMATS), default=pipeline.DEFAULT_IMAGE_FORMAT)
+    run_parser.add_argument("--ocr-jobs", type=int, default=None)
+    run_parser.add_argument("--ocr-batch-pages", type=int, default=pipeline.DEFAULT_OCR_BATCH_PAGES)
+    run_parser.add_argument("--cpus", type=int, default=None)
+    run_parser.add_argument("--process-args", default="", help="extra main.py options for process_file, e.g. \"--rebuild-jobs 4\"")
+    run_parser.set_defaults(handler=run)
+
+    compare_parser = commands_parser.add_parser("compare", help="flag regressions between two result files")
+    compare_parser.add_argument("base")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument("--threshold", type=float, default=0.1, help="relative slowdown that counts as a regression")
+    compare_parser.add_argument("--min-seconds", type=float, default=0.05, help="ignore slowdowns smaller than this")
+    compare_parser.set_defaults(handler=compare)
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s %(message)s")
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
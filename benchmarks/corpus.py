@@ -0,0 +1,160 @@
+# benchmarks/corpus.py
+"""
+Deterministic synthetic PDF corpus for the pipeline benchmarks.
+
+Every document is built from a fixed seed by a small PDF writer (no third-party packages), so
+the same corpus - byte for byte - is generated on every machine and for every revision:
+- text pages:  born-digital text (Helvetica, pseudo-random words from a fixed vocabulary),
+- photo pages: one full-page RGB image with smooth blocks and fine grain (Flate compressed),
+- mixed pages: a text column above a half-page photo.
+Photo pages weigh about 2.5MB each, so the photo and mixed documents fall into the size tiers
+of compressor.strategy and can be run end-to-end.
+
+Usage:
+    python benchmarks/corpus.py output_dir [--small]
+"""
+
+import argparse
+import hashlib
+import random
+import zlib
+from collections import namedtuple
+from pathlib import Path
+
+PAGE_WIDTH, PAGE_HEIGHT = 612, 792  # US Letter in points
+PHOTO_SIZE = (1100, 1400)           # photo pixels of a full photo page
+PHOTO_BLOCK = 25                    # pixels per block of the smooth base image
+WORDS = ("declaration", "property", "title", "registry", "owner", "parcel", "certificate", "land", "deed",
+         "survey", "boundary", "transfer", "section", "schedule", "witness", "signature", "date", "the",
+         "of", "and", "to", "in", "for", "is", "on", "by", "with", "as", "at", "this")
+
+# kinds: one of 'text', 'photo', 'mixed' per page
+Document = namedtuple('Document', ['name', 'kinds', 'seed'])
+
+CORPUS = (
+    Document('text_8', ('text',) * 8, 1),
+    Document('photo_4', ('photo',) * 4, 2),
+    Document('mixed_12', ('text', 'photo', 'mixed') * 4, 3),
+    Document('mixed_40', ('text', 'text', 'mixed', 'photo', 'text') * 8, 4),
+)
+SMALL_CORPUS = tuple(document for document in CORPUS if len(document.kinds) <= 12)
+
+_BASE = bytes(value * 251 // 255 for value in range(256))  # 0-251: adding grain cannot overflow a byte
+_GRAIN = bytes(value & 3 for value in range(256))          # 0-3
+
+
+def photo_pixels(width, height, rng, block=PHOTO_BLOCK):
+    """
+    RGB pixels of a synthetic photo: random colour blocks plus fine grain. The grain is added to
+    all pixels at once as big-integer addition (no byte can carry into its neighbour).
+    """
+    columns, rows = -(-width // block), -(-height // block)
+    small = rng.randbytes(columns * rows * 3).translate(_BASE)
+    lines = []
+    for row in range(rows):
+        cells = small[row * columns * 3:(row + 1) * columns * 3]
+        line = b"".join(cells[column * 3:column * 3 + 3] * block for column in range(columns))[:width * 3]
+        lines.append(line * min(block, height - row * block))
+    base = b"".join(lines)
+    grain = rng.randbytes(len(base)).translate(_GRAIN)
+    return (int.from_bytes(base, 'big') + int.from_bytes(grain, 'big')).to_bytes(len(base), 'big')
+
+
+def text_lines(rng, count, words_per_line=11):
+    return [" ".join(rng.choice(WORDS) for _ in range(words_per_line)) for _ in range(count)]
+
+
+def _text_block(lines, top):
+    escaped = [line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") for line in lines]
+    return ("BT /F1 11 Tf 14 TL 72 %d Td " % top + " ".join(f"({line}) '" for line in escaped) + " ET\n").encode()
+
+
+class PdfWriter:
+    """Minimal PDF 1.4 writer: numbered objects, one xref table, no timestamps or IDs."""
+
+    def __init__(self):
+        self.objects = []
+
+    def add(self, body):
+        """Add an object (bytes, without obj/endobj) and return its number."""
+        self.objects.append(body)
+        return len(self.objects)
+
+    def reserve(self):
+        return self.add(b"")
+
+    def set(self, number, body):
+        self.objects[number - 1] = body
+
+    def stream(self, dictionary, data):
+        return self.add(b"<< " + dictionary + b" /Length %d >>\nstream\n" % len(data) + data + b"\nendstream")
+
+    def write(self, path, root):
+        output = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        offsets = []
+        for number, body in enumerate(self.objects, 1):
+            offsets.append(len(output))
+            output += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+        xref = len(output)
+        output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(self.objects) + 1)
+        output += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+        output += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(self.objects) + 1, root, xref)
+        Path(path).write_bytes(bytes(output))
+
+
+def build_document(document, path):
+    """Write one corpus document to path."""
+    rng = random.Random(document.seed)
+    pdf = PdfWriter()
+    catalog = pdf.reserve()
+    pages = pdf.reserve()
+    font = pdf.add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+    page_numbers = []
+    for kind in document.kinds:
+        content = b""
+        resources = b"/Font << /F1 %d 0 R >>" % font
+        if kind == 'text':
+            content = _text_block(text_lines(rng, 46), 720)
+        else:
+            width, height = PHOTO_SIZE if kind == 'photo' else (PHOTO_SIZE[0], PHOTO_SIZE[1] // 2)
+            image = pdf.stream(b"/Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /DeviceRGB "
+                               b"/BitsPerComponent 8 /Filter /FlateDecode" % (width, height),
+                               zlib.compress(photo_pixels(width, height, rng), 6))
+            resources += b" /XObject << /Im1 %d 0 R >>" % image
+            if kind == 'photo':
+                content = b"q 540 0 0 702 36 45 cm /Im1 Do Q\n"
+            else:
+                content = _text_block(text_lines(rng, 22), 720) + b"q 540 0 0 351 36 45 cm /Im1 Do Q\n"
+        stream = pdf.stream(b"", content)
+        page_numbers.append(pdf.add(b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %d %d] /Resources << %s >> /Contents %d 0 R >>"
+                                    % (pages, PAGE_WIDTH, PAGE_HEIGHT, resources, stream)))
+    pdf.set(pages, b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % n for n in page_numbers), len(page_numbers)))
+    pdf.set(catalog, b"<< /Type /Catalog /Pages %d 0 R >>" % pages)
+    pdf.write(path, catalog)
+    return Path(path)
+
+
+def generate(output_dir, documents=CORPUS):
+    """Write the corpus documents to output_dir. Returns {name: path}."""
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    return {document.name: build_document(document, output_dir / f"{document.name}.pdf") for document in documents}
+
+
+def digest(path):
+    """SHA-256 of a file, to check that two benchmark runs used the same corpus."""
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("output_dir", type=Path)
+    parser.add_argument("--small", action="store_true", help="only the documents with up to 12 pages")
+    args = parser.parse_args()
+    for name, path in generate(args.output_dir, SMALL_CORPUS if args.small else CORPUS).items():
+        print(f"{name:10s} {path.stat().st_size / 1024 ** 2:7.2f}MB  {digest(path)[:16]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+# compressor/accounting.py
+
+"""
+Resource accounting of the external commands.
+
+Every command run through utils.run_command becomes one record: wall time of the process, time
+spent waiting for the CPU/memory budget, user/system CPU seconds and peak memory of the tool
+(measured by compressor.launcher), bytes written to its output paths and its exit status, tagged
+with the pipeline stage and with the file, strategy attempt and split part it runs for. The
+tags are set with tagged() around the work and follow it into pool threads started with
+utils.in_current_context.
+
+With --command-log the records are appended to a file as JSON lines, so a production run shows
+which stage and which attempt dominate the cost; the totals per stage are logged at the end of
+every run.
+"""
+
+import contextvars
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+_tags = contextvars.ContextVar('accounting_tags', default={})
+
+
+@contextmanager
+def tagged(**tags):
+    """Tag the commands run inside the block (and in the threads it starts), e.g. file=name."""
+    token = _tags.set({**_tags.get(), **tags})
+    try:
+        yield
+    finally:
+        _tags.reset(token)
+
+
+def current_tags():
+    return dict(_tags.get())
+
+
+def _matches(patterns):
+    paths = set()
+    for pattern in patterns:
+        pattern = str(pattern)
+        paths.update(glob.glob(pattern) if glob.has_magic(pattern) else [pattern])
+    return paths
+
+
+def snapshot(patterns):
+    """(size, mtime) of the existing files matching output paths or glob patterns."""
+    files = {}
+    for path in _matches(patterns):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        files[path] = (stat.st_size, stat.st_mtime_ns)
+    return files
+
+
+def written_bytes(patterns, before):
+    """Bytes of the files matching the patterns that are new or changed since the snapshot before."""
+    return sum(size for path, (size, mtime) in snapshot(patterns).items() if before.get(path) != (size, mtime))
+
+
+class CommandLog:
+    """Totals per stage and, when a path is given, every record as one JSON line in that file."""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.totals = {}  # stage -> [commands, wall seconds, CPU seconds]
+        self._lock = threading.Lock()
+        self._file = open(path, 'a', encoding='utf-8') if path else None
+
+    @property
+    def enabled(self):
+        return self._file is not None
+
+    def add(self, entry):
+        line = json.dumps(entry)
+        with self._lock:
+            totals = self.totals.setdefault(entry['stage'], [0, 0.0, 0.0])
+            totals[0] += 1
+            totals[1] += entry['wall_seconds'] or 0.0
+            totals[2] += (entry['user_seconds'] or 0.0) + (entry['system_seconds'] or 0.0)
+            if self._file is not None:
+                self._file.write(line + "\n")
+                self._file.flush()
+        logging.debug(f"Command record: {line}")
+
+    def report(self):
+        """One-line summary of the command time per stage, the most expensive stage first."""
+        with self._lock:
+            totals = sorted(self.totals.items(), key=lambda item: -item[1][1])
+        stages = ", ".join(f"{stage} {count}x {wall:.1f}s wall/{cpu:.1f}s CPU" for stage, (count, wall, cpu) in totals)
+        return f"External command time per stage: {stages or 'none'}"
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+_log = CommandLog()
+
+
+def configure(path=None):
+    """Start a new command log; with path, append its records to that JSON lines file."""
+    global _log
+    _log.close()
+    _log = CommandLog(path)
+    if path:
+        logging.info(f"Command resource records are written to {path}")
+    return _log
+
+
+def command_log():
+    """The process-wide command log."""
+    return _log
+
+
+def record(command, stage, result, seconds, written=None):
+    """
+    Record a finished command. result is its commands.CommandResult, seconds the time from the
+    request to the result (including the wait for the budget), written the bytes of its outputs.
+    """
+    usage = result.usage
+    wall = usage.wall_seconds if usage else None
+    entry = {
+        'time': round(time.time(), 3),
+        'tool': os.path.basename(str(command[0])) if command else '',
+        'stage': stage,
+        **current_tags(),
+        'status': result.error or ('ok' if result.returncode == 0 else 'failed'),
+        'returncode': result.returncode,
+        'wall_seconds': round(wall, 3) if wall is not None else None,
+        'wait_seconds': round(max(0.0, seconds - wall), 3) if wall is not None else None,
+        'user_seconds': usage.user_seconds if usage else None,
+        'system_seconds': usage.system_seconds if usage else None,
+        'peak_rss_mb': round(usage.peak_rss_mb, 1) if usage and usage.peak_rss_mb is not None else None,
+        'bytes_written': written,
+        'command': ' '.join(str(part) for part in command),
+    }
+    _log.add(entry)
+    return entry
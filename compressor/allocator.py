@@ -0,0 +1,210 @@
+# compressor/allocator.py
+
+"""
+Per-page parameter allocation.
+
+Instead of one dpi/bg_downsample pair for the whole document, every page gets its own entry of
+the strategy ladder. The target size is a byte budget and the choice is a multiple-choice
+knapsack: one option per page, maximizing the total quality within the budget.
+
+- Page sizes: the predicted document size of each option (compressor.predictor) is split into
+  a mask part (proportional to dpi, the same on every page) and a background part
+  (proportional to the background pixel count, spread over the pages by image complexity).
+  These are modelled, not measured, size/quality curves: the predictor rebuilds groups of
+  sample pages, which gives one size per group and option but none per page, and rebuilding
+  every page at every option would cost more than the search it replaces. The model assumes
+  that the background bytes of a page follow the zlib complexity of its render and that every
+  page reacts to dpi and bg_downsample like the document as a whole; a page whose JPEG2000
+  background compresses much better or worse than its zlib complexity suggests (fine halftone,
+  large flat areas) gets a wrong share, so only the document total is reliable. The rebuilt
+  plan is measured like any other attempt and the search continues if it misses the target.
+- Page quality: log2(dpi) for the text layer and mask, plus log2(dpi / bg_downsample) weighted
+  by how photographic the page is. Text pages gain nothing from a finer background, so the
+  budget goes to the pages with photos and stamps.
+
+The knapsack is solved greedily on the upper convex hull of every page's options, which is
+optimal up to the last upgrade that no longer fits. The plan is rebuilt with one recode_pdf
+run per distinct option, from page images at that option's DPI, and the pages are put back in
+order with qpdf.
+"""
+
+import logging
+import math
+from concurrent.futures import ThreadPoolExecutor
+from . import pipeline, scratch, split_planner, utils
+
+# Plans aim at this fraction of the target to leave room for the estimation error
+BUDGET_HEADROOM = 0.95
+# Pages at least this many times as complex as a typical (25th percentile) page count as photo pages
+PHOTO_COMPLEXITY_RATIO = 2.0
+
+
+def photo_weights(complexity):
+    """Photo weight (0 for plain text pages, 1 for photo pages) from the page image complexity."""
+    typical = sorted(complexity)[len(complexity) // 4] or 1
+    return [min(1.0, max(0.0, (c / typical - 1) / (PHOTO_COMPLEXITY_RATIO - 1))) for c in complexity]
+
+
+def page_size_model(predicted_mb, params_sequence, complexity):
+    """
+    Split the predicted document size of every option into per-page sizes.
+    Fits predicted = mask * dpi/300 + background * (dpi/300)^2 / bg_downsample^2 (least squares,
+    both terms non-negative); the mask part is shared equally, the background part by complexity.
+    The per-page sizes are estimates that add up to the prediction, not measurements.
+    Returns page_sizes[page][option].
+    """
+    features = [
+        (params['dpi'] / 300, (params['dpi'] / 300) ** 2 / params['bg_downsample'] ** 2)
+        for params in params_sequence
+    ]
+    sxx = sum(m * m for m, _ in features)
+    syy = sum(g * g for _, g in features)
+    sxy = sum(m * g for m, g in features)
+    sx = sum(m * y for (m, _), y in zip(features, predicted_mb))
+    sy = sum(g * y for (_, g), y in zip(features, predicted_mb))
+    det = sxx * syy - sxy * sxy
+    mask = (sx * syy - sy * sxy) / det if det > 1e-12 else -1
+    background = (sy * sxx - sx * sxy) / det if det > 1e-12 else -1
+    if mask < 0 or background < 0:
+        # One term alone explains the sizes better: keep the background term only
+        mask, background = 0.0, sy / syy
+
+    total = max(sum(complexity), 1)
+    pages = len(complexity)
+    return [
+        [mask * m / pages + background * g * c / total for m, g in features]
+        for c in complexity
+    ]
+
+
+def option_quality(params, photo_weight):
+    """Quality score of a parameter set for a page with the given photo weight (0..1)."""
+    return math.log2(params['dpi']) + photo_weight * math.log2(params['dpi'] / params['bg_downsample'])
+
+
+def _upper_hull(options):
+    """
+    Options (size, value, index) of one page reduced to the upper convex hull, cheapest first:
+    each step to the next option has a lower value per MB than the one before.
+    """
+    hull = []
+    for option in sorted(options):
+        if hull and option[1] <= hull[-1][1]:
+            continue  # not better than a cheaper option
+        while len(hull) >= 2:
+            (s1, v1, _), (s2, v2, _) = hull[-2], hull[-1]
+            if (v2 - v1) * (option[0] - s2) <= (option[1] - v2) * (s2 - s1):
+                hull.pop()  # the middle option lies under the line to the new one
+            else:
+                break
+        hull.append(option)
+    return hull
+
+
+def allocate(page_sizes, page_values, budget):
+    """
+    Multiple-choice knapsack: page_sizes[p][o] and page_values[p][o] are the size and quality of
+    option o on page p. Returns the chosen option index of every page, or None if even the
+    cheapest options exceed the budget.
+    """
+    hulls = [
+        _upper_hull([(size, value, option) for option, (size, value) in enumerate(zip(sizes, values))])
+        for sizes, values in zip(page_sizes, page_values)
+    ]
+    choice = [0] * len(hulls)  # position on each page's hull
+    used = sum(hull[0][0] for hull in hulls)
+    if used > budget:
+        return None
+
+    steps = []
+    for page, hull in enumerate(hulls):
+        for position in range(1, len(hull)):
+            extra = hull[position][0] - hull[position - 1][0]
+            gain = hull[position][1] - hull[position - 1][1]
+            steps.append((gain / extra if extra > 0 else math.inf, page, position, extra))
+    # Best value per MB first; the hull makes the steps of one page come in order
+    steps.sort(key=lambda step: -step[0])
+    for _, page, position, extra in steps:
+        if choice[page] != position - 1 or used + extra > budget:
+            continue
+        choice[page] = position
+        used += extra
+    return [hull[position][2] for hull, position in zip(hulls, choice)]
+
+
+def plan_pages(session, dpi, params_sequence, target_size_mb):
+    """
+    Choose a ladder entry for every page of the session so that the predicted output fits the
+    target. Returns the list of parameter sets (one per page), or None.
+    """
+    predictions = session.size_predictor.predict_ladder(params_sequence)
+    if predictions is None:
+        return None
+    complexity = [split_planner.image_complexity(image) for image in session.page_images(dpi)]
+    page_sizes = page_size_model([p.size_mb for p in predictions], params_sequence, complexity)
+    page_values = [[option_quality(params, w) for params in params_sequence] for w in photo_weights(complexity)]
+
+    budget = target_size_mb * BUDGET_HEADROOM
+    choice = allocate(page_sizes, page_values, budget)
+    if choice is None:
+        logging.warning(f"Per-page allocation: even the most aggressive settings are predicted above {budget:.2f}MB")
+        return None
+
+    planned_mb = sum(sizes[o] for sizes, o in zip(page_sizes, choice))
+    quality = sum(values[o] for values, o in zip(page_values, choice))
+    uniform = [o for o, p in enumerate(predictions) if p.size_mb <= budget]
+    uniform_text = "no uniform setting fits"
+    if uniform:
+        uniform_quality = sum(values[uniform[0]] for values in page_values)
+        uniform_text = f"uniform parameter set {uniform[0]+1}: {uniform_quality / len(choice):.2f}"
+    counts = {o: choice.count(o) for o in sorted(set(choice))}
+    logging.info(
+        f"Per-page allocation: predicted {planned_mb:.2f}MB of {budget:.2f}MB budget, "
+        f"mean quality {quality / len(choice):.2f} ({uniform_text}); "
+        + ", ".join(f"{n} pages with parameter set {o+1}" for o, n in counts.items())
+    )
+    return [params_sequence[o] for o in choice]
+
+
+def rebuild_with_plan(session, page_params, output_pdf_path):
+    """
+    Rebuild the session's pages with per-page parameters: one recode_pdf run per distinct
+    parameter set (up to session.rebuild_jobs at once, each from page images at its own DPI),
+    then the pages are assembled in order.
+    """
+    groups = {}
+    for page, params in enumerate(page_params, 1):
+        groups.setdefault(tuple(sorted(params.items())), []).append(page)
+
+    def rebuild_group(item):
+        index, (key, pages) = item
+        params = dict(key)
+        staged = session.stage_pages(params['dpi'], pages)
+        if not staged:
+            return None
+        stage_dir, image_files, hocr_file = staged
+        group_pdf = stage_dir / f"plan_{output_pdf_path.stem}_{index}.pdf"
+        if not pipeline.reconstruct_pdf(image_files, hocr_file, stage_dir, params, group_pdf):
+            return None
+        return group_pdf
+
+    jobs = max(1, min(session.rebuild_jobs or 1, len(groups)))
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        group_pdfs = list(executor.map(utils.in_current_context(rebuild_group), enumerate(groups.items())))
+    if any(pdf is None for pdf in group_pdfs):
+        logging.error("Per-page reconstruction failed for at least one parameter set.")
+        scratch.discard(*[pdf for pdf in group_pdfs if pdf is not None])
+        return False
+
+    position = {}
+    for group_pdf, pages in zip(group_pdfs, groups.values()):
+        for number, page in enumerate(pages, 1):
+            position[page] = (group_pdf, number)
+    sources = [position[page] for page in range(1, len(page_params) + 1)]
+    assembled = pipeline.assemble_pdf(sources, output_pdf_path)
+    scratch.discard(*group_pdfs)
+    if not assembled:
+        logging.error("Assembling the per-page reconstruction failed.")
+        return False
+    logging.info(f"Per-page reconstruction successful, output to {output_pdf_path} ({utils.get_file_size_mb(output_pdf_path):.2f}MB)")
+    return True
@@ -0,0 +1,220 @@
+# compressor/cache.py
+
+"""
+Persistent, content-addressed cache for rendered page images and per-page hOCR.
+
+Pages are identified by the SHA-256 of the single-page PDF that `qpdf --split-pages`
+produces for them, so the same page is found again across runs, target sizes and even
+different documents. Entries are stored as files under `objects/` and indexed in an
+SQLite database, which gives us LRU bookkeeping and safe access from several threads or
+processes at once. Files are written atomically (temporary file + rename) and always copied in
+and out, never hard-linked: a run that rewrites a staged image or hOCR in place must not change
+the object that later runs restore.
+
+The cache is opt-in (--cache-dir): it holds up to --cache-size-mb (2GB by default) in that
+directory, and the first render of every document hashes its pages with an extra
+`qpdf --split-pages` pass. It pays off when the same documents are processed again (other target
+sizes, reruns after a failure); one-off runs go without it. Documents that are never rendered
+(already below the target size) are not hashed.
+"""
+
+import glob
+import hashlib
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from . import utils
+
+DEFAULT_CACHE_SIZE_MB = 2048
+
+# Key prefix -> statistics bucket
+_KINDS = {'img': 'image', 'hocr': 'hocr'}
+
+
+def page_digests(pdf_path):
+    """
+    Return the content hash of every page of the PDF (in page order), or None on failure.
+    """
+    work_dir = Path(tempfile.mkdtemp(prefix="pdf_compressor_digest_"))
+    try:
+        command = [
+            "qpdf",
+            "--deterministic-id",
+            str(pdf_path),
+            "--split-pages",
+            str(work_dir / "page-%d.pdf")
+        ]
+        if not utils.run_command(command, stage='digest', outputs=[work_dir / "page-*.pdf"]):
+            logging.warning(f"Unable to hash the pages of {pdf_path.name}, the cache will not be used.")
+            return None
+        digests = []
+        for page_file in sorted(glob.glob(str(work_dir / "page-*.pdf"))):
+            with open(page_file, 'rb') as f:
+                digests.append(hashlib.sha256(f.read()).hexdigest())
+        return digests
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+class PageCache:
+    """Size-capped LRU cache of page images and hOCR, keyed by page content."""
+
+    def __init__(self, cache_dir, max_size_mb=DEFAULT_CACHE_SIZE_MB):
+        self.cache_dir = Path(cache_dir)
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+        self.objects_dir = self.cache_dir / "objects"
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        self.index_path = self.cache_dir / "index.sqlite"
+        self.stats = {'image': [0, 0], 'hocr': [0, 0]}  # kind -> [hits, misses]
+        self._digests = {}       # (path, size, mtime) -> page digests
+        self._image_origin = {}  # rendered image path -> (page digest, dpi)
+        self._lock = threading.Lock()
+        with self._transaction() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+            )
+
+    @contextmanager
+    def _transaction(self):
+        """One short-lived connection per operation; SQLite serializes concurrent writers."""
+        conn = sqlite3.connect(self.index_path, timeout=60, isolation_level=None)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def _object_path(self, key):
+        digest = key.split('-', 2)[1]
+        return self.objects_dir / digest[:2] / key
+
+    # ---- keys ----
+
+    def page_digests(self, pdf_path):
+        """Page digests of the PDF, computed once per file version."""
+        stat = os.stat(pdf_path)
+        memo_key = (str(Path(pdf_path).resolve()), stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            if memo_key in self._digests:
+                return self._digests[memo_key]
+        digests = page_digests(pdf_path)
+        with self._lock:
+            self._digests[memo_key] = digests
+        return digests
+
+    @staticmethod
+    def image_key(digest, dpi, image_format='tiff', color_mode='color'):
+        # Uncompressed colour TIFF keeps the key of earlier versions
+        key = f"img-{digest}-{dpi}" if image_format == 'tiff' else f"img-{digest}-{dpi}-{image_format}"
+        return key if color_mode == 'color' else f"{key}-{color_mode}"
+
+    @staticmethod
+    def hocr_key(digest, dpi, lang, ocr_dpi=None):
+        # hOCR of grayscale copies downscaled to ocr_dpi (pipeline.ocr_downscaled) is kept apart
+        key = f"hocr-{digest}-{dpi}-{lang}"
+        return key if not ocr_dpi or ocr_dpi == dpi else f"{key}-ocr{ocr_dpi}g"
+
+    def remember_image(self, image_path, digest, dpi):
+        """Record which page a rendered image belongs to, so its hOCR can be cached too."""
+        with self._lock:
+            self._image_origin[str(image_path)] = (digest, dpi)
+
+    def hocr_key_for_image(self, image_path, lang, ocr_dpi=None):
+        """
+        Cache key of the hOCR for a rendered image (OCRed on a grayscale copy at ocr_dpi, if
+        given), or None if its page is unknown.
+        """
+        with self._lock:
+            origin = self._image_origin.get(str(image_path))
+        if origin is None:
+            return None
+        return self.hocr_key(origin[0], origin[1], lang, ocr_dpi)
+
+    # ---- storage ----
+
+    def get(self, key, dest_path):
+        """Materialize the cached object at dest_path. Returns True on a hit."""
+        kind = _KINDS[key.split('-', 1)[0]]
+        with self._transaction() as conn:
+            row = conn.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                conn.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+        hit = False
+        if row is not None:
+            try:
+                shutil.copyfile(self._object_path(key), dest_path)
+                hit = True
+            except FileNotFoundError:
+                # Evicted by another process between the lookup and the copy
+                pass
+        with self._lock:
+            self.stats[kind][0 if hit else 1] += 1
+        return hit
+
+    def put(self, key, src_path):
+        """Store a copy of src_path under key and evict old entries if over the size cap."""
+        object_path = self._object_path(key)
+        try:
+            object_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = object_path.with_name(f".{key}.{os.getpid()}.{threading.get_ident()}.tmp")
+            shutil.copyfile(src_path, tmp_path)
+            os.replace(tmp_path, object_path)
+            size = object_path.stat().st_size
+            with self._transaction() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO entries (key, size, last_used) VALUES (?, ?, ?)",
+                    (key, size, time.time())
+                )
+            self._evict()
+        except (OSError, sqlite3.Error) as e:
+            logging.warning(f"Unable to write cache entry {key}: {e}")
+
+    def _evict(self):
+        evicted = []
+        with self._transaction() as conn:
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total <= self.max_size_bytes:
+                return
+            for key, size in conn.execute("SELECT key, size FROM entries ORDER BY last_used").fetchall():
+                if total <= self.max_size_bytes:
+                    break
+                evicted.append(key)
+                total -= size
+            conn.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key in evicted])
+        for key in evicted:
+            try:
+                self._object_path(key).unlink()
+            except FileNotFoundError:
+                pass
+        logging.debug(f"Cache eviction removed {len(evicted)} entries")
+
+    def log_stats(self):
+        """Write hit/miss statistics to the log."""
+        with self._lock:
+            parts = [f"{kind} hit {hits} / miss {misses}" for kind, (hits, misses) in self.stats.items()]
+        logging.info(f"Page cache ({self.cache_dir}): {', '.join(parts)}")
+
+
+def open_cache(args):
+    """Create the page cache from command line arguments, or None without --cache-dir."""
+    if not getattr(args, 'cache_dir', None) or getattr(args, 'no_cache', False):
+        return None
+    try:
+        return PageCache(
+            args.cache_dir,
+            getattr(args, 'cache_size_mb', None) or DEFAULT_CACHE_SIZE_MB
+        )
+    except (OSError, sqlite3.Error) as e:
+        logging.warning(f"Unable to open page cache, continuing without it: {e}")
+        return None
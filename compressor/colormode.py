@@ -0,0 +1,169 @@
+# compressor/colormode.py
+
+"""
+Per-page colour mode detection.
+
+Most declaration pages are black-and-white text scans, yet pdftoppm renders them in full colour:
+three times the pixel data of a grayscale image through rendering, OCR and MRC encoding, and
+24 times that of a bitonal one. A fast classification pass marks every page as
+- color:   a noticeable share of the pixels of a low-resolution render (CLASSIFY_DPI) has a hue,
+- bitonal: no hue, and every image on the page is a 1-bit image (a bitonal scan: CCITT, JBIG2,
+           1-bit Flate) - a low-resolution render cannot tell anti-aliased glyph edges from real
+           midtones, the image list of the PDF (pdfimages -list) can,
+- gray:    everything else without hue (gray scans, shaded forms, vector-only pages).
+The pages are then rendered with pdftoppm -gray / -mono where that is faithful.
+
+The hue test needs no per-pixel Python code: every channel is quantized to 16 levels with
+bytes.translate, two channels are packed into one byte with big-integer arithmetic, and a
+Counter over the packed bytes gives their joint histogram.
+"""
+
+import logging
+import os
+import tempfile
+from collections import Counter
+from pathlib import Path
+from . import trace, utils
+
+COLOR = 'color'
+GRAY = 'gray'
+BITONAL = 'bitonal'
+MODES = (COLOR, GRAY, BITONAL)
+
+PDFTOPPM_OPTIONS = {COLOR: [], GRAY: ["-gray"], BITONAL: ["-mono"]}
+# pdftoppm writes PNM files with the extension of the image type
+PNM_SUFFIXES = {COLOR: ".ppm", GRAY: ".pgm", BITONAL: ".pbm"}
+# Bits per pixel, for the pixel data estimate against the all-colour baseline
+BITS_PER_PIXEL = {COLOR: 24, GRAY: 8, BITONAL: 1}
+
+CLASSIFY_DPI = 30
+# Two channels further apart than this many of the 16 quantized levels make a pixel coloured
+HUE_LEVELS = 2
+# A page is coloured when more than this share of its pixels has a hue (stamps, logos, photos)
+COLOR_PIXEL_SHARE = 0.002
+
+_QUANTIZE = bytes(value >> 4 for value in range(256))
+
+
+def _read_pnm(path, magic, channels):
+    """Read a binary 8-bit PNM file with the given magic number. Returns (width, height, pixel bytes)."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    fields = []
+    pos = 0
+    while len(fields) < 4:
+        while data[pos:pos + 1].isspace():
+            pos += 1
+        if data[pos:pos + 1] == b'#':
+            pos = data.index(b'\n', pos) + 1
+            continue
+        end = pos
+        while not data[end:end + 1].isspace():
+            end += 1
+        fields.append(data[pos:end])
+        pos = end
+    if fields[0] != magic or int(fields[3]) > 255:
+        raise ValueError(f"{path}: not an 8-bit binary {magic.decode()} file")
+    width, height = int(fields[1]), int(fields[2])
+    return width, height, data[pos + 1:pos + 1 + width * height * channels]
+
+
+def read_ppm(path):
+    """Read a binary PPM (P6, 8 bit) file. Returns (width, height, RGB bytes)."""
+    return _read_pnm(path, b'P6', 3)
+
+
+def read_pgm(path):
+    """Read a binary PGM (P5, 8 bit) file. Returns (width, height, gray bytes)."""
+    return _read_pnm(path, b'P5', 1)
+
+
+def pair_histogram(first, second):
+    """Joint histogram of two channels quantized to 16 levels: Counter of (first << 4 | second) bytes."""
+    packed = (int.from_bytes(first, 'big') << 4) | int.from_bytes(second, 'big')
+    return Counter(packed.to_bytes(len(first), 'big'))
+
+
+def quantize(pixels):
+    """Quantize 8-bit samples to 16 levels (one byte each, 0-15)."""
+    return pixels.translate(_QUANTIZE)
+
+
+def has_hue(rgb):
+    """Whether more than COLOR_PIXEL_SHARE of the pixels (RGB bytes) have a hue."""
+    quantized = quantize(rgb)
+    red, green, blue = quantized[0::3], quantized[1::3], quantized[2::3]
+    if not green:
+        return False
+    # Every pixel with a hue differs in red/green or in green/blue: the sum bounds the share from above
+    hued = 0
+    for first, second in ((red, green), (green, blue)):
+        histogram = pair_histogram(first, second)
+        hued += sum(count for key, count in histogram.items() if abs((key >> 4) - (key & 15)) >= HUE_LEVELS)
+    return hued / len(green) > COLOR_PIXEL_SHARE
+
+
+def bitonal_pages(page_images):
+    """Pages whose images (pipeline.PageImage rows) are all 1-bit."""
+    bits = {}
+    for image in page_images:
+        bits[image.page] = max(bits.get(image.page, 1), image.bpc if image.type in ('image', 'smask') else 1)
+    return {page for page, bpc in bits.items() if bpc == 1}
+
+
+def classify_page(rgb, only_bitonal_images):
+    """Colour mode of a page from its low-resolution RGB pixels and whether it only has 1-bit images."""
+    if has_hue(rgb):
+        return COLOR
+    return BITONAL if only_bitonal_images else GRAY
+
+
+@trace.traced('colour analysis')
+def classify_pages(pdf_path, page_count, dpi=CLASSIFY_DPI):
+    """
+    Colour mode of every page of a PDF (a list in page order), or None if the classification
+    render failed.
+    """
+    from . import pipeline  # pipeline imports this module for its render options
+    work_dir = Path(tempfile.mkdtemp(prefix="pdf_compressor_colors_"))
+    try:
+        if not utils.run_command(["pdftoppm", "-r", str(dpi), str(pdf_path), str(work_dir / "page")],
+                                 stage='analysis', outputs=[work_dir / "page-*"]):
+            logging.warning("Colour mode classification failed, render every page in colour")
+            return None
+        bitonal = bitonal_pages(pipeline.list_page_images(pdf_path) or [])
+        width = len(str(page_count))
+        modes = []
+        for page in range(1, page_count + 1):
+            image = work_dir / f"page-{page:0{width}d}.ppm"
+            try:
+                modes.append(classify_page(read_ppm(image)[2], page in bitonal))
+            except (OSError, ValueError) as e:
+                logging.warning(f"Unable to classify page {page}, render it in colour: {e}")
+                modes.append(COLOR)
+            finally:
+                try:
+                    os.remove(image)
+                except OSError:
+                    pass
+    finally:
+        utils.cleanup_directory(str(work_dir))
+    if not modes:
+        return None
+    counts = Counter(modes)
+    bits = sum(BITS_PER_PIXEL[mode] for mode in modes)
+    logging.info(f"Colour modes: {counts[BITONAL]} bitonal, {counts[GRAY]} gray, {counts[COLOR]} colour pages; "
+                 f"page pixel data {bits / (BITS_PER_PIXEL[COLOR] * len(modes)):.0%} of the all-colour render")
+    return modes
+
+
+def mode_runs(color_modes, first_page, last_page):
+    """Split first_page..last_page into (first, last, mode) runs of pages with the same colour mode."""
+    runs = []
+    for page in range(first_page, last_page + 1):
+        mode = color_modes[page - 1] if color_modes else COLOR
+        if runs and runs[-1][2] == mode:
+            runs[-1][1] = page
+        else:
+            runs.append([page, page, mode])
+    return [tuple(run) for run in runs]
@@ -0,0 +1,388 @@
+# compressor/commands.py
+
+"""
+Asynchronous engine for the external commands.
+
+All pdftoppm/tesseract/recode_pdf/qpdf processes run as asyncio subprocesses on one event loop
+in a background thread. The engine
+- limits how many processes of one tool run at once (a semaphore per tool, on top of the shared
+  CPU/memory budget of compressor.resources),
+- logs stdout and stderr line by line while the command runs instead of after it finished,
+- starts every command in its own process group, so a timeout or a cancellation kills the
+  tool together with the helper processes it started,
+- stops commands that run longer than their timeout,
+- starts the tools through compressor.launcher, which caps their address space when
+  --process-address-space-mb is set and reports their peak memory (back to
+  compressor.resources) and CPU time,
+- measures every process: CommandResult.usage (see compressor.accounting).
+
+Synchronous code calls run() (utils.run_command is a thin wrapper around it); coroutines await
+run_async() directly. Commands started inside a CancelScope are killed when the scope is
+cancelled, e.g. the rebuild of a speculative candidate that can no longer be selected.
+"""
+
+import asyncio
+import atexit
+import concurrent.futures
+import contextvars
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+import weakref
+from collections import namedtuple
+from . import resources
+
+try:
+    from . import launcher
+except ImportError:  # no resource module (Windows): run the tools directly
+    launcher = None
+
+# Values of CommandResult.error
+TIMEOUT = 'timeout'
+CANCELLED = 'cancelled'
+NOT_FOUND = 'not found'
+
+# Time a process group gets to exit after SIGTERM before it is killed
+KILL_GRACE_SECONDS = 2.0
+READ_CHUNK = 64 * 1024
+
+# returncode: exit status (None if the command did not finish); stdout/stderr: decoded output;
+# error: None, TIMEOUT, CANCELLED or NOT_FOUND; usage: CommandUsage of a started process, else None
+CommandResult = namedtuple('CommandResult', ['returncode', 'stdout', 'stderr', 'error', 'usage'], defaults=(None,))
+
+# Seconds from the start of the process to its exit, CPU seconds of the tool and its helpers and
+# their peak memory (MB); the last three are None without the launcher
+CommandUsage = namedtuple('CommandUsage', ['wall_seconds', 'user_seconds', 'system_seconds', 'peak_rss_mb'])
+
+_current_scope = contextvars.ContextVar('command_cancel_scope', default=None)
+
+
+def cancelled():
+    """Whether the cancel scope of the caller (or one around it) has been cancelled."""
+    scope = _current_scope.get()
+    return scope is not None and scope.cancelled
+
+
+def _tool_name(command):
+    return os.path.basename(command[0]) if command else ''
+
+
+class CancelScope:
+    """
+    Commands started while the scope is entered (also from nested scopes) are killed when it is
+    cancelled; later commands in the scope fail immediately.
+    """
+
+    def __init__(self):
+        self.cancelled = False
+        self._members = set()
+        self._lock = threading.Lock()
+        self._parent = None
+        self._token = None
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            members = list(self._members)
+        for member in members:
+            member.cancel()
+
+    def _add(self, member):
+        with self._lock:
+            self._members.add(member)
+            cancelled = self.cancelled
+        if cancelled:
+            member.cancel()
+
+    def _discard(self, member):
+        with self._lock:
+            self._members.discard(member)
+
+    def __enter__(self):
+        self._parent = _current_scope.get()
+        if self._parent is not None:
+            self._parent._add(self)
+        self._token = _current_scope.set(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        _current_scope.reset(self._token)
+        if self._parent is not None:
+            self._parent._discard(self)
+        return False
+
+
+class _Handle:
+    """Cancels one command submitted to the engine loop, whether it has started yet or not."""
+
+    def __init__(self, loop):
+        self._loop = loop
+        self.task = None
+        self.cancel_requested = False
+
+    def cancel(self):
+        self._loop.call_soon_threadsafe(self._cancel)
+
+    def _cancel(self):
+        self.cancel_requested = True
+        if self.task is not None:
+            self.task.cancel()
+
+
+def _signal_group(process, sig):
+    try:
+        if hasattr(os, 'killpg'):
+            os.killpg(process.pid, sig)
+        else:
+            process.send_signal(sig)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+async def _terminate(process):
+    """SIGTERM the process group of process, SIGKILL it if it does not exit in time."""
+    _signal_group(process, signal.SIGTERM)
+    try:
+        await asyncio.wait_for(process.wait(), KILL_GRACE_SECONDS)
+    except asyncio.TimeoutError:
+        _signal_group(process, getattr(signal, 'SIGKILL', signal.SIGTERM))
+        await process.wait()
+
+
+def _collect(text, label, lines, reports):
+    if reports is not None and launcher.MARKER in text:
+        text, report = text.split(launcher.MARKER, 1)
+        reports.append(report.strip())
+        if not text:
+            return
+    lines.append(text)
+    logging.debug(f"{label}: {text}")
+
+
+async def _stream(reader, label, lines, reports=None):
+    """Log every line of a pipe as it arrives and collect them (launcher reports separately)."""
+    pending = b''
+    while True:
+        chunk = await reader.read(READ_CHUNK)
+        if not chunk:
+            break
+        pending += chunk
+        *complete, pending = pending.split(b'\n')
+        for line in complete:
+            _collect(line.decode('utf-8', errors='ignore').rstrip('\r'), label, lines, reports)
+    if pending:
+        _collect(pending.decode('utf-8', errors='ignore'), label, lines, reports)
+
+
+def _launch_command(command):
+    """The command wrapped in the launcher (limits and peak memory), where it is available."""
+    if launcher is None:
+        return command
+    wrapped = [sys.executable, '-S', launcher.__file__]
+    limit_mb = resources.budget().process_limit_mb
+    if limit_mb:
+        wrapped += ['--address-space-mb', str(limit_mb)]
+    return wrapped + ['--'] + list(command)
+
+
+class CommandEngine:
+    """Runs external commands on an asyncio loop in a background thread."""
+
+    def __init__(self, tool_limits=None, timeout=None):
+        self.tool_limits = dict(tool_limits or {})
+        self.timeout = timeout
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+        # Semaphores belong to one loop: run_async may also be awaited on other loops
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    def _semaphore(self, tool):
+        limit = self.tool_limits.get(tool)
+        if not limit:
+            return None
+        semaphores = self._semaphores.setdefault(asyncio.get_running_loop(), {})
+        if tool not in semaphores:
+            semaphores[tool] = asyncio.Semaphore(limit)
+        return semaphores[tool]
+
+    async def _take_budget(self, command):
+        """Wait for the command's share of the CPU/memory budget without blocking the loop."""
+        budget = resources.budget()
+        cpus, memory_mb = resources.command_demand(command)
+        waiter = asyncio.get_running_loop().run_in_executor(None, budget.take, cpus, memory_mb)
+        try:
+            await asyncio.shield(waiter)
+        except asyncio.CancelledError:
+            # The waiting thread still gets the slot eventually: hand it straight back
+            waiter.add_done_callback(lambda f: f.exception() is None and budget.release(cpus, memory_mb))
+            raise
+        return budget, cpus, memory_mb
+
+    async def run_async(self, command, cwd=None, env=None, timeout=None):
+        """
+        Run a command and return its CommandResult. timeout (seconds) defaults to the engine
+        timeout. Cancelling the awaiting task kills the command's process group.
+        """
+        semaphore = self._semaphore(_tool_name(command))
+        if semaphore is None:
+            return await self._run_in_budget(command, cwd, env, timeout)
+        async with semaphore:
+            return await self._run_in_budget(command, cwd, env, timeout)
+
+    async def _run_in_budget(self, command, cwd, env, timeout):
+        budget, cpus, memory_mb = await self._take_budget(command)
+        try:
+            return await self._execute(command, cwd, env, self.timeout if timeout is None else timeout)
+        finally:
+            budget.release(cpus, memory_mb)
+
+    async def _execute(self, command, cwd, env, timeout):
+        started = time.monotonic()
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *[str(part) for part in _launch_command(command)],
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                stdin=asyncio.subprocess.DEVNULL,
+                cwd=cwd,
+                env=env,
+                start_new_session=True,  # own process group, see _terminate
+            )
+        except FileNotFoundError:
+            return CommandResult(None, '', '', NOT_FOUND)
+
+        tool = _tool_name(command)
+        stdout, stderr, reports = [], [], []
+        communicate = asyncio.gather(
+            _stream(process.stdout, f"{tool} output", stdout),
+            # Without the launcher there are no reports, and stderr is the tool's own
+            _stream(process.stderr, f"{tool} stderr", stderr, reports if launcher is not None else None),
+            process.wait(),
+        )
+        error = None
+        try:
+            await asyncio.wait_for(communicate, timeout)
+        except asyncio.TimeoutError:
+            error = TIMEOUT
+            await _terminate(process)
+        except asyncio.CancelledError:
+            await asyncio.shield(_terminate(process))
+            raise
+        wall_seconds = time.monotonic() - started
+
+        user_seconds = system_seconds = peak_mb = None
+        for report in reports:
+            if report == 'not-found':
+                error = NOT_FOUND
+            elif report.startswith('peak-rss-kb '):
+                # peak-rss-kb N [cpu-seconds USER SYSTEM]
+                fields = report.split()
+                peak_mb = int(fields[1]) / 1024
+                resources.record_peak(command, peak_mb)
+                if fields[2:3] == ['cpu-seconds']:
+                    user_seconds, system_seconds = float(fields[3]), float(fields[4])
+        if reports and stderr and not stderr[-1]:
+            stderr.pop()  # the line break the launcher puts before its report
+        returncode = None if error else process.returncode
+        usage = None if error == NOT_FOUND else CommandUsage(wall_seconds, user_seconds, system_seconds, peak_mb)
+        return CommandResult(returncode, '\n'.join(stdout), '\n'.join(stderr), error, usage)
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=loop.run_forever, name='command-engine', daemon=True)
+                self._thread.start()
+                self._loop = loop
+            return self._loop
+
+    def run(self, command, cwd=None, env=None, timeout=None):
+        """
+        Run a command on the engine loop and wait for its CommandResult (callable from any
+        thread). The command runs in the caller's logging context and cancel scope.
+        """
+        scope = _current_scope.get()
+        if scope is not None and scope.cancelled:
+            return CommandResult(None, '', '', CANCELLED)
+        loop = self._ensure_loop()
+        done = concurrent.futures.Future()
+        handle = _Handle(loop)
+        context = contextvars.copy_context()
+
+        def finished(task):
+            if task.cancelled():
+                done.set_result(CommandResult(None, '', '', CANCELLED))
+            elif task.exception() is not None:
+                done.set_exception(task.exception())
+            else:
+                done.set_result(task.result())
+
+        def start():
+            if handle.cancel_requested:
+                done.set_result(CommandResult(None, '', '', CANCELLED))
+                return
+            handle.task = loop.create_task(self.run_async(command, cwd, env, timeout), context=context)
+            handle.task.add_done_callback(finished)
+
+        if scope is not None:
+            scope._add(handle)
+        try:
+            loop.call_soon_threadsafe(start)
+            return done.result()
+        finally:
+            if scope is not None:
+                scope._discard(handle)
+
+    def shutdown(self):
+        """Kill all running commands and stop the loop thread."""
+        with self._lock:
+            loop, self._loop = self._loop, None
+        if loop is None:
+            return
+
+        async def cancel_all():
+            tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        try:
+            asyncio.run_coroutine_threadsafe(cancel_all(), loop).result(KILL_GRACE_SECONDS * 2)
+        except (concurrent.futures.TimeoutError, RuntimeError):
+            pass
+        loop.call_soon_threadsafe(loop.stop)
+        self._thread.join(KILL_GRACE_SECONDS)
+
+
+_engine = CommandEngine()
+atexit.register(lambda: _engine.shutdown())
+
+
+def configure(tool_limits=None, timeout=None):
+    """Set the per-tool process limits ({tool: n}) and the default command timeout in seconds."""
+    _engine.tool_limits = dict(tool_limits or {})
+    _engine.timeout = timeout
+    if _engine.tool_limits:
+        logging.info("Per-tool process limits: " + ", ".join(f"{tool}={n}" for tool, n in _engine.tool_limits.items()))
+    if timeout:
+        logging.info(f"External commands time out after {timeout}s")
+    return _engine
+
+
+def engine():
+    """The process-wide command engine."""
+    return _engine
+
+
+def run(command, cwd=None, env=None, timeout=None):
+    """Run a command on the process-wide engine and wait for its CommandResult."""
+    return _engine.run(command, cwd, env, timeout)
+
+
+async def run_async(command, cwd=None, env=None, timeout=None):
+    """Run a command from a coroutine and return its CommandResult."""
+    return await _engine.run_async(command, cwd, env, timeout)
@@ -0,0 +1,310 @@
+# compressor/dedup.py
+
+"""
+Blank and near-duplicate page detection.
+
+Scanned submissions carry blank separator sheets and pages that were scanned twice (the same
+certificate in two places). Both are found on one low-resolution grayscale render (ANALYSIS_DPI):
+- blank:     hardly any ink inside the page margins (scanner borders and edge shadows are
+             ignored). Blank pages get an empty hOCR instead of OCR and are rendered bitonal, so
+             recode_pdf encodes next to nothing for them; --drop-blank-pages removes them.
+- duplicate: the page looks like an earlier page. The 16x16 average hash of every page goes into
+             an index of hash bands (two hashes within HASH_DISTANCE bits share at least one
+             band), and each candidate is confirmed by comparing the quantized pixels of the two
+             low-resolution renders. A duplicate reuses the hOCR of its original instead of
+             being OCRed. At ANALYSIS_DPI a signature, date or stamp that differs between two
+             scans can go unnoticed, so a duplicate keeps its own page image unless its full
+             render is byte-identical to that of the original; only then is it built from the
+             original's image, and with pikepdf installed both pages share the same image
+             objects in the output PDF.
+
+As in compressor.colormode there is no per-pixel Python code: ink is counted with
+bytes.translate/bytes.count, and the difference of two renders comes from their joint histogram.
+"""
+
+import filecmp
+import hashlib
+import logging
+import os
+import tempfile
+import zlib
+from collections import defaultdict, namedtuple
+from pathlib import Path
+from . import colormode, hocr, trace, utils
+
+try:
+    import pikepdf
+except ImportError:  # optional: duplicate pages then keep their own (identical) image objects
+    pikepdf = None
+
+ANALYSIS_DPI = colormode.CLASSIFY_DPI
+# Pixels darker than this are ink
+INK_LEVEL = 160
+# Share of each side left out of the blank test (scanner borders, punch holes, edge shadows)
+MARGIN = 0.05
+# A page is blank when at most this share of its inner pixels is ink (dust and speckles)
+BLANK_INK_SHARE = 0.0003
+# Average hash: HASH_GRID x HASH_GRID cells, indexed in HASH_BANDS bands of equal width
+HASH_GRID = 16
+HASH_BANDS = 16
+# Hashes of duplicates differ in at most this many bits (less than HASH_BANDS: one band is equal)
+HASH_DISTANCE = 12
+# Confirmation on the thumbnails: pixels further apart than this many of 16 quantized levels
+# differ, and duplicates differ in at most DUPLICATE_PIXEL_SHARE of their pixels
+DUPLICATE_LEVELS = 2
+DUPLICATE_PIXEL_SHARE = 0.002
+
+_INK = bytes(1 if value < INK_LEVEL else 0 for value in range(256))
+
+# Low-resolution grayscale render of a page; pixels are zlib-compressed quantized (0-15) samples
+Thumbnail = namedtuple('Thumbnail', ['width', 'height', 'ink', 'hash', 'pixels'])
+
+
+def ink_share(width, height, gray, margin=MARGIN):
+    """Share of the pixels inside the page margins that are ink."""
+    left, top = int(width * margin), int(height * margin)
+    inner = b"".join(gray[row * width + left:(row + 1) * width - left] for row in range(top, height - top))
+    if not inner:
+        return 0.0
+    return inner.translate(_INK).count(1) / len(inner)
+
+
+def average_hash(width, height, gray, grid=HASH_GRID):
+    """
+    Average hash of a grayscale image: one bit per cell of a grid x grid raster, set when the
+    cell is lighter than the mean of all cells.
+    """
+    sums = [0] * (grid * grid)
+    counts = [0] * (grid * grid)
+    edges = [width * column // grid for column in range(grid + 1)]
+    for row in range(height):
+        line = gray[row * width:(row + 1) * width]
+        base = row * grid // height * grid
+        for column in range(grid):
+            cell = line[edges[column]:edges[column + 1]]
+            sums[base + column] += sum(cell)
+            counts[base + column] += len(cell)
+    means = [total / count if count else 255.0 for total, count in zip(sums, counts)]
+    mean = sum(means) / len(means)
+    value = 0
+    for bit, cell_mean in enumerate(means):
+        if cell_mean > mean:
+            value |= 1 << bit
+    return value
+
+
+def hamming(first, second):
+    return bin(first ^ second).count('1')
+
+
+def thumbnail(width, height, gray):
+    """Measure a low-resolution grayscale page render (see Thumbnail)."""
+    return Thumbnail(width, height, ink_share(width, height, gray), average_hash(width, height, gray),
+                     zlib.compress(colormode.quantize(gray), 1))
+
+
+def differing_share(first, second):
+    """Share of pixels of two thumbnails of equal size that are more than DUPLICATE_LEVELS apart."""
+    a, b = zlib.decompress(first.pixels), zlib.decompress(second.pixels)
+    if not a:
+        return 0.0
+    histogram = colormode.pair_histogram(a, b)
+    differing = sum(count for key, count in histogram.items() if abs((key >> 4) - (key & 15)) > DUPLICATE_LEVELS)
+    return differing / len(a)
+
+
+def is_duplicate(first, second):
+    """Whether two page thumbnails show the same page."""
+    return ((first.width, first.height) == (second.width, second.height)
+            and hamming(first.hash, second.hash) <= HASH_DISTANCE
+            and differing_share(first, second) <= DUPLICATE_PIXEL_SHARE)
+
+
+class HashIndex:
+    """
+    Finds hashes within HASH_DISTANCE bits of a query. Every hash is filed under each of its
+    bands; by the pigeonhole principle, hashes that differ in fewer bits than there are bands
+    agree on at least one band, so the candidates are the hashes sharing a band with the query.
+    """
+
+    def __init__(self, bits=HASH_GRID * HASH_GRID, bands=HASH_BANDS):
+        self.band_bits = bits // bands
+        self._buckets = [defaultdict(list) for _ in range(bands)]
+
+    def _bands(self, value):
+        mask = (1 << self.band_bits) - 1
+        return [(value >> (band * self.band_bits)) & mask for band in range(len(self._buckets))]
+
+    def add(self, key, value):
+        for buckets, band in zip(self._buckets, self._bands(value)):
+            buckets[band].append(key)
+
+    def candidates(self, value):
+        """Keys of the indexed hashes sharing at least one band with value, in insertion order."""
+        keys = set()
+        for buckets, band in zip(self._buckets, self._bands(value)):
+            keys.update(buckets.get(band, ()))
+        return sorted(keys)
+
+
+def identical_files(first, second):
+    """Whether two files have the same content (False if either is missing)."""
+    if first is None or second is None:
+        return False
+    try:
+        return os.path.samefile(first, second) or filecmp.cmp(first, second, shallow=False)
+    except OSError:
+        return False
+
+
+def write_blank_hocr(output_path, width, height, page_number=1):
+    """Write a one-page hOCR file without any text for a width x height pixel page."""
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write(hocr.HOCR_HEADER
+                + f"<div class='ocr_page' id='page_{page_number}' title='bbox 0 0 {width} {height}; ppageno {page_number - 1}'>\n</div>\n"
+                + hocr.HOCR_FOOTER)
+    return output_path
+
+
+class PageAnalysis:
+    """Blank pages and duplicates of a document (pages are 1-based)."""
+
+    def __init__(self, thumbnails):
+        self.sizes = [(thumb.width, thumb.height) for thumb in thumbnails]
+        self.blank = {page for page, thumb in enumerate(thumbnails, 1) if thumb.ink <= BLANK_INK_SHARE}
+        self.duplicates = {}  # page -> earlier page it duplicates (never a duplicate itself)
+        index = HashIndex()
+        for page, thumb in enumerate(thumbnails, 1):
+            if page in self.blank:
+                continue
+            for candidate in index.candidates(thumb.hash):
+                if is_duplicate(thumbnails[candidate - 1], thumb):
+                    self.duplicates[page] = candidate
+                    break
+            else:
+                index.add(page, thumb.hash)
+
+    @property
+    def page_count(self):
+        return len(self.sizes)
+
+    def skips_ocr(self, page):
+        """Whether a page needs no tesseract run of its own."""
+        return page in self.blank or page in self.duplicates
+
+    def write_hocr(self, page, output_path, dpi):
+        """Write the empty hOCR of a blank page at dpi. Returns output_path, or None for other pages."""
+        if page not in self.blank:
+            return None
+        width, height = self.sizes[page - 1]
+        scale = dpi / ANALYSIS_DPI
+        return write_blank_hocr(output_path, round(width * scale), round(height * scale), page)
+
+    def source_page(self, page, image_files):
+        """
+        The page whose image builds `page`: its original, if the page is a duplicate whose render
+        is byte-identical to the original's (image_files: per-page render paths), else the page
+        itself. Near-duplicates only share the hOCR.
+        """
+        original = self.duplicates.get(page)
+        if original is not None and identical_files(image_files[page - 1], image_files[original - 1]):
+            return original
+        return page
+
+    def color_modes(self, color_modes):
+        """Colour mode per page (see compressor.colormode) with the blank pages rendered bitonal."""
+        modes = list(color_modes or [colormode.COLOR] * self.page_count)
+        for page in self.blank:
+            modes[page - 1] = colormode.BITONAL
+        return modes
+
+
+@trace.traced('page analysis')
+def analyze_pdf(pdf_path, page_count, dpi=ANALYSIS_DPI):
+    """Find the blank and duplicate pages of a PDF. Returns a PageAnalysis, or None if the render failed."""
+    work_dir = Path(tempfile.mkdtemp(prefix="pdf_compressor_dedup_"))
+    try:
+        if not utils.run_command(["pdftoppm", "-gray", "-r", str(dpi), str(pdf_path), str(work_dir / "page")],
+                                 stage='analysis', outputs=[work_dir / "page-*"]):
+            logging.warning("Blank/duplicate page detection failed, process every page")
+            return None
+        width = len(str(page_count))
+        thumbnails = []
+        for page in range(1, page_count + 1):
+            image = work_dir / f"page-{page:0{width}d}.pgm"
+            try:
+                thumbnails.append(thumbnail(*colormode.read_pgm(image)))
+            except (OSError, ValueError) as e:
+                logging.warning(f"Blank/duplicate page detection failed on page {page}, process every page: {e}")
+                return None
+            finally:
+                try:
+                    os.remove(image)
+                except OSError:
+                    pass
+    finally:
+        utils.cleanup_directory(str(work_dir))
+    if not thumbnails:
+        return None
+    analysis = PageAnalysis(thumbnails)
+    logging.info(f"Page analysis: {len(analysis.blank)} blank pages, {len(analysis.duplicates)} duplicate pages"
+                 + "".join(f"; page {page} duplicates page {original}" for page, original in sorted(analysis.duplicates.items())))
+    return analysis
+
+
+def shares_images(image_files):
+    """Whether some page images of a stack are the same file (duplicates staged from their original)."""
+    identities = set()
+    try:
+        for image in image_files:
+            stat = os.stat(image)
+            identities.add((stat.st_dev, stat.st_ino))
+    except OSError:
+        return False
+    return len(identities) < len(image_files)
+
+
+def _object_key(value):
+    """Content key of a PDF object: streams by their data and dictionary, with indirect objects resolved."""
+    if isinstance(value, pikepdf.Stream):
+        return ('stream', hashlib.sha256(value.read_raw_bytes()).hexdigest(), _object_key(value.stream_dict))
+    if isinstance(value, pikepdf.Dictionary):
+        return ('dict',) + tuple(sorted((str(key), _object_key(item)) for key, item in value.items() if key != '/Length'))
+    if isinstance(value, pikepdf.Array):
+        return ('array',) + tuple(_object_key(item) for item in value)
+    return repr(value)
+
+
+def share_identical_images(pdf_path):
+    """
+    Point the pages of a PDF that use byte-identical images at one copy of them (pikepdf).
+    Returns the number of image objects dropped (0 without pikepdf or on failure).
+    """
+    if pikepdf is None:
+        logging.debug("pikepdf is not installed, duplicate pages keep their own image objects")
+        return 0
+    try:
+        with pikepdf.open(pdf_path, allow_overwriting_input=True) as pdf:
+            first = {}
+            shared = 0
+            for page in pdf.pages:
+                resources = page.obj.get('/Resources')
+                xobjects = resources.get('/XObject') if resources is not None else None
+                if xobjects is None:
+                    continue
+                for name in list(xobjects.keys()):
+                    image = xobjects[name]
+                    if image.get('/Subtype') != pikepdf.Name.Image:
+                        continue
+                    original = first.setdefault(_object_key(image), image)
+                    if original.objgen != image.objgen:
+                        xobjects[name] = original
+                        shared += 1
+            if shared:
+                pdf.save(pdf_path)  # unreferenced copies are not written
+    except (pikepdf.PdfError, OSError) as e:
+        logging.warning(f"Unable to share the images of duplicate pages in {Path(pdf_path).name}: {e}")
+        return 0
+    if shared:
+        logging.info(f"Duplicate pages share {shared} image objects in {Path(pdf_path).name}")
+    return shared
@@ -0,0 +1,203 @@
+# compressor/hocr.py
+
+"""
+hOCR helpers: merging per-page files, splitting page ranges and rescaling coordinates.
+
+The merger streams each tesseract output file through a small tag tokenizer and copies the
+`ocr_page` subtrees straight into the combined file, so memory use is bounded by the read
+chunk size and every character is looked at a constant number of times.
+"""
+
+import re
+
+HOCR_HEADER = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.0 Transitional//EN"\n'
+    '"http://www.w3.org/TR/xhtml1/DTD/xhtml1-transitional.dtd">\n'
+    '<html xmlns="http://www.w3.org/1999/xhtml" xml:lang="en" lang="en">\n'
+    '<head>\n<title></title>\n'
+    '<meta http-equiv="Content-Type" content="text/html;charset=utf-8" />\n'
+    '<meta name="ocr-system" content="tesseract" />\n'
+    '</head>\n<body>\n'
+)
+HOCR_FOOTER = '</body>\n</html>\n'
+
+CHUNK_SIZE = 1024 * 1024
+# An unfinished tag longer than this means the file is not valid hOCR
+MAX_PENDING_TAG = 64 * 1024
+
+# Comments, or start/end tags whose attribute values may contain '>' inside quotes
+_TAG_RE = re.compile(
+    r'<!--.*?-->'
+    r'|<(/?)([A-Za-z][^\s/>]*)((?:[^>"\']|"[^"]*"|\'[^\']*\')*)>',
+    re.S
+)
+_OCR_PAGE_RE = re.compile(r'''\bclass\s*=\s*["']ocr_page["']''')
+_VOID_ELEMENTS = {'br', 'hr', 'img', 'meta', 'link', 'input'}
+
+
+class HocrError(Exception):
+    """Raised when an hOCR file cannot be merged (missing page, broken nesting)."""
+
+
+def copy_pages(infile, outfile, name="hOCR", chunk_size=CHUNK_SIZE, page_done=None):
+    """
+    Copy every `ocr_page` subtree of the text stream `infile` to `outfile`.
+    page_done(), if given, is called after each complete page (it may switch `outfile`'s target).
+    Returns the number of pages copied; raises HocrError on malformed input.
+    """
+    pages = 0
+    stack = []   # open tags inside the current ocr_page
+    buffer = ""
+
+    while True:
+        chunk = infile.read(chunk_size)
+        buffer += chunk
+        pos = 0
+        emit_from = 0 if stack else None
+
+        for match in _TAG_RE.finditer(buffer):
+            closing, tag, attrs = match.group(1), match.group(2), match.group(3)
+            pos = match.end()
+            if tag is None:
+                continue  # comment
+            tag = tag.lower()
+
+            if not stack:
+                if tag == 'div' and not closing and _OCR_PAGE_RE.search(attrs):
+                    stack.append('div')
+                    emit_from = match.start()
+                continue
+
+            if closing:
+                expected = stack.pop()
+                if expected != tag:
+                    raise HocrError(f"{name}: expected </{expected}> but found </{tag}>")
+                if not stack:
+                    outfile.write(buffer[emit_from:pos])
+                    outfile.write('\n')
+                    emit_from = None
+                    pages += 1
+                    if page_done:
+                        page_done()
+            elif tag not in _VOID_ELEMENTS and not attrs.rstrip().endswith('/'):
+                stack.append(tag)
+
+        # Keep a possibly incomplete tag at the end of the buffer for the next chunk
+        pending = buffer.find('<', pos)
+        keep_from = pending if pending != -1 and chunk else len(buffer)
+        if stack:
+            outfile.write(buffer[emit_from if emit_from is not None else 0:keep_from])
+        buffer = buffer[keep_from:]
+
+        if len(buffer) > MAX_PENDING_TAG:
+            raise HocrError(f"{name}: unterminated tag")
+        if not chunk:
+            break
+
+    if stack:
+        raise HocrError(f"{name}: ocr_page is not closed (open tags: {', '.join(stack)})")
+    if pages == 0:
+        raise HocrError(f"{name}: no ocr_page found")
+    return pages
+
+
+def merge_hocr_files(hocr_files, output_path, chunk_size=CHUNK_SIZE):
+    """
+    Merge per-page hOCR files into a single hOCR document, keeping the given order.
+    Returns the number of pages written.
+    """
+    pages = 0
+    with open(output_path, 'w', encoding='utf-8') as outfile:
+        outfile.write(HOCR_HEADER)
+        for hocr_file in hocr_files:
+            with open(hocr_file, 'r', encoding='utf-8') as infile:
+                pages += copy_pages(infile, outfile, name=str(hocr_file), chunk_size=chunk_size)
+        outfile.write(HOCR_FOOTER)
+    return pages
+
+
+class _PageRouter:
+    """File-like object writing the pages of an hOCR stream to consecutive output files."""
+
+    def __init__(self, page_counts, output_paths):
+        self._targets = list(zip(page_counts, output_paths))
+        self._file = None
+        self._remaining = 0
+        self._next()
+
+    def _next(self):
+        if self._file:
+            self._file.write(HOCR_FOOTER)
+            self._file.close()
+            self._file = None
+        if self._targets:
+            self._remaining, path = self._targets.pop(0)
+            self._file = open(path, 'w', encoding='utf-8')
+            self._file.write(HOCR_HEADER)
+
+    def write(self, text):
+        if self._file is None:
+            raise HocrError("hOCR file has more pages than requested")
+        self._file.write(text)
+
+    def page_done(self):
+        self._remaining -= 1
+        if self._remaining == 0:
+            self._next()
+
+    def close(self):
+        if self._file or self._targets:
+            if self._file:
+                self._file.close()
+            raise HocrError("hOCR file has fewer pages than requested")
+
+
+def split_hocr_file(input_path, page_counts, output_paths, chunk_size=CHUNK_SIZE):
+    """
+    Split a multi-page hOCR file into consecutive files holding page_counts[i] pages each.
+    Raises HocrError if the page counts do not add up to the pages of the file.
+    """
+    router = _PageRouter(page_counts, output_paths)
+    with open(input_path, 'r', encoding='utf-8') as infile:
+        copy_pages(infile, router, name=str(input_path), chunk_size=chunk_size, page_done=router.page_done)
+    router.close()
+
+
+# Properties of the hOCR `title` attribute that are expressed in image pixels
+_TITLE_RE = re.compile(r'''(\btitle\s*=\s*)(["'])(.*?)\2''')
+_PIXEL_PROPERTY_RE = re.compile(r'\b(bbox|x_size|x_descenders|x_ascenders|scan_res)((?:\s+-?\d+(?:\.\d+)?)+)')
+_BASELINE_RE = re.compile(r'\bbaseline\s+(-?\d+(?:\.\d+)?)\s+(-?\d+(?:\.\d+)?)')
+
+
+def _scale_number(value, factor, integer):
+    scaled = float(value) * factor
+    return str(int(round(scaled))) if integer else f"{scaled:.2f}".rstrip('0').rstrip('.')
+
+
+def rescale_title(title, factor):
+    """Scale every pixel measurement of an hOCR title attribute value by `factor`."""
+    def scale_property(match):
+        integer = match.group(1) in ('bbox', 'scan_res')
+        numbers = [_scale_number(n, factor, integer) for n in match.group(2).split()]
+        return f"{match.group(1)} {' '.join(numbers)}"
+
+    def scale_baseline(match):
+        # The slope is resolution independent, only the offset is in pixels
+        return f"baseline {match.group(1)} {_scale_number(match.group(2), factor, True)}"
+
+    title = _PIXEL_PROPERTY_RE.sub(scale_property, title)
+    return _BASELINE_RE.sub(scale_baseline, title)
+
+
+def rescale_hocr_file(input_path, output_path, factor):
+    """
+    Write a copy of an hOCR file whose coordinates are scaled by `factor`
+    (e.g. 0.5 to reuse 300 dpi OCR results on a 150 dpi render).
+    """
+    def scale_attribute(match):
+        return f"{match.group(1)}{match.group(2)}{rescale_title(match.group(3), factor)}{match.group(2)}"
+
+    with open(input_path, 'r', encoding='utf-8') as infile, open(output_path, 'w', encoding='utf-8') as outfile:
+        for line in infile:
+            outfile.write(_TITLE_RE.sub(scale_attribute, line))
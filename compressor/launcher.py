@@ -0,0 +1,60 @@
+# compressor/launcher.py
+
+"""
+Run one external command under resource limits and report its peak memory and CPU time.
+
+    python launcher.py [--address-space-mb N] -- command [args...]
+
+The command engine (compressor.commands) starts every external tool through this script. It
+applies the address space limit to the tool, waits for it and writes the peak resident set size
+and the user/system CPU seconds of the tool and its helper processes (getrusage of the waited
+children) as the last stderr line.
+The exit status is the tool's. The script only uses the standard library and is started without
+importing the compressor package, to keep the start-up cost small.
+"""
+
+import resource
+import subprocess
+import sys
+
+MARKER = "@@launcher "
+NOT_FOUND_STATUS = 127
+
+
+def _report(text):
+    sys.stderr.write(f"\n{MARKER}{text}\n")
+    sys.stderr.flush()
+
+
+def _usage():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    # ru_maxrss is in bytes on macOS and in KB elsewhere
+    peak = usage.ru_maxrss // 1024 if sys.platform == 'darwin' else usage.ru_maxrss
+    return f"peak-rss-kb {peak} cpu-seconds {usage.ru_utime:.3f} {usage.ru_stime:.3f}"
+
+
+def main(argv):
+    address_space_mb = None
+    if argv[:1] == ['--address-space-mb']:
+        address_space_mb = float(argv[1])
+        argv = argv[2:]
+    if argv[:1] == ['--']:
+        argv = argv[1:]
+
+    def apply_limits():
+        limit = int(address_space_mb * 1024 * 1024)
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+    try:
+        child = subprocess.Popen(argv, preexec_fn=apply_limits if address_space_mb else None)
+    except FileNotFoundError:
+        _report("not-found")
+        return NOT_FOUND_STATUS
+    returncode = child.wait()
+    _report(_usage())
+    # Same convention as the shell for a tool killed by a signal
+    return 128 - returncode if returncode < 0 else returncode
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -2,123 +2,405 @@
 
 import logging
 import glob
-import subprocess
+import os
+import tempfile
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from . import utils
+from . import colormode, commands, dedup, hocr, pyramid, scratch, trace, utils
 
-def deconstruct_pdf_to_images(pdf_path, temp_dir, dpi):
+OCR_LANGUAGE = "eng" # English
+
+# Intermediate page image formats: name -> (pdftoppm options, file extension).
+# All are lossless; the compressed ones trade some CPU for much less scratch I/O.
+IMAGE_FORMATS = {
+    'tiff': (["-tiff"], ".tif"),
+    'tiff-lzw': (["-tiff", "-tiffcompression", "lzw"], ".tif"),
+    'tiff-deflate': (["-tiff", "-tiffcompression", "deflate"], ".tif"),
+    'tiff-packbits': (["-tiff", "-tiffcompression", "packbits"], ".tif"),
+    'png': (["-png"], ".png"),
+    'pnm': ([], ".ppm"),
+}
+DEFAULT_IMAGE_FORMAT = 'tiff'
+
+def image_suffix(image_format=DEFAULT_IMAGE_FORMAT, color_mode=colormode.COLOR):
+    """File extension of page images in a format and colour mode (PNM files change it with the mode)."""
+    if image_format == 'pnm':
+        return colormode.PNM_SUFFIXES[color_mode]
+    return IMAGE_FORMATS[image_format][1]
+
+def render_pages(pdf_path, output_prefix, dpi, first_page=None, last_page=None, image_format=DEFAULT_IMAGE_FORMAT,
+                 color_mode=colormode.COLOR):
     """
-    Convert PDF to TIFF image sequence using pdftoppm.
+    Render pages (all, or first_page..last_page) to image files named <output_prefix>-N.<ext>,
+    in colour, grayscale or bitonal (color_mode, see compressor.colormode).
+    """
+    command = ["pdftoppm"] + IMAGE_FORMATS[image_format][0] + colormode.PDFTOPPM_OPTIONS[color_mode] + ["-r", str(dpi)]
+    if first_page is not None:
+        command += ["-f", str(first_page), "-l", str(last_page)]
+    command += [str(pdf_path), str(output_prefix)]
+    return utils.run_command(command, stage='render', outputs=[f"{output_prefix}-*"])
+
+def _contiguous_ranges(page_numbers):
+    """Group sorted page numbers into (first, last) ranges."""
+    ranges = []
+    for page in page_numbers:
+        if ranges and ranges[-1][1] == page - 1:
+            ranges[-1][1] = page
+        else:
+            ranges.append([page, page])
+    return ranges
+
+def page_image_path(temp_dir, page, page_count, image_format=DEFAULT_IMAGE_FORMAT, color_mode=colormode.COLOR):
+    """Path of the image pdftoppm writes for a page (numbers are padded to the width of the page count)."""
+    return temp_dir / f"page-{page:0{len(str(page_count))}d}{image_suffix(image_format, color_mode)}"
+
+def _render_with_cache(pdf_path, temp_dir, dpi, cache, digests, image_format=DEFAULT_IMAGE_FORMAT, pages=None,
+                       color_mode=colormode.COLOR):
+    """Restore cached page images and render only the missing pages (all pages, or those in `pages`)."""
+    pages = list(pages or range(1, len(digests) + 1))
+    missing = []
+    for page in pages:
+        image_path = page_image_path(temp_dir, page, len(digests), image_format, color_mode)
+        if not cache.get(cache.image_key(digests[page - 1], dpi, image_format, color_mode), image_path):
+            missing.append(page)
+
+    logging.info(f"Page cache: {len(pages) - len(missing)} page images reused, {len(missing)} pages to render")
+    for first_page, last_page in _contiguous_ranges(missing):
+        if not render_pages(pdf_path, temp_dir / "page", dpi, first_page, last_page, image_format, color_mode):
+            return False
+
+    for page in pages:
+        digest = digests[page - 1]
+        image_path = page_image_path(temp_dir, page, len(digests), image_format, color_mode)
+        if page in missing and image_path.exists():
+            cache.put(cache.image_key(digest, dpi, image_format, color_mode), image_path)
+        cache.remember_image(image_path, digest, dpi)
+    return True
+
+@trace.traced('render')
+def render_page_range(pdf_path, temp_dir, dpi, first_page, last_page, page_count, cache=None, digests=None,
+                      image_format=DEFAULT_IMAGE_FORMAT, color_modes=None):
+    """
+    Render pages first_page..last_page of a page_count page PDF into temp_dir, restoring pages
+    found in the page cache (digests: cache.page_digests of the PDF). color_modes (one per page
+    of the PDF, see compressor.colormode) renders each page in its mode; default is colour.
+    Returns the image paths in page order, or None on failure.
+    """
+    image_files = []
+    for run_first, run_last, mode in colormode.mode_runs(color_modes, first_page, last_page):
+        if digests:
+            rendered = _render_with_cache(pdf_path, temp_dir, dpi, cache, digests, image_format, range(run_first, run_last + 1), mode)
+        else:
+            rendered = render_pages(pdf_path, temp_dir / "page", dpi, run_first, run_last, image_format, mode)
+        if not rendered:
+            return None
+        image_files += [page_image_path(temp_dir, page, page_count, image_format, mode) for page in range(run_first, run_last + 1)]
+    if not all(image.exists() for image in image_files):
+        return None
+    scratch.record('render', *image_files)
+    return image_files
+
+@trace.traced('render')
+def deconstruct_pdf_to_images(pdf_path, temp_dir, dpi, cache=None, image_format=DEFAULT_IMAGE_FORMAT, color_modes=None):
+    """
+    Convert PDF to an image sequence (see IMAGE_FORMATS) using pdftoppm.
+    Pages found in the page cache are restored instead of rendered. With color_modes (one per
+    page, see compressor.colormode), every page is rendered in its colour mode.
     Returns a list of generated image file paths.
     """
-    logging.info(f"Phase 1 [Deconstruction]: Start converting {pdf_path.name} to image (DPI: {dpi})...")
+    logging.info(f"Phase 1 [Deconstruction]: Start converting {pdf_path.name} to image (DPI: {dpi}, format: {image_format})...")
     output_prefix = temp_dir / "page"
-    command = [
-        "pdftoppm",
-        "-tiff",
-        "-r", str(dpi),
-        str(pdf_path),
-        str(output_prefix)
-    ]
-    if not utils.run_command(command):
-        logging.error("PDF deconstruction failed.")
+    digests = cache.page_digests(pdf_path) if cache else None
+    if color_modes:
+        image_files = render_page_range(pdf_path, temp_dir, dpi, 1, len(color_modes), len(color_modes),
+                                        cache=cache, digests=digests, image_format=image_format, color_modes=color_modes)
+        if image_files is None:
+            if commands.cancelled():
+                logging.info("PDF deconstruction stopped, it is no longer needed.")
+            else:
+                logging.error("PDF deconstruction failed.")
+            return None
+        logging.info(f"Successfully generated {len(image_files)} page image.")
+        return image_files
+    if digests:
+        rendered = _render_with_cache(pdf_path, temp_dir, dpi, cache, digests, image_format)
+    else:
+        rendered = render_pages(pdf_path, output_prefix, dpi, image_format=image_format)
+    if not rendered:
+        if commands.cancelled():
+            logging.info("PDF deconstruction stopped, it is no longer needed.")
+        else:
+            logging.error("PDF deconstruction failed.")
         return None
     
-    image_files = sorted(glob.glob(f"{output_prefix}-*.tif"))
+    image_files = sorted(glob.glob(f"{output_prefix}-*{IMAGE_FORMATS[image_format][1]}"))
     if not image_files:
         logging.error("No image file was generated.")
         return None
         
+    scratch.record('render', *image_files)
     logging.info(f"Successfully generated {len(image_files)} page image.")
     return [Path(f) for f in image_files]
 
-def analyze_images_to_hocr(image_files, temp_dir):
+# Default pages per tesseract process on the command line (see ocr_batch)
+DEFAULT_OCR_BATCH_PAGES = 8
+
+def default_ocr_jobs():
+    """Default number of concurrent tesseract processes (one per CPU core)."""
+    return os.cpu_count() or 1
+
+def ocr_image(img_path, temp_dir, thread_limit=None, cache=None):
+    """
+    OCR a single page image with tesseract, unless its hOCR is already in the page cache.
+    Returns the generated hOCR file path, or None on failure.
+    """
+    output_prefix = temp_dir / img_path.stem
+    hocr_path = Path(f"{output_prefix}.hocr")
+    cache_key = cache.hocr_key_for_image(img_path, OCR_LANGUAGE) if cache else None
+    if cache_key and cache.get(cache_key, hocr_path):
+        return hocr_path
+
+    command = [
+        "tesseract",
+        str(img_path),
+        str(output_prefix),
+        "-l", OCR_LANGUAGE,
+        "hocr"
+    ]
+    # Tesseract uses OpenMP internally; limit it so that a pool of processes does not oversubscribe the CPU
+    env = {"OMP_THREAD_LIMIT": str(thread_limit)} if thread_limit else None
+    if not utils.run_command(command, env=env, stage='ocr', outputs=[hocr_path]):
+        logging.error(f"OCR failed for image {img_path.name}.")
+        return None
+    if cache_key:
+        cache.put(cache_key, hocr_path)
+    scratch.record('ocr', hocr_path)
+    return hocr_path
+
+def ocr_batch(image_files, temp_dir, thread_limit=None, cache=None):
+    """
+    OCR several page images with one tesseract process: it reads the image paths from a list
+    file and writes one multi-page hOCR, so the language model is loaded once per batch instead
+    of once per page. The result is split into per-page hOCR files named like those of ocr_image
+    (for caching and splitting); pages whose hOCR is in the page cache are not OCRed.
+    Returns the hOCR file paths in page order, or None on failure.
+    """
+    hocr_files = [temp_dir / f"{Path(img_path).stem}.hocr" for img_path in image_files]
+    cache_keys = [cache.hocr_key_for_image(img_path, OCR_LANGUAGE) if cache else None for img_path in image_files]
+    missing = [index for index, key in enumerate(cache_keys) if not (key and cache.get(key, hocr_files[index]))]
+    if not missing:
+        return hocr_files
+
+    names = f"{Path(image_files[missing[0]]).name}..{Path(image_files[missing[-1]]).name}"
+    output_prefix = temp_dir / f"{Path(image_files[missing[0]]).stem}_batch{len(missing)}"
+    list_path = Path(f"{output_prefix}.txt")
+    batch_hocr = Path(f"{output_prefix}.hocr")
+    list_path.write_text("".join(f"{Path(image_files[index]).resolve()}\n" for index in missing), encoding='utf-8')
+    command = [
+        "tesseract",
+        str(list_path),
+        str(output_prefix),
+        "-l", OCR_LANGUAGE,
+        "hocr"
+    ]
+    env = {"OMP_THREAD_LIMIT": str(thread_limit)} if thread_limit else None
+    try:
+        if not utils.run_command(command, env=env, stage='ocr', outputs=[batch_hocr]):
+            logging.error(f"OCR failed for images {names}.")
+            return None
+        try:
+            hocr.split_hocr_file(batch_hocr, [1] * len(missing), [hocr_files[index] for index in missing])
+        except (IOError, hocr.HocrError) as e:
+            logging.error(f"Error splitting the hOCR of images {names}: {e}")
+            return None
+    finally:
+        for path in (list_path, batch_hocr):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    for index in missing:
+        if cache_keys[index]:
+            cache.put(cache_keys[index], hocr_files[index])
+    scratch.record('ocr', *[hocr_files[index] for index in missing])
+    return hocr_files
+
+def ocr_downscale_enabled(dpi, ocr_dpi):
+    """Whether pages rendered at dpi are OCRed on grayscale copies at ocr_dpi (see ocr_downscaled)."""
+    if not ocr_dpi or not dpi or ocr_dpi >= dpi:
+        return False
+    if not pyramid.available():
+        logging.warning(f"Pillow is not installed, OCR runs at the render resolution (DPI={dpi}) instead of DPI={ocr_dpi}")
+        return False
+    return True
+
+def ocr_downscaled(image_files, temp_dir, dpi, ocr_dpi, thread_limit=None, cache=None):
+    """
+    OCR page images rendered at dpi on grayscale copies downscaled to ocr_dpi (one tesseract
+    process for all of them), and write their hOCR scaled back to dpi, named like that of
+    ocr_image. The hOCR is cached under the rendered image and ocr_dpi, apart from that of a
+    full-resolution run (the two differ in quality).
+    Returns the hOCR file paths in page order, or None on failure.
+    """
+    hocr_files = [temp_dir / f"{Path(img_path).stem}.hocr" for img_path in image_files]
+    cache_keys = [cache.hocr_key_for_image(img_path, OCR_LANGUAGE, ocr_dpi) if cache else None for img_path in image_files]
+    missing = [index for index, key in enumerate(cache_keys) if not (key and cache.get(key, hocr_files[index]))]
+    if not missing:
+        return hocr_files
+
+    work_dir = Path(tempfile.mkdtemp(prefix=f"ocr_{ocr_dpi}_", dir=temp_dir))
+    try:
+        try:
+            copies = [pyramid.downscale_image(image_files[index], work_dir / Path(image_files[index]).name,
+                                              ocr_dpi / dpi, ocr_dpi, grayscale=True) for index in missing]
+            scratch.record('ocr', *copies)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Downscaling for OCR failed, OCR at DPI={dpi}: {e}")
+            copies = [image_files[index] for index in missing]
+            ocr_dpi = dpi
+            # A full-resolution result is cached like one of ocr_image
+            cache_keys = [cache.hocr_key_for_image(img_path, OCR_LANGUAGE) if cache else None for img_path in image_files]
+        if len(copies) == 1:
+            ocr_file = ocr_image(copies[0], work_dir, thread_limit=thread_limit)
+            ocr_files = None if ocr_file is None else [ocr_file]
+        else:
+            ocr_files = ocr_batch(copies, work_dir, thread_limit=thread_limit)
+        if ocr_files is None:
+            return None
+        for index, ocr_file in zip(missing, ocr_files):
+            hocr.rescale_hocr_file(ocr_file, hocr_files[index], dpi / ocr_dpi)
+            if cache_keys[index]:
+                cache.put(cache_keys[index], hocr_files[index])
+    finally:
+        utils.cleanup_directory(str(work_dir))
+    scratch.record('ocr', *[hocr_files[index] for index in missing])
+    return hocr_files
+
+@trace.traced('ocr')
+def ocr_images(image_files, temp_dir, jobs=None, cache=None, text_layer=None, dpi=None, page_analysis=None,
+               batch_pages=1, ocr_dpi=None):
+    """
+    OCR all page images, running up to `jobs` tesseract processes at the same time.
+    With batch_pages > 1, each process OCRs up to that many pages (see ocr_batch); batches are
+    made smaller when there are too few pages to keep `jobs` processes busy.
+    With an ocr_dpi below the render resolution dpi, tesseract reads grayscale copies at ocr_dpi
+    and the hOCR is scaled back to dpi (see ocr_downscaled).
+    With a text_layer (compressor.textlayer.TextLayer, image_files being all pages in order,
+    rendered at dpi), pages with a reliable text layer get their hOCR from it instead.
+    With a page_analysis (compressor.dedup.PageAnalysis, same conditions), blank pages get an
+    empty hOCR and duplicate pages reuse the hOCR of their original.
+    Returns the list of hOCR file paths in page order, or None if any page failed.
+    """
+    if text_layer is not None or page_analysis is not None:
+        hocr_files = [None] * len(image_files)
+        for page, img_path in enumerate(image_files, 1):
+            hocr_path = temp_dir / f"{img_path.stem}.hocr"
+            if page_analysis is not None and page_analysis.skips_ocr(page):
+                hocr_files[page - 1] = page_analysis.write_hocr(page, hocr_path, dpi)
+            elif text_layer is not None:
+                hocr_files[page - 1] = text_layer.write_hocr(page, hocr_path, dpi)
+        duplicates = page_analysis.duplicates if page_analysis is not None else {}
+        pending = [index for index, hocr_file in enumerate(hocr_files) if hocr_file is None and index + 1 not in duplicates]
+        if text_layer is not None:
+            logging.info(f"Text layer: {len(image_files) - len(pending)} pages skip OCR, {len(pending)} pages to OCR")
+        if page_analysis is not None:
+            logging.info(f"Page analysis: {len(page_analysis.blank)} blank and {len(duplicates)} duplicate pages skip OCR")
+        if pending:
+            ocr_files = ocr_images([image_files[index] for index in pending], temp_dir, jobs=jobs, cache=cache,
+                                   dpi=dpi, batch_pages=batch_pages, ocr_dpi=ocr_dpi)
+            if ocr_files is None:
+                return None
+            for index, hocr_file in zip(pending, ocr_files):
+                hocr_files[index] = hocr_file
+        for page, original in duplicates.items():
+            hocr_files[page - 1] = hocr_files[original - 1]
+        return hocr_files
+
+    jobs = max(1, min(jobs or default_ocr_jobs(), len(image_files)))
+    total = len(image_files)
+    batch_pages = max(1, min(batch_pages or 1, -(-total // jobs)))
+    batches = [image_files[i:i + batch_pages] for i in range(0, total, batch_pages)]
+    jobs = min(jobs, len(batches))
+    downscale = ocr_downscale_enabled(dpi, ocr_dpi)
+    if downscale:
+        logging.info(f"OCR on grayscale copies at DPI={ocr_dpi}, hOCR scaled to DPI={dpi}")
+
+    def ocr_unit(batch, thread_limit=None):
+        if downscale:
+            return ocr_downscaled(batch, temp_dir, dpi, ocr_dpi, thread_limit=thread_limit, cache=cache)
+        if batch_pages == 1:
+            hocr_file = ocr_image(batch[0], temp_dir, thread_limit=thread_limit, cache=cache)
+            return None if hocr_file is None else [hocr_file]
+        return ocr_batch(batch, temp_dir, thread_limit=thread_limit, cache=cache)
+
+    if jobs == 1:
+        hocr_files = []
+        for batch in batches:
+            batch_files = ocr_unit(batch)
+            if batch_files is None:
+                return None
+            hocr_files += batch_files
+            logging.info(f"Complete OCR: {len(hocr_files)}/{total}")
+        return hocr_files
+
+    logging.info(f"Run OCR with {jobs} parallel workers" + (f", up to {batch_pages} pages per tesseract process" if batch_pages > 1 else ""))
+    hocr_files = [None] * len(batches)
+    ocr_in_context = utils.in_current_context(ocr_unit)
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {
+            executor.submit(ocr_in_context, batch, thread_limit=1): index
+            for index, batch in enumerate(batches)
+        }
+        completed = 0
+        for future in as_completed(futures):
+            batch_files = future.result()
+            if batch_files is None:
+                # Stop early: drop the batches that have not started yet, only wait for the running ones
+                for pending in futures:
+                    pending.cancel()
+                return None
+            hocr_files[futures[future]] = batch_files
+            completed += len(batch_files)
+            logging.info(f"Complete OCR: {completed}/{total}")
+    return [hocr_file for batch_files in hocr_files for hocr_file in batch_files]
+
+def analyze_images_to_hocr(image_files, temp_dir, jobs=None, cache=None, text_layer=None, dpi=None, page_analysis=None,
+                           batch_pages=1, ocr_dpi=None):
     """
     Use tesseract to OCR images, generate and merge hOCR files.
+    Pages with a reliable text layer, blank and duplicate pages skip OCR (see ocr_images).
     Returns the merged hOCR file path.
     """
     logging.info(f"Phase 2 [Analysis]: Start OCR on {len(image_files)} images...")
-    hocr_files = []
-    
-    for i, img_path in enumerate(image_files):
-        output_prefix = temp_dir / img_path.stem
-        command = [
-            "tesseract",
-            str(img_path),
-            str(output_prefix),
-            "-l", "eng", # English
-            "hocr"
-        ]
-        if not utils.run_command(command):
-            logging.error(f"OCR failed for image {img_path.name}.")
-            return None
-        hocr_files.append(Path(f"{output_prefix}.hocr"))
-        logging.info(f"Complete OCR: {i+1}/{len(image_files)}")
+    hocr_files = ocr_images(image_files, temp_dir, jobs=jobs, cache=cache, text_layer=text_layer, dpi=dpi,
+                            page_analysis=page_analysis, batch_pages=batch_pages, ocr_dpi=ocr_dpi)
+    if hocr_files is None:
+        return None
 
     # Merge all hocr files
     combined_hocr_path = temp_dir / "combined.hocr"
     logging.info(f"Merge hOCR files to {combined_hocr_path}...")
     try:
-        with open(combined_hocr_path, 'w', encoding='utf-8') as outfile:
-            #Write HTML header
-            outfile.write('<?xml version="1.0" encoding="UTF-8"?>\n')
-            outfile.write('<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.0 Transitional//EN"\n')
-            outfile.write('"http://www.w3.org/TR/xhtml1/DTD/xhtml1-transitional.dtd">\n')
-            outfile.write('<html xmlns="http://www.w3.org/1999/xhtml" xml:lang="en" lang="en">\n')
-            outfile.write('<head>\n<title></title>\n')
-            outfile.write('<meta http-equiv="Content-Type" content="text/html;charset=utf-8" />\n')
-            outfile.write('<meta name="ocr-system" content="tesseract" />\n')
-            outfile.write('</head>\n<body>\n')
-            
-            # Combine the content of each page
-            for hocr_file in hocr_files:
-                with open(hocr_file, 'r', encoding='utf-8') as infile:
-                    content = infile.read()
-                    # Extract page content (remove HTML header and trailer)
-                    start_marker = '<div class=\'ocr_page\''
-                    end_marker = '</div>'
-                    
-                    start_idx = content.find(start_marker)
-                    if start_idx != -1:
-                        # Find the corresponding closing tag
-                        page_content = content[start_idx:]
-                        # Find the complete end of div
-                        div_count = 0
-                        end_idx = -1
-                        for i, char in enumerate(page_content):
-                            if page_content[i:i+5] == '<div ':
-                                div_count += 1
-                            elif page_content[i:i+6] == '</div>':
-                                div_count -= 1
-                                if div_count == 0:
-                                    end_idx = i + 6
-                                    break
-                        
-                        if end_idx != -1:
-                            outfile.write(page_content[:end_idx] + '\n')
-                        else:
-                            # Alternative: Find the first </div>
-                            first_end = page_content.find('</div>')
-                            if first_end != -1:
-                                outfile.write(page_content[:first_end + 6] + '\n')
-            
-            outfile.write('</body>\n</html>\n')
-            
-    except IOError as e:
+        hocr.merge_hocr_files(hocr_files, combined_hocr_path)
+    except (IOError, hocr.HocrError) as e:
         logging.error(f"Error merging hOCR files: {e}")
         return None
 
     logging.info("hOCR files merged successfully.")
     return combined_hocr_path
 
+@trace.traced('rebuild')
 def reconstruct_pdf(image_files, hocr_file, temp_dir, params, output_pdf_path):
     """
     Use recode_pdf to reconstruct the PDF.
+    Pages staged from the same image file (duplicates, see compressor.dedup) then share their
+    image objects where possible.
     """
     logging.info(f"Phase 3 [Rebuild]: Rebuild PDF using parameters {params}...")
     
-    # recode_pdf requires a glob pattern
-    image_stack_glob = str(temp_dir / "page-*.tif")
+    # recode_pdf requires a glob pattern; a stack of mixed colour modes can mix PNM extensions
+    image_stack_glob = str(temp_dir / f"page-*{_suffix_pattern([Path(f).suffix for f in image_files] or ['.tif'])}")
 
     command = [
         "recode_pdf",
@@ -131,27 +413,150 @@ def reconstruct_pdf(image_files, hocr_file, temp_dir, params, output_pdf_path):
         "-o", str(output_pdf_path)
     ]
     
-    if not utils.run_command(command):
-        logging.error("PDF reconstruction failed.")
+    if not utils.run_command(command, stage='rebuild', outputs=[output_pdf_path]):
+        if commands.cancelled():
+            logging.info("PDF reconstruction stopped, it is no longer needed.")
+        else:
+            logging.error("PDF reconstruction failed.")
         return False
+    if dedup.shares_images(image_files):
+        dedup.share_identical_images(output_pdf_path)
+    scratch.record('rebuild', output_pdf_path)
         
     logging.info(f"PDF reconstruction successful, output to {output_pdf_path}")
     return True
 
+def _suffix_pattern(suffixes):
+    """Glob pattern matching all of the given file extensions (of equal length), e.g. .p[bgp]m."""
+    suffixes = sorted(set(suffixes))
+    pattern = ""
+    for chars in zip(*suffixes):
+        pattern += chars[0] if len(set(chars)) == 1 else f"[{''.join(sorted(set(chars)))}]"
+    return pattern
+
+# Fewer pages per recode_pdf process do not pay for the process start and the concatenation
+MIN_PAGES_PER_CHUNK = 4
+
+@trace.traced('join')
+def concatenate_pdfs(pdf_files, output_pdf_path):
+    """Join PDFs page by page with qpdf (lossless, text layers are kept)."""
+    command = ["qpdf", "--empty", "--pages"] + [str(f) for f in pdf_files] + ["--", str(output_pdf_path)]
+    if not utils.run_command(command, stage='join', outputs=[output_pdf_path]):
+        return False
+    scratch.record('join', output_pdf_path)
+    return True
+
+@trace.traced('join')
+def assemble_pdf(page_sources, output_pdf_path):
+    """
+    Build a PDF from pages of other PDFs with qpdf (lossless).
+    page_sources lists (pdf_path, page_number) in output order.
+    """
+    arguments = []
+    for pdf_path, page in page_sources:
+        if arguments and arguments[-2] == str(pdf_path) and arguments[-1][1] == page - 1:
+            arguments[-1][1] = page
+        else:
+            arguments += [str(pdf_path), [page, page]]
+    pages = [a if isinstance(a, str) else f"{a[0]}-{a[1]}" for a in arguments]
+    command = ["qpdf", "--empty", "--pages"] + pages + ["--", str(output_pdf_path)]
+    if not utils.run_command(command, stage='join', outputs=[output_pdf_path]):
+        return False
+    scratch.record('join', output_pdf_path)
+    return True
+
+@trace.traced('rebuild')
+def reconstruct_pdf_parallel(image_files, hocr_file, temp_dir, params, output_pdf_path, jobs):
+    """
+    Reconstruct the PDF with up to `jobs` recode_pdf processes, each rebuilding a contiguous
+    page range with its slice of the hOCR, and join the pieces with qpdf.
+    Falls back to a single reconstruct_pdf call for short documents.
+    """
+    chunks = max(1, min(jobs, len(image_files) // MIN_PAGES_PER_CHUNK))
+    if chunks == 1:
+        return reconstruct_pdf(image_files, hocr_file, temp_dir, params, output_pdf_path)
+
+    size = -(-len(image_files) // chunks)
+    slices = [image_files[i:i + size] for i in range(0, len(image_files), size)]
+    work_dir = Path(temp_dir) / f"{Path(output_pdf_path).stem}_chunks"
+    chunk_dirs = [work_dir / f"chunk{i+1:03d}" for i in range(len(slices))]
+    logging.info(f"Phase 3 [Rebuild]: Rebuild {len(image_files)} pages in {len(slices)} parallel parts")
+    try:
+        for chunk_dir, chunk_images in zip(chunk_dirs, slices):
+            chunk_dir.mkdir(parents=True, exist_ok=True)
+            width = len(str(len(chunk_images)))
+            for index, image in enumerate(chunk_images, 1):
+                utils.link_or_copy(image, chunk_dir / f"page-{index:0{width}d}{Path(image).suffix}")
+        try:
+            hocr.split_hocr_file(hocr_file, [len(c) for c in slices], [d / "chunk.hocr" for d in chunk_dirs])
+        except (IOError, hocr.HocrError) as e:
+            logging.error(f"Error splitting the hOCR file for parallel reconstruction: {e}")
+            return False
+
+        def rebuild_chunk(chunk_dir):
+            chunk_images = sorted(chunk_dir.glob("page-*"))
+            return reconstruct_pdf(chunk_images, chunk_dir / "chunk.hocr", chunk_dir, params, chunk_dir / "chunk.pdf")
+
+        with ThreadPoolExecutor(max_workers=len(chunk_dirs)) as executor:
+            if not all(executor.map(utils.in_current_context(rebuild_chunk), chunk_dirs)):
+                if not commands.cancelled():
+                    logging.error("PDF reconstruction failed for at least one part.")
+                return False
+
+        if not concatenate_pdfs([d / "chunk.pdf" for d in chunk_dirs], output_pdf_path):
+            if not commands.cancelled():
+                logging.error("Joining the reconstructed parts failed.")
+            return False
+        if get_pdf_page_count(Path(output_pdf_path)) != len(image_files):
+            if not commands.cancelled():
+                logging.error("The joined PDF does not have the expected number of pages.")
+            return False
+        if dedup.shares_images(image_files):
+            dedup.share_identical_images(output_pdf_path)
+        logging.info(f"PDF reconstruction successful, output to {output_pdf_path}")
+        return True
+    finally:
+        utils.cleanup_directory(str(work_dir))
+
+def rebuild_pdf(image_files, hocr_file, temp_dir, params, output_pdf_path, jobs=1):
+    """Reconstruct the PDF with one recode_pdf process, or in parallel page ranges when jobs > 1."""
+    if jobs and jobs > 1:
+        return reconstruct_pdf_parallel(image_files, hocr_file, temp_dir, params, output_pdf_path, jobs)
+    return reconstruct_pdf(image_files, hocr_file, temp_dir, params, output_pdf_path)
+
 def get_pdf_page_count(pdf_path):
     """Use pdfinfo to get the total number of pages in a PDF."""
     command = ["pdfinfo", str(pdf_path)]
-    try:
-        result = subprocess.run(
-            command, 
-            check=True, 
-            capture_output=True, 
-            text=True, 
-            encoding='utf-8'
-        )
+    result = utils.run_command_result(command, stage='inspect')
+    if result.returncode == 0:
         for line in result.stdout.splitlines():
             if line.startswith("Pages:"):
                 return int(line.split(":")[1].strip())
-    except (subprocess.CalledProcessError, FileNotFoundError) as e:
-        logging.error(f"Failed to obtain the page number of {pdf_path.name}: {e}")
+    elif result.error != commands.CANCELLED:
+        logging.error(f"Failed to obtain the page number of {pdf_path.name}: {result.error or result.stderr.strip()}")
     return 0
+
+# One row of `pdfimages -list`: type is image, mask, smask or stencil; bpc the bits per component
+PageImage = namedtuple('PageImage', ['page', 'type', 'width', 'height', 'color', 'bpc', 'x_ppi', 'y_ppi'])
+
+def parse_image_list(output):
+    """Parse the output of `pdfimages -list` into a list of PageImage."""
+    images = []
+    for row in output.splitlines()[2:]:
+        fields = row.split()
+        if len(fields) < 14:
+            continue
+        try:
+            images.append(PageImage(int(fields[0]), fields[2], int(fields[3]), int(fields[4]), fields[5],
+                                    int(fields[7]), float(fields[12]), float(fields[13])))
+        except ValueError:
+            continue
+    return images
+
+def list_page_images(pdf_path):
+    """The images placed on the pages of a PDF (pdfimages -list), or None if they cannot be listed."""
+    result = utils.run_command_result(["pdfimages", "-list", str(pdf_path)], stage='inspect')
+    if result.returncode != 0:
+        logging.debug(f"Unable to list the images of {Path(pdf_path).name}: {result.error or result.stderr.strip()}")
+        return None
+    return parse_image_list(result.stdout)
@@ -0,0 +1,167 @@
+# compressor/predictor.py
+
+"""
+Output size prediction from a page sample.
+
+Instead of rebuilding the whole document to learn how large the output gets, a few pages spread
+evenly over the document (one per stratum) are rebuilt with a few candidate parameter sets. The
+sample is split into groups that are rebuilt separately, so the spread between the groups gives
+a confidence interval for the extrapolated full-document size. Sizes for parameter sets that
+were not sampled come from the size model of compressor.search.
+
+A ladder prediction rebuilds the sample LADDER_SAMPLES times, so the sample is scaled with the
+document: together those rebuilds cover at most MAX_SAMPLE_SHARE of the pages of one full
+rebuild, and documents too small for a MIN_SAMPLE_PAGES sample within that share are not
+predicted at all.
+"""
+
+import logging
+import math
+from collections import namedtuple
+from . import pipeline, scratch, search, utils
+
+DEFAULT_SAMPLE_PAGES = 12
+SAMPLE_GROUPS = 3
+MIN_SAMPLE_PAGES = 2 * SAMPLE_GROUPS  # two pages per group for a spread
+LADDER_SAMPLES = 3                   # ladder entries rebuilt from the sample (first, middle, last)
+# Sample rebuilds of a ladder prediction cost at most this share of one full rebuild
+MAX_SAMPLE_SHARE = 0.5
+# Below this many pages a full rebuild is about as cheap as the sample rebuilds
+MIN_PAGES_FOR_PREDICTION = math.ceil(MIN_SAMPLE_PAGES * LADDER_SAMPLES / MAX_SAMPLE_SHARE)
+
+# Two-sided 95% Student t quantiles by degrees of freedom
+_T_95 = {1: 12.71, 2: 4.30, 3: 3.18, 4: 2.78, 5: 2.57, 6: 2.45, 7: 2.36, 8: 2.31, 9: 2.26}
+
+# size_mb: point estimate; low_mb/high_mb: 95% confidence interval
+SizePrediction = namedtuple('SizePrediction', ['size_mb', 'low_mb', 'high_mb'])
+
+
+def sample_pages(page_count, sample_size=DEFAULT_SAMPLE_PAGES):
+    """
+    Stratified sample: split pages 1..page_count into sample_size equal strata and take the
+    middle page of each. Returns a sorted list of page numbers.
+    """
+    sample_size = min(sample_size, page_count)
+    pages = set()
+    for stratum in range(sample_size):
+        start = stratum * page_count / sample_size
+        end = (stratum + 1) * page_count / sample_size
+        pages.add(int((start + end) / 2) + 1)
+    return sorted(pages)
+
+
+def sample_size_for(page_count, sample_size=DEFAULT_SAMPLE_PAGES):
+    """
+    Sample pages for a document of page_count pages: at most sample_size, and small enough that
+    LADDER_SAMPLES rebuilds of the sample stay within MAX_SAMPLE_SHARE of the document. Returns 0
+    when that leaves fewer than MIN_SAMPLE_PAGES (prediction does not pay off).
+    """
+    size = min(sample_size, int(page_count * MAX_SAMPLE_SHARE / LADDER_SAMPLES))
+    return size if size >= MIN_SAMPLE_PAGES else 0
+
+
+class SizePredictor:
+    """Predict full-document output sizes of a DocumentSession from sample rebuilds."""
+
+    def __init__(self, session, sample_size=DEFAULT_SAMPLE_PAGES, groups=SAMPLE_GROUPS):
+        self.session = session
+        self.sample_size = sample_size
+        self.groups = groups
+        self._predictions = {}  # params key -> SizePrediction (None if the sample rebuild failed)
+
+    @staticmethod
+    def _key(params):
+        return (params['dpi'], params['bg_downsample'], params.get('jpeg2000_encoder', 'openjpeg'))
+
+    def enabled(self):
+        """Whether the document is large enough for sampling to pay off."""
+        return sample_size_for(self.session.page_count, self.sample_size) > 0
+
+    def predict(self, params):
+        """
+        Rebuild the page sample with params and extrapolate the full-document size.
+        Returns a SizePrediction, or None if a sample rebuild failed.
+        """
+        key = self._key(params)
+        if key in self._predictions:
+            return self._predictions[key]
+
+        page_count = self.session.page_count
+        pages = sample_pages(page_count, sample_size_for(page_count, self.sample_size) or self.sample_size)
+        groups = [pages[i::self.groups] for i in range(min(self.groups, len(pages)))]
+        per_page = []
+        for group in groups:
+            staged = self.session.stage_pages(params['dpi'], group)
+            if not staged:
+                self._predictions[key] = None
+                return None
+            stage_dir, image_files, hocr_file = staged
+            output_pdf_path = stage_dir / f"sample_{params['dpi']}_{params['bg_downsample']}_{key[2]}.pdf"
+            if not pipeline.reconstruct_pdf(image_files, hocr_file, stage_dir, params, output_pdf_path):
+                logging.warning(f"Sample rebuild failed for DPI={params['dpi']}, BG-Downsample={params['bg_downsample']}")
+                self._predictions[key] = None
+                return None
+            per_page.append(utils.get_file_size_mb(output_pdf_path) / len(group))
+            scratch.discard(output_pdf_path)
+
+        mean = sum(per_page) / len(per_page)
+        if len(per_page) > 1:
+            variance = sum((x - mean) ** 2 for x in per_page) / (len(per_page) - 1)
+            # Finite population correction: a sample of the whole document has no error
+            correction = math.sqrt(max(0.0, 1 - len(pages) / page_count))
+            half_width = _T_95.get(len(per_page) - 1, 1.96) * math.sqrt(variance / len(per_page)) * correction
+        else:
+            half_width = mean
+        prediction = SizePrediction(mean * page_count, max(0.0, mean - half_width) * page_count, (mean + half_width) * page_count)
+        logging.info(
+            f"Predicted size for DPI={params['dpi']}, BG-Downsample={params['bg_downsample']}: "
+            f"{prediction.size_mb:.2f}MB (95% CI {prediction.low_mb:.2f}-{prediction.high_mb:.2f}MB, "
+            f"{len(pages)} sample pages of {page_count})"
+        )
+        self._predictions[key] = prediction
+        return prediction
+
+    def predict_ladder(self, params_sequence):
+        """
+        Predict every entry of a parameter ladder from sample rebuilds of its first, middle and
+        last entries. Returns a list of SizePrediction, or None if sampling failed.
+        """
+        sampled = sorted({0, (len(params_sequence) - 1) // 2, len(params_sequence) - 1})  # LADDER_SAMPLES
+        known = {}
+        for index in sampled:
+            prediction = self.predict(params_sequence[index])
+            if prediction is None:
+                return None
+            known[index] = prediction
+
+        points = [(params_sequence[index], p.size_mb) for index, p in known.items() if p.size_mb > 0]
+        if not points:
+            return None
+        model = search.fit_size_model(points)
+        # Relative interval width of the sampled entries, applied to the modelled ones
+        spread = max((p.high_mb - p.size_mb) / p.size_mb for p in known.values() if p.size_mb > 0)
+        predictions = []
+        for index, params in enumerate(params_sequence):
+            if index in known:
+                predictions.append(known[index])
+            else:
+                size = model(params)
+                predictions.append(SizePrediction(size, max(0.0, size * (1 - spread)), size * (1 + spread)))
+        return predictions
+
+    def start_index(self, params_sequence, target_size_mb):
+        """
+        Index of the first ladder entry predicted to fit the target (the last entry if none is),
+        or 0 when prediction is not used for this document.
+        """
+        if not self.enabled():
+            return 0
+        predictions = self.predict_ladder(params_sequence)
+        if predictions is None:
+            return 0
+        for index, prediction in enumerate(predictions):
+            if prediction.size_mb <= target_size_mb:
+                break
+        logging.info(f"Size prediction: start the search at parameter set {index+1} "
+                     f"(predicted {predictions[index].size_mb:.2f}MB, target {target_size_mb}MB)")
+        return index
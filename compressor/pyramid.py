@@ -0,0 +1,77 @@
+# compressor/pyramid.py
+
+"""
+Image pyramid: page images at lower resolutions derived from a higher-resolution render.
+
+A parameter set with dpi=150 gets page images rendered at 150 DPI (a quarter of the pixels of
+the 300 DPI render), so recode_pdf does not process more pixels than the output keeps. With
+Pillow installed, every level is derived once by downscaling the existing render (box filter /
+integer reduce, done in C and in parallel threads); without it the session renders the level
+with pdftoppm instead. The hOCR is rescaled by the session to match.
+
+The same downscaling makes the grayscale copies that OCR runs on when it has its own, lower
+resolution (--ocr-dpi, see pipeline.ocr_downscaled).
+"""
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from . import resources, scratch
+
+try:
+    from PIL import Image
+except ImportError:  # optional: the session falls back to rendering with pdftoppm
+    Image = None
+
+
+def available():
+    """Whether levels can be derived by downscaling (Pillow is installed)."""
+    return Image is not None
+
+
+def downscale_image(source_path, target_path, factor, dpi, grayscale=False):
+    """
+    Write source_path scaled by factor (< 1) to target_path, in the format of its extension
+    (TIFFs keep the compression of the source) and the colour mode of the source, tagged with dpi.
+    With grayscale, the copy is 8-bit grayscale whatever the mode of the source.
+    """
+    with Image.open(source_path) as image:
+        options = {'dpi': (dpi, dpi)}
+        if image.format == 'TIFF' and 'compression' in image.info:
+            options['compression'] = image.info['compression']
+        bitonal = image.mode == '1' and not grayscale
+        if grayscale and image.mode != 'L':
+            image = image.convert('L')
+        elif image.mode in ('1', 'P'):
+            image = image.convert('L')  # only nearest-neighbour resampling works on these modes
+        reduction = 1 / factor
+        if abs(reduction - round(reduction)) < 1e-6:
+            scaled = image.reduce(round(reduction))
+        else:
+            size = (max(1, round(image.width * factor)), max(1, round(image.height * factor)))
+            scaled = image.resize(size, Image.Resampling.BOX)
+        if bitonal:
+            # Bitonal pages stay bitonal (see compressor.colormode): threshold, do not dither
+            scaled = scaled.point(lambda value: 255 if value >= 128 else 0).convert('1', dither=Image.Dither.NONE)
+        scaled.save(target_path, **options)
+    return target_path
+
+
+def build_level(image_files, output_dir, source_dpi, dpi, jobs=None):
+    """
+    Derive the page images at dpi from image_files rendered at source_dpi (same file names in
+    output_dir), with up to jobs threads (default: the CPU slots of the shared budget).
+    Returns the list of new image paths, or None on failure.
+    """
+    factor = dpi / source_dpi
+    targets = [output_dir / source.name for source in image_files]
+    jobs = jobs or resources.budget().cpus
+    logging.info(f"Derive {len(image_files)} page images at DPI={dpi} from the DPI={source_dpi} render")
+    try:
+        # Pillow releases the GIL while resampling, so threads scale
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            list(executor.map(lambda pair: downscale_image(pair[0], pair[1], factor, dpi), zip(image_files, targets)))
+    except (OSError, ValueError) as e:
+        logging.warning(f"Downscaling to DPI={dpi} failed, render instead: {e}")
+        return None
+    scratch.record('derive', *targets)
+    return targets
@@ -0,0 +1,172 @@
+# compressor/resources.py
+
+"""
+Process-wide CPU and memory budget for external tools.
+
+Files, OCR pages, speculative candidates and rebuild page ranges are all processed by thread
+pools, and these pools nest (several files, each OCRing several pages). Threads are cheap; the
+work happens in the pdftoppm/tesseract/recode_pdf/qpdf processes. Every external command
+therefore takes one CPU slot and its estimated memory from the shared budget before it starts
+(see compressor.commands), so the nested pools together never run more processes than the
+machine has cores, and never more memory-hungry processes than fit in RAM.
+
+The memory estimate of a tool starts from TOOL_MEMORY_MB and is replaced by what the tool was
+measured to use: the command launcher reports the peak RSS of every process, per tool and
+rendering resolution, and a new process is only admitted while the estimates of all running
+processes plus its own stay within the budget.
+"""
+
+import logging
+import os
+import threading
+from contextlib import contextmanager
+
+# Rough peak memory of one process per tool, in MB
+TOOL_MEMORY_MB = {
+    'pdftoppm': 200,
+    'tesseract': 300,
+    'recode_pdf': 1000,
+    'qpdf': 200,
+}
+DEFAULT_TOOL_MEMORY_MB = 100
+# Tools whose memory grows with the pixel count of the page (resolution from -r / --dpi)
+PIXEL_TOOLS = ('pdftoppm', 'recode_pdf')
+REFERENCE_DPI = 300
+# Measured peaks are padded by this factor before they are used as estimates
+PEAK_MARGIN = 1.2
+# Share of the physical memory that external tools may use together
+MEMORY_FRACTION = 0.75
+
+
+def physical_memory_mb():
+    """Installed physical memory in MB, or None if unknown."""
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') / (1024 * 1024)
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+class ResourceBudget:
+    """Counting budget of CPU slots and memory, shared by all threads of the process."""
+
+    def __init__(self, cpus=None, memory_mb=None, process_limit_mb=None):
+        self.cpus = max(1, cpus or os.cpu_count() or 1)
+        # Opt-in address space cap of every single process (RLIMIT_AS, see compressor.launcher)
+        self.process_limit_mb = process_limit_mb
+        memory = memory_mb or (physical_memory_mb() or 0) * MEMORY_FRACTION
+        self.memory_mb = memory if memory > 0 else float('inf')
+        self._free_cpus = self.cpus
+        self._free_memory_mb = self.memory_mb
+        self._condition = threading.Condition()
+
+    def _clamp(self, cpus, memory_mb):
+        # A request larger than the whole budget runs alone instead of waiting forever
+        return min(cpus, self.cpus), min(memory_mb, self.memory_mb)
+
+    def take(self, cpus=1, memory_mb=0):
+        """Wait until cpus slots and memory_mb are free and take them (give them back with release)."""
+        cpus, memory_mb = self._clamp(cpus, memory_mb)
+        with self._condition:
+            while self._free_cpus < cpus or self._free_memory_mb < memory_mb:
+                self._condition.wait()
+            self._free_cpus -= cpus
+            self._free_memory_mb -= memory_mb
+
+    def release(self, cpus=1, memory_mb=0):
+        """Give back what take(cpus, memory_mb) took."""
+        cpus, memory_mb = self._clamp(cpus, memory_mb)
+        with self._condition:
+            self._free_cpus += cpus
+            self._free_memory_mb += memory_mb
+            self._condition.notify_all()
+
+    @contextmanager
+    def acquire(self, cpus=1, memory_mb=0):
+        """Wait until cpus slots and memory_mb are free, hold them for the duration of the block."""
+        self.take(cpus, memory_mb)
+        try:
+            yield
+        finally:
+            self.release(cpus, memory_mb)
+
+
+_budget = ResourceBudget()
+
+
+def configure(cpus=None, memory_mb=None, process_limit_mb=None):
+    """Replace the process-wide budget (call before any work starts)."""
+    global _budget
+    _budget = ResourceBudget(cpus, memory_mb, process_limit_mb)
+    memory_text = "unlimited" if _budget.memory_mb == float('inf') else f"{_budget.memory_mb:.0f}MB"
+    limit_text = f", address space of each process capped at {process_limit_mb:.0f}MB" if process_limit_mb else ""
+    logging.info(f"Resource budget: {_budget.cpus} CPU slots, {memory_text} memory for external tools{limit_text}")
+    return _budget
+
+
+def budget():
+    """The process-wide budget."""
+    return _budget
+
+
+_peaks = {}  # (tool, dpi) -> largest measured peak RSS in MB
+_peaks_lock = threading.Lock()
+
+
+def _command_key(command):
+    tool = os.path.basename(str(command[0])) if command else ''
+    dpi = None
+    for flag in ('-r', '--dpi'):
+        if flag in command[:-1]:
+            try:
+                dpi = float(command[command.index(flag) + 1])
+            except ValueError:
+                pass
+    return tool, dpi
+
+
+def _scale(tool, memory_mb, from_dpi, to_dpi):
+    if tool not in PIXEL_TOOLS or not from_dpi or not to_dpi:
+        return memory_mb
+    return memory_mb * (to_dpi / from_dpi) ** 2
+
+
+def record_peak(command, peak_mb):
+    """Remember the measured peak memory of a finished command."""
+    key = _command_key(command)
+    with _peaks_lock:
+        _peaks[key] = max(peak_mb, _peaks.get(key, 0.0))
+    logging.debug(f"{key[0]} peak memory {peak_mb:.0f}MB" + (f" at {key[1]:.0f} DPI" if key[1] else ""))
+
+
+def memory_estimate(command):
+    """
+    Estimated peak memory (MB) of a command: the measured peak of the same tool at the same
+    resolution, else a measured peak of the tool scaled by the pixel count, else the default.
+    """
+    tool, dpi = key = _command_key(command)
+    with _peaks_lock:
+        if key in _peaks:
+            return _peaks[key] * PEAK_MARGIN
+        measured = [_scale(tool, peak, other_dpi, dpi) for (other_tool, other_dpi), peak in _peaks.items() if other_tool == tool]
+    if measured:
+        return max(measured) * PEAK_MARGIN
+    return _scale(tool, TOOL_MEMORY_MB.get(tool, DEFAULT_TOOL_MEMORY_MB), REFERENCE_DPI, dpi)
+
+
+def peak_report():
+    """Largest measured peak memory per tool in MB."""
+    report = {}
+    with _peaks_lock:
+        for (tool, _), peak in _peaks.items():
+            report[tool] = max(peak, report.get(tool, 0.0))
+    return report
+
+
+def command_demand(command):
+    """CPU slots and memory (MB) an external command takes from the budget."""
+    return 1, memory_estimate(command)
+
+
+def command_slot(command):
+    """Context manager holding one CPU slot and the estimated memory of an external command."""
+    return _budget.acquire(*command_demand(command))
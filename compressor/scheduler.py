@@ -0,0 +1,71 @@
+# compressor/scheduler.py
+
+"""
+Batch scheduling: longest processing time first.
+
+Parallel workers take files from a FIFO queue. When the files are submitted in name order, a
+large file that happens to sort last starts last and the batch waits for it alone. Submitting
+the most expensive files first and letting the small ones backfill idle workers (LPT list
+scheduling) keeps the finish time within 4/3 of the optimum.
+
+The cost of a file is estimated up front from its page count, its size and the compression
+tier it falls into (a higher tier means more rebuilds and possibly splitting).
+"""
+
+import logging
+from . import pipeline, strategy, utils
+
+# Relative cost of OCRing one page and of one rebuild of one page
+OCR_COST_PER_PAGE = 1.0
+REBUILD_COST_PER_PAGE = 0.5
+# Typical number of full rebuilds per tier (tier 0 is not compressed)
+EXPECTED_REBUILDS = {0: 0, 1: 2, 2: 3, 3: 4}
+# Used when the page count cannot be read
+ASSUMED_MB_PER_PAGE = 0.3
+# Files below the target are only copied
+COPY_COST = 0.01
+
+SCHEDULES = ('lpt', 'fifo')
+
+
+def cost_from_size(size_mb, page_count, target_size_mb):
+    """Estimated relative processing cost of a file of size_mb with page_count pages (0 = unknown)."""
+    tier = strategy.determine_tier(size_mb)
+    if size_mb < target_size_mb or tier == 0:
+        return COPY_COST
+    if not page_count:
+        page_count = max(1, round(size_mb / ASSUMED_MB_PER_PAGE))
+    return page_count * (OCR_COST_PER_PAGE + REBUILD_COST_PER_PAGE * EXPECTED_REBUILDS[tier])
+
+
+def estimate_cost(pdf_path, target_size_mb):
+    """Estimated relative processing cost of one file (reads its size and page count)."""
+    size_mb = utils.get_file_size_mb(pdf_path)
+    if size_mb < target_size_mb:
+        return COPY_COST
+    return cost_from_size(size_mb, pipeline.get_pdf_page_count(pdf_path), target_size_mb)
+
+
+def lpt_order(items, costs):
+    """Items sorted by decreasing cost (ties keep their original order)."""
+    return [item for _, _, item in sorted(((-cost, index, item) for index, (item, cost) in enumerate(zip(items, costs))))]
+
+
+def dispatch_order(pdf_files, target_size_mb, schedule='lpt'):
+    """Order in which the batch files are handed to the workers."""
+    if schedule == 'fifo':
+        return list(pdf_files)
+    costs = {pdf_file: estimate_cost(pdf_file, target_size_mb) for pdf_file in pdf_files}
+    ordered = lpt_order(list(costs), list(costs.values()))
+    logging.info("Dispatch order (longest estimated processing time first): "
+                 + ", ".join(f"{f.name} ({costs[f]:.0f})" for f in ordered))
+    return ordered
+
+
+def simulate_makespan(durations, workers):
+    """Finish time of list scheduling: each job goes to the first free worker, in the given order."""
+    finish = [0.0] * max(1, workers)
+    for duration in durations:
+        index = finish.index(min(finish))
+        finish[index] += duration
+    return max(finish)
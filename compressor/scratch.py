@@ -0,0 +1,129 @@
+# compressor/scratch.py
+
+"""
+Scratch space accounting.
+
+Page images, hOCR, stage directories and candidate PDFs are written to temporary directories
+(tempfile, or --scratch-dir such as a tmpfs). Every stage records the files it writes here, so
+the run reports how many bytes each stage wrote and how much scratch space was in use at the
+peak. Intermediates are discarded as soon as no later stage needs them (losing candidate PDFs,
+sample rebuilds); when the scratch usage is above the budget, sessions also
+drop the page images they can restore later (see DocumentSession.trim_scratch).
+"""
+
+import logging
+import os
+import tempfile
+import threading
+from pathlib import Path
+
+
+def _format_bytes(size):
+    for unit in ('B', 'KB', 'MB'):
+        if size < 1024:
+            return f"{size:.0f}{unit}" if unit == 'B' else f"{size:.1f}{unit}"
+        size /= 1024
+    return f"{size:.2f}GB"
+
+
+class ScratchLedger:
+    """Live scratch files with their sizes, bytes written per stage and the usage budget."""
+
+    def __init__(self, budget_mb=None):
+        self.budget_bytes = int(budget_mb * 1024 * 1024) if budget_mb else None
+        self.written = {}    # stage -> bytes written
+        self.peak_bytes = 0
+        self._files = {}     # path -> size
+        self._usage = 0
+        self._warned = False
+        self._lock = threading.Lock()
+
+    def add(self, stage, paths):
+        """Record files written by a stage."""
+        sizes = {}
+        for path in paths:
+            try:
+                sizes[str(path)] = os.path.getsize(path)
+            except OSError:
+                continue
+        with self._lock:
+            for path, size in sizes.items():
+                self._usage += size - self._files.get(path, 0)
+                self._files[path] = size
+            self.written[stage] = self.written.get(stage, 0) + sum(sizes.values())
+            self.peak_bytes = max(self.peak_bytes, self._usage)
+            warn = self.over_budget() and not self._warned
+            self._warned = self._warned or warn
+        if warn:
+            logging.warning(f"Scratch usage {_format_bytes(self._usage)} is above the budget of {_format_bytes(self.budget_bytes)}")
+
+    def remove(self, paths):
+        """Forget files that were deleted."""
+        with self._lock:
+            for path in paths:
+                self._usage -= self._files.pop(str(path), 0)
+            if not self.over_budget():
+                self._warned = False
+
+    def forget_tree(self, directory):
+        """Forget every file below a deleted directory."""
+        prefix = str(directory).rstrip(os.sep) + os.sep
+        with self._lock:
+            paths = [path for path in self._files if path.startswith(prefix)]
+        self.remove(paths)
+
+    @property
+    def usage_bytes(self):
+        return self._usage
+
+    def over_budget(self):
+        return self.budget_bytes is not None and self._usage > self.budget_bytes
+
+    def report(self):
+        """One-line summary of the bytes written per stage and the peak usage."""
+        with self._lock:
+            stages = ", ".join(f"{stage} {_format_bytes(size)}" for stage, size in self.written.items())
+            return f"Scratch bytes written: {stages or 'none'}; peak usage {_format_bytes(self.peak_bytes)}"
+
+
+_ledger = ScratchLedger()
+
+
+def configure(directory=None, budget_mb=None):
+    """
+    Use directory for all temporary files (also those of the external tools, via TMPDIR) and
+    set the scratch budget. Call before any work starts.
+    """
+    global _ledger
+    if directory:
+        directory = Path(directory).expanduser().resolve()
+        directory.mkdir(parents=True, exist_ok=True)
+        tempfile.tempdir = str(directory)
+        os.environ["TMPDIR"] = str(directory)
+        logging.info(f"Scratch directory: {directory}")
+    _ledger = ScratchLedger(budget_mb)
+    if budget_mb:
+        logging.info(f"Scratch budget: {budget_mb:.0f}MB")
+    return _ledger
+
+
+def ledger():
+    """The process-wide scratch ledger."""
+    return _ledger
+
+
+def record(stage, *paths):
+    """Record files written by a stage."""
+    _ledger.add(stage, paths)
+
+
+def discard(*paths):
+    """Delete intermediates that no later stage needs."""
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logging.debug(f"Unable to delete intermediate file {path}: {e}")
+    _ledger.remove(paths)
@@ -0,0 +1,494 @@
+# compressor/search.py
+
+"""
+Parameter search over an ordered strategy ladder.
+
+A ladder (STRATEGIES[tier]['params_sequence']) goes from the highest quality / largest output to
+the most aggressive / smallest output. A search looks for the best entry whose output fits the
+target size, rebuilding candidates through a probe:
+
+- legacy: the original order - first entry, then either a jump to the last entry with upward
+  backtracking, or a sequential scan.
+- binary: bisection for the first fitting entry, assuming sizes shrink along the ladder.
+- model:  fits log(size) against log(dpi) and log(bg_downsample) from the probes made so far
+  and jumps to the predicted boundary, then confirms it.
+
+Probes rebuild sequentially or speculatively (several candidates in parallel ahead of the
+search). Every search reports how many rebuilds it used.
+"""
+
+import logging
+import math
+import threading
+from collections import namedtuple
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+from . import commands, utils
+
+SEARCH_MODES = ('legacy', 'binary', 'model')
+
+# index: chosen ladder entry (None if nothing fits); size_mb/output_path: its rebuild result
+SearchOutcome = namedtuple('SearchOutcome', ['index', 'size_mb', 'output_path', 'rebuilds'])
+
+# A first result above target * FAR_FROM_TARGET_FACTOR jumps straight to the most aggressive parameters
+FAR_FROM_TARGET_FACTOR = 1.5
+
+def _describe(params):
+    return f"DPI={params['dpi']}, BG-Downsample={params['bg_downsample']}, JPEG2000={params.get('jpeg2000_encoder', 'openjpeg')}"
+
+def _fits(result, target_size_mb):
+    return result is not None and result[0] <= target_size_mb
+
+class SequentialProbe:
+    """Rebuild candidates on demand, one at a time, remembering each result."""
+
+    def __init__(self, rebuild):
+        self._rebuild = rebuild
+        self._results = {}
+
+    def result(self, index):
+        if index not in self._results:
+            self._results[index] = self._rebuild(index)
+        return self._results[index]
+
+    def known(self):
+        return dict(self._results)
+
+    def close(self):
+        pass
+
+class SpeculativeProbe:
+    """
+    Rebuild candidates ahead of time in a worker pool; result() waits for the candidate.
+    After every finished rebuild, `losers(results)` names the candidates that can no longer be
+    chosen: those that have not started yet are cancelled, running ones have their commands
+    killed (every candidate runs in its own commands.CancelScope).
+    """
+
+    def __init__(self, rebuild, order, jobs, losers):
+        self._rebuild = rebuild
+        self._losers = losers
+        self._results = {}
+        self._stopped = set()  # running candidates whose commands were killed
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=jobs)
+        self._scopes = {index: commands.CancelScope() for index in order}
+        self._futures = {}
+        for index in order:
+            future = self._executor.submit(utils.in_current_context(self._run), index)
+            self._futures[index] = future
+            future.add_done_callback(utils.in_current_context(lambda f, index=index: self._on_done(index, f)))
+
+    def _run(self, index):
+        with self._scopes[index]:
+            return self._rebuild(index)
+
+    def _on_done(self, index, future):
+        if future.cancelled():
+            return
+        with self._lock:
+            if index in self._stopped:
+                return  # a killed rebuild has no meaningful result
+            self._results[index] = future.result()
+            losers = self._losers(dict(self._results))
+        for loser in losers:
+            future = self._futures[loser]
+            if future.cancelled() or future.done():
+                continue
+            if future.cancel():
+                logging.info(f"Speculative rebuild of parameter set {loser + 1} cancelled, it can no longer be selected")
+                continue
+            with self._lock:
+                if loser in self._stopped:
+                    continue
+                self._stopped.add(loser)
+            self._scopes[loser].cancel()
+            logging.info(f"Speculative rebuild of parameter set {loser + 1} stopped, it can no longer be selected")
+
+    def result(self, index):
+        future = self._futures[index]
+        if not future.cancelled():
+            try:
+                result = future.result()
+            except CancelledError:
+                pass
+            else:
+                with self._lock:
+                    if index not in self._stopped:
+                        return result
+        # Cancelled or stopped by a result the search had not looked at yet: rebuild it now
+        with self._lock:
+            if index in self._results:
+                return self._results[index]
+        result = self._rebuild(index)
+        with self._lock:
+            self._results[index] = result
+        return result
+
+    def known(self):
+        """Results of the rebuilds finished so far."""
+        with self._lock:
+            return dict(self._results)
+
+    def close(self):
+        for index, future in self._futures.items():
+            if not future.cancel():
+                self._scopes[index].cancel()  # nobody waits for it any more
+        self._executor.shutdown(wait=True)
+
+def legacy_search(probe, params_sequence, target_size_mb, start_index=0):
+    """
+    The search order of the iterative compression: the first (conservative) entry, then either a
+    jump to the most aggressive entry followed by upward backtracking (when the first result is
+    far from the target), or a sequential scan of the remaining entries.
+    With start_index > 0 (a predicted starting point) the search starts there instead, see
+    _predicted_start_search.
+    probe.result(index) returns (size_mb, output_path), or None when the rebuild failed.
+    Returns the index of the chosen entry, or None.
+    """
+    if start_index > 0:
+        return _predicted_start_search(probe, params_sequence, target_size_mb, start_index)
+
+    first_params = params_sequence[0]
+    encoder = first_params.get('jpeg2000_encoder', 'openjpeg')
+    logging.info(f"--- First try (conservative): DPI={first_params['dpi']}, BG-Downsample={first_params['bg_downsample']}, JPEG2000={encoder} ---")
+    first = probe.result(0)
+    if first is not None:
+        result_size_mb = first[0]
+        logging.info(f"First attempt result size: {result_size_mb:.2f}MB (target: < {target_size_mb}MB)")
+        if result_size_mb <= target_size_mb:
+            return 0
+
+        # If it is far from the target (threshold: 1.5x), directly try the most aggressive parameters
+        if result_size_mb > target_size_mb * FAR_FROM_TARGET_FACTOR:
+            logging.info("The first result is far from the target, try the most aggressive strategy directly")
+            last_index = len(params_sequence) - 1
+            last_params = params_sequence[last_index]
+            logging.info(f"--- Directly try the most aggressive parameters: DPI={last_params['dpi']}, BG-Downsample={last_params['bg_downsample']} ---")
+            last = probe.result(last_index)
+            if last is None:
+                logging.error("The most aggressive parameter attempt failed, and the overall compression failed.")
+                return None
+
+            logging.info(f"Most aggressive attempt result size: {last[0]:.2f}MB (target: < {target_size_mb}MB)")
+            if last[0] > target_size_mb:
+                logging.error("The most aggressive attempt still failed to reach the goal and declared failure.")
+                return None
+
+            # The most aggressive success, backtracking upward to improve quality
+            logging.info("The most aggressive attempt was successful, starting to backtrack upwards to try higher quality parameters")
+            # Backtrack from last_index-1 to 0 until the first one that does not meet the goal is found
+            chosen = last_index
+            for idx in range(last_index - 1, -1, -1):
+                params = params_sequence[idx]
+                logging.info(f"--- Backtrace attempt idx={idx}: DPI={params['dpi']}, BG-Downsample={params['bg_downsample']} ---")
+                result = probe.result(idx)
+                if result is None:
+                    logging.warning(f"Backtracking attempt idx={idx} failed to rebuild, retaining the previous successful result")
+                    break
+                logging.info(f"Backtracking attempt result size: {result[0]:.2f}MB")
+                if result[0] <= target_size_mb:
+                    chosen = idx
+                else:
+                    # If the current quality exceeds the target, stop backtracking and use the last successful result.
+                    logging.info("The current backtracking attempt exceeds the target, stop backtracking, and use the last successful result")
+                    break
+            return chosen
+
+        # Otherwise continue the subsequent configuration in order (try sequentially starting from 2)
+    else:
+        logging.warning("The first attempt to rebuild failed, continue to try subsequent parameters in sequence")
+
+    # Try the remaining configurations in order (starting with the second item)
+    for i in range(1, len(params_sequence)):
+        params = params_sequence[i]
+        encoder = params.get('jpeg2000_encoder', 'openjpeg')
+        logging.info(f"--- Sequential attempts {i+1}/{len(params_sequence)}: DPI={params['dpi']}, BG-Downsample={params['bg_downsample']}, JPEG2000={encoder} ---")
+        result = probe.result(i)
+        if result is None:
+            continue
+        logging.info(f"Try result size: {result[0]:.2f}MB (target: < {target_size_mb}MB)")
+        if result[0] <= target_size_mb:
+            return i
+
+    return None
+
+def _predicted_start_search(probe, params_sequence, target_size_mb, start_index):
+    """
+    Start at the predicted entry. If it fits, walk back towards higher quality while the
+    previous entry still fits; otherwise scan the more aggressive entries in order.
+    """
+    logging.info(f"--- Predicted start idx={start_index}: {_describe(params_sequence[start_index])} ---")
+    result = probe.result(start_index)
+    if _fits(result, target_size_mb):
+        logging.info(f"Predicted start result size: {result[0]:.2f}MB (target: < {target_size_mb}MB), try higher quality")
+        index = start_index
+        while index > 0:
+            logging.info(f"--- Backtrack to idx={index-1}: {_describe(params_sequence[index-1])} ---")
+            result = probe.result(index - 1)
+            if not _fits(result, target_size_mb):
+                break
+            index -= 1
+        return index
+
+    for index in range(start_index + 1, len(params_sequence)):
+        logging.info(f"--- Continue with idx={index}: {_describe(params_sequence[index])} ---")
+        result = probe.result(index)
+        if result is not None:
+            logging.info(f"Try result size: {result[0]:.2f}MB (target: < {target_size_mb}MB)")
+        if _fits(result, target_size_mb):
+            return index
+    return None
+
+def legacy_losers(results, count, target_size_mb, start_index=0):
+    """
+    Candidates that legacy_search can no longer choose, given the results known so far.
+    Sizes need not shrink along the ladder: only entries that the search order rules out lose.
+    """
+    fits = lambda index: results[index] is not None and results[index][0] <= target_size_mb
+    if start_index > 0:
+        return _predicted_start_losers(results, count, start_index, fits)
+    if 0 not in results:
+        return set()
+    if fits(0):
+        return set(range(1, count))
+
+    first = results[0]
+    if first is not None and first[0] > target_size_mb * FAR_FROM_TARGET_FACTOR:
+        # Backtracking from the last entry: nothing wins if the last entry does not fit,
+        # and backtracking never passes an entry that fails or exceeds the target
+        last_index = count - 1
+        if last_index in results and not fits(last_index):
+            return set(range(1, count))
+        losers = set()
+        for index in results:
+            if 0 < index < last_index and not fits(index):
+                losers.update(range(1, index))
+        return losers
+
+    # Sequential scan: the first fitting entry wins, everything after it loses
+    fitting = [index for index in results if index > 0 and fits(index)]
+    if fitting:
+        return set(range(min(fitting) + 1, count))
+    return set()
+
+def _predicted_start_losers(results, count, start_index, fits):
+    """Candidates that _predicted_start_search can no longer choose."""
+    if start_index not in results:
+        return set()
+    if fits(start_index):
+        # Backtracking stops at the first entry before the start that does not fit
+        failing = [index for index in results if index < start_index and not fits(index)]
+        return set(range(0, max(failing) + 1 if failing else 0)) | set(range(start_index + 1, count))
+    # Scan after the start: the first fitting entry wins, nothing before the start is tried
+    fitting = [index for index in results if index > start_index and fits(index)]
+    best = min(fitting) if fitting else count
+    return set(range(0, start_index + 1)) | set(range(best + 1, count))
+
+def _tighten(probe, lo, hi, target_size_mb):
+    """Narrow the open interval (lo, hi) with every result the probe already has."""
+    for index, result in sorted(probe.known().items()):
+        if lo < index < hi:
+            if _fits(result, target_size_mb):
+                hi = index
+            else:
+                lo = index
+    return lo, hi
+
+def binary_search(probe, params_sequence, target_size_mb, start_index=0):
+    """
+    Bisection for the first entry that fits, starting with a probe of start_index.
+    A failed rebuild counts as "does not fit".
+    Returns the index of the chosen entry, or None.
+    """
+    lo, hi = -1, len(params_sequence)  # entries <= lo do not fit, hi is the best known fit
+    index = start_index
+    while hi - lo > 1:
+        logging.info(f"--- Binary search attempt idx={index}: {_describe(params_sequence[index])} ---")
+        result = probe.result(index)
+        if _fits(result, target_size_mb):
+            logging.info(f"Result size: {result[0]:.2f}MB, fits the target (< {target_size_mb}MB)")
+            hi = index
+        else:
+            logging.info(f"Result size: {result[0]:.2f}MB, exceeds the target (< {target_size_mb}MB)" if result else "Rebuild failed")
+            lo = index
+        lo, hi = _tighten(probe, lo, hi, target_size_mb)
+        index = (lo + hi) // 2
+    return hi if hi < len(params_sequence) else None
+
+def fit_size_model(points):
+    """
+    Least-squares fit of log(size) = c0 + c1*log(dpi) + c2*log(bg_downsample).
+    With fewer points than free parameters the coefficients fall back to typical MRC behaviour
+    (size roughly proportional to dpi^2 / bg_downsample). Returns a predict(params) function.
+    """
+    prior = [None, 2.0, -1.0]
+    rows = [(math.log(p['dpi']), math.log(p['bg_downsample']), math.log(size)) for p, size in points]
+
+    def solve(columns):
+        # Normal equations for the intercept plus the selected columns
+        free = [c for c in (1, 2) if c in columns]
+        fixed = [c for c in (1, 2) if c not in columns]
+        size_n = len(free) + 1
+        a = [[0.0] * size_n for _ in range(size_n)]
+        b = [0.0] * size_n
+        for row in rows:
+            x = [1.0] + [row[c - 1] for c in free]
+            y = row[2] - sum(prior[c] * row[c - 1] for c in fixed)
+            for i in range(size_n):
+                b[i] += x[i] * y
+                for j in range(size_n):
+                    a[i][j] += x[i] * x[j]
+        # Gaussian elimination; a singular system means the points cannot separate the terms
+        for col in range(size_n):
+            pivot = max(range(col, size_n), key=lambda r: abs(a[r][col]))
+            if abs(a[pivot][col]) < 1e-9:
+                return None
+            a[col], a[pivot] = a[pivot], a[col]
+            b[col], b[pivot] = b[pivot], b[col]
+            for r in range(size_n):
+                if r != col:
+                    factor = a[r][col] / a[col][col]
+                    b[r] -= factor * b[col]
+                    for c in range(col, size_n):
+                        a[r][c] -= factor * a[col][c]
+        coefficients = list(prior)
+        coefficients[0] = b[0] / a[0][0]
+        for i, c in enumerate(free, 1):
+            coefficients[c] = b[i] / a[i][i]
+        return coefficients
+
+    coefficients = None
+    for columns in ((1, 2), (2,), (1,), ()):
+        if len(rows) > len(columns):
+            coefficients = solve(columns)
+            if coefficients is not None:
+                break
+
+    def predict(params):
+        return math.exp(coefficients[0] + coefficients[1] * math.log(params['dpi'])
+                        + coefficients[2] * math.log(params['bg_downsample']))
+    return predict
+
+def model_search(probe, params_sequence, target_size_mb, start_index=0):
+    """
+    Probe start_index, fit a size model to the results so far, jump to the first entry predicted
+    to fit and repeat until the boundary between "exceeds" and "fits" is confirmed.
+    Returns the index of the chosen entry, or None.
+    """
+    count = len(params_sequence)
+    lo, hi = -1, count
+    index = start_index
+    while hi - lo > 1:
+        logging.info(f"--- Model-guided attempt idx={index}: {_describe(params_sequence[index])} ---")
+        result = probe.result(index)
+        if _fits(result, target_size_mb):
+            logging.info(f"Result size: {result[0]:.2f}MB, fits the target (< {target_size_mb}MB)")
+            hi = index
+        else:
+            logging.info(f"Result size: {result[0]:.2f}MB, exceeds the target (< {target_size_mb}MB)" if result else "Rebuild failed")
+            lo = index
+        lo, hi = _tighten(probe, lo, hi, target_size_mb)
+        # Every finished rebuild (including speculative ones) is a data point for the model
+        points = [(params_sequence[i], r[0]) for i, r in probe.known().items() if r is not None and r[0] > 0]
+        if hi - lo <= 1 or not points:
+            index = (lo + hi) // 2
+            continue
+
+        predict = fit_size_model(points)
+        candidates = [i for i in range(lo + 1, hi) if predict(params_sequence[i]) <= target_size_mb]
+        if candidates:
+            index = candidates[0]
+            logging.info(f"Size model predicts idx={index} as the first entry that fits ({predict(params_sequence[index]):.2f}MB)")
+        else:
+            # Nothing predicted to fit before the best known fit: confirm its neighbour
+            index = hi - 1
+    return hi if hi < count else None
+
+def monotone_losers(results, count, target_size_mb):
+    """
+    Candidates that a search for the first fitting entry can no longer choose, assuming sizes
+    shrink along the ladder: everything after the best known fit, and everything up to the
+    last known non-fitting entry before it.
+    """
+    fitting = [index for index in results if _fits(results[index], target_size_mb)]
+    best = min(fitting) if fitting else count
+    failing = [index for index in results if index < best and not _fits(results[index], target_size_mb)]
+    highest_failing = max(failing) if failing else -1
+    return set(range(0, highest_failing + 1)) | set(range(best + 1, count))
+
+def _bisection_order(count, start_index):
+    """Speculation order for binary/model searches: start entry, then a breadth-first bisection."""
+    order = [start_index]
+    ranges = [(-1, count)]
+    while ranges:
+        lo, hi = ranges.pop(0)
+        if hi - lo <= 1:
+            continue
+        mid = (lo + hi) // 2
+        order.append(mid)
+        ranges += [(lo, mid), (mid, hi)]
+    return list(dict.fromkeys(order))
+
+class _CountingRebuild:
+    """Wrap a rebuild function to count how many rebuilds were actually started."""
+
+    def __init__(self, rebuild):
+        self._rebuild = rebuild
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def __call__(self, index):
+        with self._lock:
+            self.count += 1
+        return self._rebuild(index)
+
+def run_search(params_sequence, target_size_mb, rebuild, mode='legacy', speculative_jobs=1, start_index=0):
+    """
+    Search the ladder for the entry to use.
+    rebuild(index) rebuilds with params_sequence[index] and returns (size_mb, output_path), or
+    None on failure. start_index is the first entry probed (0 keeps the legacy order unchanged).
+    Returns a SearchOutcome.
+    """
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"Unknown search mode: {mode}")
+    count = len(params_sequence)
+    start_index = min(max(start_index, 0), count - 1)
+    counting_rebuild = _CountingRebuild(rebuild)
+
+    if speculative_jobs and speculative_jobs > 1:
+        logging.info(f"Speculative search: rebuild up to {speculative_jobs} parameter sets in parallel")
+        if mode == 'legacy' and start_index == 0:
+            # The first and the most aggressive entries are needed on every search path
+            order = list(dict.fromkeys([0, count - 1] + list(range(1, count - 1))))
+            losers = lambda results: legacy_losers(results, count, target_size_mb)
+        elif mode == 'legacy':
+            # Around the predicted start: its neighbours first, alternating up and down
+            order = sorted(range(count), key=lambda index: (abs(index - start_index), index < start_index))
+            losers = lambda results: legacy_losers(results, count, target_size_mb, start_index)
+        else:
+            order = _bisection_order(count, start_index)
+            losers = lambda results: monotone_losers(results, count, target_size_mb)
+        probe = SpeculativeProbe(counting_rebuild, order, speculative_jobs, losers)
+    else:
+        probe = SequentialProbe(counting_rebuild)
+
+    try:
+        if mode == 'legacy':
+            index = legacy_search(probe, params_sequence, target_size_mb, start_index)
+        elif mode == 'binary':
+            index = binary_search(probe, params_sequence, target_size_mb, start_index)
+        else:
+            index = model_search(probe, params_sequence, target_size_mb, start_index)
+        result = probe.result(index) if index is not None else None
+    finally:
+        probe.close()
+
+    outcome = SearchOutcome(
+        index if result is not None else None,
+        result[0] if result is not None else None,
+        result[1] if result is not None else None,
+        counting_rebuild.count
+    )
+    logging.info(f"Search mode '{mode}' used {outcome.rebuilds} rebuilds of {count} parameter sets"
+                 + (f", selected idx={outcome.index}" if outcome.index is not None else ", nothing fits"))
+    return outcome
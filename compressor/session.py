@@ -0,0 +1,361 @@
+# compressor/session.py
+
+"""
+Per-document processing session.
+
+A DocumentSession owns the page images and per-page hOCR of one PDF. The first phase that
+needs them (usually the iterative compression) renders and OCRs the document; every later
+phase - the aggressive fallback and each split count of the splitting protocol - builds its
+image stacks from those artifacts instead of running qpdf/pdftoppm/tesseract again.
+
+OCR runs only once per document, on the first render or, with ocr_resolution, on grayscale copies
+downscaled to that resolution. When a phase needs the pages at another resolution, the existing
+hOCR is rescaled to match, and the page images are derived from a higher-resolution
+render (see compressor.pyramid) or rendered at that resolution. Every compression attempt gets
+images at the DPI of its parameter set.
+
+With color_mode='auto', every page is rendered in the cheapest faithful colour mode (colour,
+grayscale or bitonal, see compressor.colormode).
+
+With use_text_layer, pages that carry a reliable text layer skip OCR: their hOCR is written
+from the PDF text (see compressor.textlayer).
+
+With dedup_pages, blank pages are rendered bitonal and get an empty hOCR, and duplicate pages reuse
+the hOCR of the page they duplicate, and its image when both renders are identical (see
+compressor.dedup).
+
+With pipeline_chunk_pages, the first render and OCR pass runs as a streaming pipeline over page
+chunks (see compressor.streaming), optionally rebuilding the first attempt along the way.
+"""
+
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from . import cache, colormode, dedup, hocr, pipeline, predictor, pyramid, scratch, search, streaming, textlayer, utils
+
+
+class DocumentSession:
+    """Render/OCR artifacts of one PDF, shared by all compression attempts and split parts."""
+
+    def __init__(self, pdf_path, ocr_jobs=None, cache=None, keep_temp_on_failure=False, rebuild_jobs=1,
+                 image_format=pipeline.DEFAULT_IMAGE_FORMAT, pipeline_chunk_pages=0,
+                 pipeline_queue_chunks=streaming.DEFAULT_QUEUE_CHUNKS, use_text_layer=False, color_mode=colormode.COLOR,
+                 dedup_pages=False, ocr_batch_pages=1, ocr_resolution=None):
+        self.pdf_path = Path(pdf_path)
+        self.image_format = image_format  # intermediate page image format (pipeline.IMAGE_FORMATS)
+        self.ocr_jobs = ocr_jobs
+        self.ocr_batch_pages = ocr_batch_pages  # pages per tesseract process (pipeline.ocr_batch)
+        self.ocr_resolution = ocr_resolution  # OCR on grayscale copies at this DPI (None: at the render DPI)
+        self.rebuild_jobs = rebuild_jobs  # recode_pdf processes per rebuild (page ranges in parallel)
+        self.cache = cache
+        self.pipeline_chunk_pages = pipeline_chunk_pages  # pages per chunk of the streaming pipeline (0: off)
+        self.pipeline_queue_chunks = pipeline_queue_chunks
+        self.use_text_layer = use_text_layer  # write hOCR from the PDF text where it is reliable
+        self.color_mode = color_mode  # 'color' renders every page in colour, 'auto' per page
+        self.dedup_pages = dedup_pages  # detect blank and duplicate pages and reuse work for them
+        self.keep_temp_on_failure = keep_temp_on_failure
+        self.temp_dir_str = utils.create_temp_directory()
+        self.temp_dir = Path(self.temp_dir_str)
+        self.ocr_dpi = None    # resolution the hOCR was produced at
+        self._stage_dpi = None  # resolution of the last stage (the phase in progress works at it)
+        self._images = {}      # dpi -> page image paths
+        self._hocr = {}        # dpi -> per-page hOCR paths (None until needed)
+        self._stages = {}      # (dpi, pages) -> (stage_dir, image_files, hocr_file)
+        self._predictor = None
+        self._measured = {}    # (dpi, bg_downsample, encoder) -> size (MB) of a full-document rebuild
+        self._pdf_pages = None
+        self._text_layer = None
+        self._color_modes = None
+        self._page_analysis = None
+        # Speculative and parallel rebuilds stage pages from several threads
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_args(cls, pdf_path, args):
+        """Create a session from the command line arguments."""
+        return cls(
+            pdf_path,
+            ocr_jobs=getattr(args, 'ocr_jobs', None),
+            cache=cache.open_cache(args),
+            keep_temp_on_failure=getattr(args, 'keep_temp_on_failure', False),
+            rebuild_jobs=getattr(args, 'rebuild_jobs', 1) or 1,
+            image_format=getattr(args, 'image_format', None) or pipeline.DEFAULT_IMAGE_FORMAT,
+            pipeline_chunk_pages=getattr(args, 'pipeline_chunk_pages', 0) or 0,
+            pipeline_queue_chunks=getattr(args, 'pipeline_queue_chunks', None) or streaming.DEFAULT_QUEUE_CHUNKS,
+            use_text_layer=not getattr(args, 'no_text_layer', False),
+            color_mode=getattr(args, 'color_mode', None) or colormode.COLOR,
+            dedup_pages=getattr(args, 'dedup_pages', False),
+            ocr_batch_pages=getattr(args, 'ocr_batch_pages', None) or 1,
+            ocr_resolution=getattr(args, 'ocr_dpi', None)
+        )
+
+    @property
+    def page_count(self):
+        """Number of rendered pages (0 before the first prepare())."""
+        for files in list(self._images.values()) + list(self._hocr.values()):
+            return len(files)
+        return 0
+
+    def pdf_page_count(self):
+        """Number of pages of the PDF, known before anything is rendered (0 if it cannot be read)."""
+        if self.page_count:
+            return self.page_count
+        if self._pdf_pages is None:
+            # pdfinfo: hashing the pages for the cache is left to the first render
+            self._pdf_pages = pipeline.get_pdf_page_count(self.pdf_path) or 0
+        return self._pdf_pages
+
+    def text_layer(self, page_count):
+        """
+        The textlayer.TextLayer of the PDF (read once), or None if it is not used or does not
+        match the page_count pages that were rendered.
+        """
+        if not self.use_text_layer:
+            return None
+        if self._text_layer is None:
+            self._text_layer = textlayer.extract(self.pdf_path, self.temp_dir) or False
+        if self._text_layer and len(self._text_layer.pages) != page_count:
+            logging.warning(f"The text layer has {len(self._text_layer.pages)} pages, the PDF {page_count}: OCR every page")
+            self._text_layer = False
+        return self._text_layer or None
+
+    def page_analysis(self):
+        """The dedup.PageAnalysis of the PDF (made once) with dedup_pages, else None."""
+        if not self.dedup_pages:
+            return None
+        if self._page_analysis is None:
+            self._page_analysis = dedup.analyze_pdf(self.pdf_path, self.pdf_page_count()) or False
+        return self._page_analysis or None
+
+    def page_color_modes(self):
+        """
+        Colour mode of every page (classified once) with color_mode='auto' or when blank pages
+        are rendered bitonal, else None.
+        """
+        if self._color_modes is None:
+            modes = None
+            if self.color_mode == 'auto':
+                modes = colormode.classify_pages(self.pdf_path, self.pdf_page_count())
+            analysis = self.page_analysis()
+            if analysis and analysis.blank:
+                modes = analysis.color_modes(modes)
+            self._color_modes = modes or False
+        return self._color_modes or None
+
+    def prepare(self, dpi):
+        """
+        Make page images and hOCR available at the given DPI.
+        Renders (or derives from a higher resolution) the pages if needed; tesseract only runs
+        the first time.
+        Returns True on success.
+        """
+        with self._lock:
+            return dpi in self._images or self._prepare(dpi)
+
+    def stream(self, dpi, params, output_pdf_path):
+        """
+        Render and OCR the pages at dpi in the streaming pipeline, rebuilding them with params into
+        output_pdf_path chunk by chunk while later chunks are still rendered and OCRed.
+        Only the first OCR pass of a session with pipeline_chunk_pages streams. Returns True if
+        output_pdf_path was built; otherwise the caller rebuilds from stage() as usual. After a
+        failed stream, the session renders and OCRs the whole document at once instead.
+        """
+        with self._lock:
+            if not self.pipeline_chunk_pages or self.ocr_dpi is not None:
+                return False
+            render_dir = self.temp_dir / f"render_{dpi}"
+            render_dir.mkdir(exist_ok=True)
+            result = self._prepare_streaming(dpi, render_dir, (params, output_pdf_path))
+            return bool(result and result.rebuilt)
+
+    def _prepare(self, dpi):
+        render_dir = self.temp_dir / f"render_{dpi}"
+        render_dir.mkdir(exist_ok=True)
+        if self.ocr_dpi is None and self.pipeline_chunk_pages:
+            if self._prepare_streaming(dpi, render_dir) is not None:
+                return True
+        image_files = None
+        source_dpi = min((d for d in self._images if d > dpi), default=None)
+        if source_dpi is not None and pyramid.available():
+            image_files = pyramid.build_level(self._images[source_dpi], render_dir, source_dpi, dpi)
+        if image_files is None:
+            image_files = pipeline.deconstruct_pdf_to_images(self.pdf_path, render_dir, dpi, cache=self.cache, image_format=self.image_format,
+                                                             color_modes=self.page_color_modes())
+        if not image_files:
+            return False
+        if self.page_count and len(image_files) != self.page_count:
+            logging.error(f"Page count mismatch between renders: {len(image_files)} != {self.page_count}")
+            return False
+        self._images[dpi] = image_files
+
+        if self.ocr_dpi is None:
+            logging.info(f"Phase 2 [Analysis]: Start OCR on {len(image_files)} images...")
+            hocr_files = pipeline.ocr_images(image_files, render_dir, jobs=self.ocr_jobs, cache=self.cache,
+                                             text_layer=self.text_layer(len(image_files)), dpi=dpi,
+                                             page_analysis=self.page_analysis(), batch_pages=self.ocr_batch_pages,
+                                             ocr_dpi=self.ocr_resolution)
+            if hocr_files is None:
+                del self._images[dpi]
+                return False
+            self.ocr_dpi = dpi
+            self._hocr[dpi] = hocr_files
+        elif dpi not in self._hocr:
+            logging.info(f"Reuse the hOCR produced at DPI={self.ocr_dpi} for the DPI={dpi} render")
+            self._hocr[dpi] = [None] * len(image_files)
+        return True
+
+    def _prepare_streaming(self, dpi, render_dir, rebuild=()):
+        """Render and OCR the pages at dpi chunk by chunk; returns the streaming.StreamResult, or None."""
+        page_count = self.pdf_page_count()
+        if not page_count:
+            return None
+        stream = streaming.StreamingPipeline(
+            self.pdf_path, render_dir, dpi, page_count, chunk_pages=self.pipeline_chunk_pages,
+            queue_chunks=self.pipeline_queue_chunks, ocr_jobs=self.ocr_jobs, rebuild_jobs=self.rebuild_jobs,
+            cache=self.cache, image_format=self.image_format, text_layer=self.text_layer(page_count),
+            color_modes=self.page_color_modes(), page_analysis=self.page_analysis(), ocr_dpi=self.ocr_resolution)
+        result = stream.run(*rebuild)
+        if result is None:
+            # Do not stream the same pages again: the next prepare() takes the batch path
+            logging.warning("Streaming pipeline failed, render and OCR the document in one pass instead")
+            self.pipeline_chunk_pages = 0
+            return None
+        self._images[dpi] = result.image_files
+        self._hocr[dpi] = result.hocr_files
+        self.ocr_dpi = dpi
+        return result
+
+    def page_images(self, dpi):
+        """Page images rendered at `dpi` (after prepare(dpi))."""
+        return list(self._images[dpi])
+
+    def _page_hocr(self, dpi, page):
+        """Per-page hOCR file at the given DPI, rescaled from the OCR resolution on first use."""
+        hocr_files = self._hocr[dpi]
+        if hocr_files[page - 1] is None:
+            source = self._hocr[self.ocr_dpi][page - 1]
+            target = self.temp_dir / f"render_{dpi}" / source.name
+            hocr.rescale_hocr_file(source, target, dpi / self.ocr_dpi)
+            scratch.record('hocr', target)
+            hocr_files[page - 1] = target
+        return hocr_files[page - 1]
+
+    def stage(self, dpi, first_page=1, last_page=None):
+        """
+        Lay out pages first_page..last_page (1-based, inclusive) rendered at `dpi` as an image
+        stack for recode_pdf, together with their merged hOCR.
+        Returns (stage_dir, image_files, hocr_file), or None on failure.
+        """
+        if not self.prepare(dpi):
+            return None
+        last_page = last_page or self.page_count
+        return self.stage_pages(dpi, range(first_page, last_page + 1), name=f"{first_page}-{last_page}")
+
+    def stage_pages(self, dpi, pages, name=None):
+        """
+        Like stage(), for an arbitrary list of pages (e.g. a sample spread over the document).
+        `name` identifies the stage directory; by default it is a hash of the page numbers.
+        """
+        with self._lock:
+            return self._stage_pages(dpi, list(pages), name)
+
+    def _stage_pages(self, dpi, pages, name):
+        if not self.prepare(dpi):
+            return None
+        self._stage_dpi = dpi
+        key = (dpi, tuple(pages))
+        if key in self._stages:
+            return self._stages[key]
+
+        if name is None:
+            digest = hashlib.sha1(",".join(map(str, pages)).encode()).hexdigest()[:12]
+            name = f"sel{len(pages)}_{digest}"
+        stage_dir = self.temp_dir / f"stage_{dpi}_{name}"
+        stage_dir.mkdir(exist_ok=True)
+        width = len(str(len(pages)))
+        image_files = []
+        hocr_files = []
+        copies = []
+        analysis = self.page_analysis()
+        for index, page in enumerate(pages, 1):
+            # Duplicates with an identical render are staged from their original's image file
+            source_page = analysis.source_page(page, self._images[dpi]) if analysis else page
+            source = self._images[dpi][source_page - 1]
+            staged = stage_dir / f"page-{index:0{width}d}{source.suffix}"
+            if not staged.exists():
+                utils.link_or_copy(source, staged)
+                if staged.stat().st_nlink == 1:
+                    copies.append(staged)  # hard links take no scratch space
+            image_files.append(staged)
+            hocr_files.append(self._page_hocr(dpi, page))
+
+        hocr_file = stage_dir / "combined.hocr"
+        try:
+            hocr.merge_hocr_files(hocr_files, hocr_file)
+        except (IOError, hocr.HocrError) as e:
+            logging.error(f"Error merging hOCR files: {e}")
+            return None
+        scratch.record('stage', hocr_file, *copies)
+
+        self._stages[key] = (stage_dir, image_files, hocr_file)
+        return self._stages[key]
+
+    def trim_scratch(self):
+        """
+        Between phases, when the scratch usage is above the budget: delete the page images and
+        stage directories of the session, lowest resolution first, until the usage is within
+        the budget. The resolution of the last stage and the OCR resolution (the render the
+        hOCR coordinates refer to) go last, since the next phase is the most likely to need
+        them. Dropped images are restored from the page cache or rendered again when needed;
+        the hOCR is kept. Must not run while rebuilds of the session are in progress.
+        """
+        ledger = scratch.ledger()
+        with self._lock:
+            protected = [dpi for dpi in (self._stage_dpi, self.ocr_dpi) if dpi in self._images]
+            order = [dpi for dpi in sorted(self._images) if dpi not in protected] + list(dict.fromkeys(protected))
+            for dpi in order:
+                if not ledger.over_budget():
+                    break
+                for key in [key for key in self._stages if key[0] == dpi]:
+                    utils.cleanup_directory(str(self._stages.pop(key)[0]))
+                images = self._images.pop(dpi)
+                scratch.discard(*images)
+                logging.info(f"Scratch budget: dropped the DPI={dpi} page images ({len(images)} pages)")
+
+    @property
+    def size_predictor(self):
+        """Output size predictor working on page samples of this session (created on first use)."""
+        if self._predictor is None:
+            self._predictor = predictor.SizePredictor(self)
+        return self._predictor
+
+    @staticmethod
+    def _size_key(params):
+        return (params['dpi'], params['bg_downsample'], params.get('jpeg2000_encoder', 'openjpeg'))
+
+    def record_size(self, params, size_mb):
+        """Remember the size of a full-document rebuild with params."""
+        with self._lock:
+            self._measured[self._size_key(params)] = (params, size_mb)
+
+    def estimate_size(self, params):
+        """
+        Size (MB) of a full-document rebuild with params: measured, or modelled from the rebuilds
+        measured so far (see search.fit_size_model). None before the first rebuild.
+        """
+        with self._lock:
+            measured = dict(self._measured)
+        if self._size_key(params) in measured:
+            return measured[self._size_key(params)][1]
+        points = [(p, size_mb) for p, size_mb in measured.values() if size_mb > 0]
+        return search.fit_size_model(points)(params) if points else None
+
+    def close(self, success=True):
+        """Remove the session's temporary files (kept for debugging when requested)."""
+        if self.cache:
+            self.cache.log_stats()
+        if self.keep_temp_on_failure and not success:
+            logging.info(f"Keep session temporary directory for debugging: {self.temp_dir_str}")
+        else:
+            utils.cleanup_directory(self.temp_dir_str)
@@ -0,0 +1,111 @@
+# compressor/split_planner.py
+
+"""
+Size-aware split planning.
+
+Every page gets an estimated compressed cost in MB. The cost of a page is proportional to how
+well its rendered image compresses with zlib (photos compress badly, text pages well), scaled so
+that the costs add up to the measured or predicted size of the whole document. The planner then
+computes the smallest number of contiguous parts whose cost fits the per-part capacity and
+balances the part boundaries so that the largest part is as small as possible. When no plan
+within the maximum number of parts fits (the estimates are rough), the best plan with the
+maximum number of parts is returned, so it is still tried.
+"""
+
+import logging
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from . import resources
+
+READ_CHUNK = 1024 * 1024
+
+
+def image_complexity(image_path):
+    """Size in bytes of the image file after fast zlib compression."""
+    compressor = zlib.compressobj(1)
+    size = 0
+    with open(image_path, 'rb') as f:
+        while True:
+            chunk = f.read(READ_CHUNK)
+            if not chunk:
+                break
+            size += len(compressor.compress(chunk))
+    return size + len(compressor.flush())
+
+
+def page_costs(image_files, total_size_mb, jobs=None):
+    """
+    Estimated compressed size (MB) of every page: the zlib complexity of its image, scaled so
+    that the costs add up to total_size_mb.
+    """
+    jobs = jobs or resources.budget().cpus
+    # zlib releases the GIL, so threads compress pages in parallel
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        complexity = list(executor.map(image_complexity, image_files))
+    scale = total_size_mb / max(sum(complexity), 1)
+    return [c * scale for c in complexity]
+
+
+def _greedy_parts(costs, capacity):
+    """Fill contiguous parts up to capacity. Returns the index of the first page of every part."""
+    starts = [0]
+    current = 0.0
+    for index, cost in enumerate(costs):
+        if current + cost > capacity and current > 0:
+            starts.append(index)
+            current = 0.0
+        current += cost
+    return starts
+
+
+def min_parts(costs, capacity):
+    """
+    The smallest number of contiguous parts with a cost of at most capacity each
+    (greedy filling is optimal for contiguous parts), or None if a single page exceeds it.
+    """
+    if any(cost > capacity for cost in costs):
+        return None
+    return len(_greedy_parts(costs, capacity))
+
+
+def partition(costs, k):
+    """
+    Split the pages into at most k contiguous parts minimizing the largest part cost
+    (linear partition, solved by bisection on the largest part cost).
+    Returns 1-based inclusive page ranges [(first_page, last_page), ...].
+    """
+    low = max(costs)
+    high = sum(costs)
+    for _ in range(60):
+        if high - low <= 1e-9 * max(high, 1e-9):
+            break
+        middle = (low + high) / 2
+        if len(_greedy_parts(costs, middle)) <= k:
+            high = middle
+        else:
+            low = middle
+    starts = _greedy_parts(costs, high)
+    ends = starts[1:] + [len(costs)]
+    return [(start + 1, end) for start, end in zip(starts, ends)]
+
+
+def plan_split(costs, capacity, max_parts):
+    """
+    Plan the page ranges of the smallest feasible number of parts.
+    Returns the list of (first_page, last_page). If no plan with at most max_parts parts fits
+    the capacity, the max_parts-part plan with the smallest largest part is returned instead.
+    """
+    k = min_parts(costs, capacity)
+    if k is None or k > max_parts:
+        if k is None:
+            logging.warning(f"A single page is estimated above the part capacity of {capacity:.2f}MB")
+        else:
+            logging.warning(f"At least {k} parts are needed, more than the maximum of {max_parts}")
+        k = max_parts
+    k = max(k, min(2, len(costs)))
+    ranges = partition(costs, k)
+    for first_page, last_page in ranges:
+        part_cost = sum(costs[first_page - 1:last_page])
+        logging.info(f"Planned part: page {first_page}-{last_page}, estimated {part_cost:.2f}MB")
+    return ranges
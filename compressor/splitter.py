@@ -2,9 +2,9 @@
 
 import logging
 import math
-import tempfile
 from pathlib import Path
-from . import utils, strategy, pipeline
+from . import accounting, utils, strategy, pipeline, split_planner, trace
+from .session import DocumentSession
 
 def split_pdf(pdf_path, output_path, start_page, end_page):
     """
@@ -20,13 +20,24 @@ def split_pdf(pdf_path, output_path, start_page, end_page):
         "--",
         str(output_path)
     ]
-    return utils.run_command(command)
+    return utils.run_command(command, stage='split', outputs=[output_path])
 
-def calculate_split_strategy(total_size_mb, max_splits):
+# Parts are planned to come out at most this fraction of the target size
+SPLIT_HEADROOM = 0.9
+
+def calculate_split_strategy(total_size_mb, max_splits, target_size_mb=None, predicted_size_mb=None):
     """
     Calculate the optimal split strategy based on file size.
+    With a predicted compressed size of the whole document (at the split parts' parameters),
+    the number of parts is derived from it instead of the input size.
     Returns the recommended initial number of splits.
     """
+    if predicted_size_mb is not None and target_size_mb:
+        initial_k = min(max_splits, math.ceil(predicted_size_mb / (target_size_mb * SPLIT_HEADROOM)))
+        initial_k = max(initial_k, 2)
+        logging.info(f"Predicted compressed size {predicted_size_mb:.2f}MB, recommended initial number of splits: {initial_k}")
+        return initial_k
+
     #Heuristic algorithm: Assume that a 25MB block is more likely to be compressed to 2MB
     estimated_chunk_size = 25
     initial_k = min(max_splits, math.ceil(total_size_mb / estimated_chunk_size))
@@ -38,9 +49,17 @@ def calculate_split_strategy(total_size_mb, max_splits):
     logging.info(f"File size {total_size_mb:.2f}MB, recommended initial number of splits: {initial_k}")
     return initial_k
 
-def run_splitting_protocol(pdf_path, output_dir, args):
+# A part that fails has its page costs raised by at least this factor before replanning
+FAILED_PART_COST_FACTOR = 1.25
+MAX_REPLANS = 3
+
+def run_splitting_protocol(pdf_path, output_dir, args, session=None):
     """
     Execute split agreement.
+    The page ranges come from the size-aware split planner (see compressor.split_planner); when
+    the page costs cannot be estimated, the document is cut into equal page counts instead.
+    session (DocumentSession, optional) carries the images and hOCR of earlier phases; every split
+    count builds its parts from it, so the document is rendered and OCRed at most once.
     """
     logging.info(f"Start emergency splitting protocol for {pdf_path.name}...")
     
@@ -52,64 +71,152 @@ def run_splitting_protocol(pdf_path, output_dir, args):
 
     logging.info(f"Total number of PDF pages: {total_pages}")
     
-    # Calculate initial split strategy
-    original_size_mb = utils.get_file_size_mb(pdf_path)
-    initial_k = calculate_split_strategy(original_size_mb, args.max_splits)
+    own_session = session is None
+    if own_session:
+        session = DocumentSession.from_args(pdf_path, args)
+    success = False
+    try:
+        costs = _estimate_page_costs(session, args)
+        if costs is not None:
+            success = _run_planned_splits(pdf_path, output_dir, args, costs, session)
+            return success
 
-    # Try different number of splits
-    for k in range(initial_k, args.max_splits + 1):
-        logging.info(f"=== try to split into {k} parts ===")
-        
-        if not try_split_and_compress(pdf_path, output_dir, args, k, total_pages):
-            logging.warning(f"Failed to split into {k} parts, try increasing the number of splits...")
-            continue
-        else:
-            logging.info(f"{pdf_path.name} was successfully split into {k} parts and all compressed successfully!")
+        # Calculate initial split strategy
+        original_size_mb = utils.get_file_size_mb(pdf_path)
+        initial_k = calculate_split_strategy(
+            original_size_mb, args.max_splits, args.target_size,
+            _predict_split_size(session, args)
+        )
+
+        # Try different number of splits
+        for k in range(initial_k, args.max_splits + 1):
+            logging.info(f"=== try to split into {k} parts ===")
+            
+            if not try_split_and_compress(pdf_path, output_dir, args, k, total_pages, session):
+                logging.warning(f"Failed to split into {k} parts, try increasing the number of splits...")
+                continue
+            else:
+                logging.info(f"{pdf_path.name} was successfully split into {k} parts and all compressed successfully!")
+                success = True
+                return True
+
+        logging.error(f"Split protocol failed: Compression could not be completed even when split into {args.max_splits} parts.")
+        return False
+    finally:
+        if own_session:
+            session.close(success)
+
+def _run_planned_splits(pdf_path, output_dir, args, costs, session):
+    """
+    Compress the parts planned from the page costs. A failing part means its pages were
+    underestimated: their costs are raised and the split is planned again. When the estimates
+    call for more than args.max_splits parts, the most balanced max_splits-part plan is tried.
+    """
+    capacity = args.target_size * SPLIT_HEADROOM
+    failed_ranges = []
+    for attempt in range(MAX_REPLANS + 1):
+        part_ranges = split_planner.plan_split(costs, capacity, args.max_splits)
+        if part_ranges in failed_ranges:
+            break
+        logging.info(f"=== split into {len(part_ranges)} planned parts ===")
+        with trace.span(f"split into {len(part_ranges)} planned parts", 'split'):
+            success, failed_range = compress_parts(pdf_path, output_dir, args, part_ranges, session)
+        if success:
+            logging.info(f"{pdf_path.name} was successfully split into {len(part_ranges)} parts and all compressed successfully!")
             return True
+        if failed_range is None:
+            break
+        failed_ranges.append(part_ranges)
+
+        first_page, last_page = failed_range
+        estimated = sum(costs[first_page - 1:last_page])
+        factor = max(FAILED_PART_COST_FACTOR, capacity / max(estimated, 1e-9) * FAILED_PART_COST_FACTOR)
+        logging.warning(f"Part with pages {first_page}-{last_page} did not fit, raise its page cost estimates by {factor:.2f}x and plan again")
+        for page in range(first_page, last_page + 1):
+            costs[page - 1] *= factor
 
-    logging.error(f"Split protocol failed: Compression could not be completed even when split into {args.max_splits} parts.")
+    logging.error(f"Split protocol failed: no plan with at most {args.max_splits} parts could be compressed to the target size.")
     return False
 
-def try_split_and_compress(pdf_path, output_dir, args, k, total_pages):
+def _predict_split_size(session, args):
     """
-    Try splitting the PDF into k parts and compressing each part.
+    Predicted size of the whole document at the first split part parameters (upper end of the
+    confidence interval), or None when prediction is disabled or not worthwhile.
+    """
+    if getattr(args, 'no_predict', False):
+        return None
+    params = strategy.AGGRESSIVE_PARAMS[0]
+    if not session.prepare(params['dpi']) or not session.size_predictor.enabled():
+        return None
+    prediction = session.size_predictor.predict(params)
+    return prediction.high_mb if prediction else None
+
+def _estimate_page_costs(session, args):
+    """
+    Estimated compressed size of every page at the first split part parameters, or None.
+    The total comes from the size predictor, or is modelled from the full-document rebuilds of
+    the iterative compression; without either, nothing is rebuilt just to calibrate and the
+    caller cuts equal page counts.
+    """
+    params = strategy.AGGRESSIVE_PARAMS[0]
+    if not session.prepare(params['dpi']):
+        return None
+    total_mb = _predict_split_size(session, args)
+    if total_mb is None:
+        total_mb = session.estimate_size(params)
+        if total_mb is None:
+            return None
+        logging.info(f"Document size at the split part parameters estimated from earlier rebuilds: {total_mb:.2f}MB")
+    try:
+        costs = split_planner.page_costs(session.page_images(params['dpi']), total_mb)
+    except OSError as e:
+        logging.warning(f"Unable to estimate page costs, fall back to equal page counts: {e}")
+        return None
+    logging.info(f"Estimated page costs for a {total_mb:.2f}MB document: largest page {max(costs):.2f}MB")
+    return costs
+
+def try_split_and_compress(pdf_path, output_dir, args, k, total_pages, session):
+    """
+    Try splitting the PDF into k parts of equal page counts and compressing each part.
     """
     pages_per_split = math.ceil(total_pages / k)
+    part_ranges = []
+    for i in range(k):
+        start_page = i * pages_per_split + 1
+        end_page = min((i + 1) * pages_per_split, total_pages)
+        
+        if start_page > total_pages:
+            break
+
+        part_ranges.append((start_page, end_page))
+    with trace.span(f"split into {k} parts", 'split'):
+        success, _ = compress_parts(pdf_path, output_dir, args, part_ranges, session)
+    return success
+
+def compress_parts(pdf_path, output_dir, args, part_ranges, session):
+    """
+    Compress each page range of the session as one part.
+    The parts are page ranges of the session, no intermediate PDF files are written.
+    Return (bool, tuple): (whether all parts succeeded, page range of the first failing part)
+    """
     split_files = []
-    temp_split_files = []
-    
-    #Create a temporary directory to store split files
-    temp_dir_str = utils.create_temp_directory()
-    temp_dir = Path(temp_dir_str)
     
     try:
-        # Phase 1: Split PDF
-        for i in range(k):
-            start_page = i * pages_per_split + 1
-            end_page = min((i + 1) * pages_per_split, total_pages)
-            
-            if start_page > total_pages:
-                break
+        for i, (start_page, end_page) in enumerate(part_ranges):
+            logging.info(f"Part {i+1}: page {start_page}-{end_page}")
 
-            part_path = temp_dir / f"{pdf_path.stem}_temp_part{i+1}.pdf"
-            
-            # Split PDF
-            if not split_pdf(pdf_path, part_path, start_page, end_page):
-                logging.error(f"Splitting part {i+1} failed.")
-                return False
-            
-            temp_split_files.append(part_path)
-            logging.info(f"Part {i+1} was successfully split (page {start_page}-{end_page})")
-
-        # Second stage: compress each split file
-        for i, part_path in enumerate(temp_split_files):
+        # Compress each part
+        for i, (start_page, end_page) in enumerate(part_ranges):
+            part_path = pdf_path.with_name(f"{pdf_path.stem}_temp_part{i+1}.pdf")
             logging.info(f"Start compressing part {i+1}: {part_path.name}")
             
-            # Use aggressive compression strategy for split files (pass keep_temp_on_failure)
-            keep_temp = getattr(args, 'keep_temp_on_failure', False)
-            success, compressed_path = strategy.run_aggressive_compression(
-                part_path, output_dir, args.target_size, keep_temp_on_failure=keep_temp
-            )
+            # Use aggressive compression strategy for split parts
+            with accounting.tagged(part=i + 1, pages=f"{start_page}-{end_page}"), \
+                    trace.span(f"part {i + 1}", 'part', pages=f"{start_page}-{end_page}"):
+                success, compressed_path = strategy.run_aggressive_compression(
+                    part_path, output_dir, args.target_size,
+                    session=session, page_range=(start_page, end_page)
+                )
 
             if success:
                 # Rename to final file name
@@ -130,11 +237,11 @@ def try_split_and_compress(pdf_path, output_dir, args, k, total_pages):
                 for success_file in split_files:
                     if success_file.exists():
                         success_file.unlink()
-                return False
+                return False, (start_page, end_page)
 
         # All parts successful
         logging.info(f"All {len(split_files)} parts have been compressed successfully")
-        return True
+        return True, None
         
     except Exception as e:
         logging.error(f"An error occurred during splitting and compression: {e}")
@@ -142,15 +249,7 @@ def try_split_and_compress(pdf_path, output_dir, args, k, total_pages):
         for success_file in split_files:
             if success_file.exists():
                 success_file.unlink()
-        return False
-    finally:
-        # Clean up the temporary directory (skip cleanup if user asks to keep it on failure)
-        keep_temp = getattr(args, 'keep_temp_on_failure', False)
-        # If retention is required and a failure occurs, retain the temporary directory
-        if keep_temp:
-            logging.info(f"Keep split temporary directory for debugging: {temp_dir_str}")
-        else:
-            utils.cleanup_directory(temp_dir_str)
+        return False, None
 
 def estimate_compression_feasibility(pdf_path, target_size_mb):
     """
@@ -1,9 +1,9 @@
 # compressor/strategy.py
 
 import logging
-import tempfile
 from pathlib import Path
-from . import utils, pipeline
+from . import accounting, utils, pipeline, predictor, scratch, search, allocator, trace
+from .session import DocumentSession
 
 # Define compression strategies at different levels
 STRATEGIES = {
@@ -40,6 +40,15 @@ STRATEGIES = {
     }
 }
 
+# Parameters for split parts, most to least quality
+AGGRESSIVE_NAME = "Aggressive compression"
+AGGRESSIVE_PARAMS = [
+    {'dpi': 150, 'bg_downsample': 4},
+    {'dpi': 150, 'bg_downsample': 5},
+    {'dpi': 120, 'bg_downsample': 3},
+    {'dpi': 100, 'bg_downsample': 2},
+]
+
 def determine_tier(size_mb):
     """Determine the processing level based on file size."""
     if 2 <= size_mb < 10:
@@ -50,9 +59,17 @@ def determine_tier(size_mb):
         return 3
     return 0 # Less than 2MB or invalid value
 
-def run_iterative_compression(pdf_path, output_dir, target_size_mb, keep_temp_on_failure=False):
+def run_iterative_compression(pdf_path, output_dir, target_size_mb, keep_temp_on_failure=False, ocr_jobs=None, cache=None, session=None, speculative_jobs=1, search_mode='legacy', predict=True, allocate=False):
     """
     Execute an iterative compression process.
+    With allocate, a per-page parameter plan (see compressor.allocator) is rebuilt first; the
+    ladder search only runs if the plan does not meet the target.
+    With predict, large documents first rebuild a page sample to predict the output sizes and
+    the search starts at the first parameter set predicted to fit (see compressor.predictor).
+    search_mode is one of search.SEARCH_MODES ('legacy', 'binary', 'model').
+    speculative_jobs > 1 rebuilds that many parameter sets in parallel (same result, less waiting).
+    session (DocumentSession, optional) supplies the page images and hOCR; if omitted, a private
+    session configured with ocr_jobs, cache and keep_temp_on_failure is used for this call.
     Return (bool, Path): (whether successful, output file path)
     """
     original_size_mb = utils.get_file_size_mb(pdf_path)
@@ -67,153 +84,184 @@ def run_iterative_compression(pdf_path, output_dir, target_size_mb, keep_temp_on
 
     # To avoid generating hOCR repeatedly for each attempt, we first choose the highest dpi for OCR and generate hOCR only once
     max_dpi = max(p['dpi'] for p in strategy['params_sequence'])
-    temp_dir_str = utils.create_temp_directory()
-    temp_dir = Path(temp_dir_str)
+    own_session = session is None
+    if own_session:
+        session = DocumentSession(pdf_path, ocr_jobs=ocr_jobs, cache=cache, keep_temp_on_failure=keep_temp_on_failure)
+    success = False
     try:
+        # A streaming session rebuilds the first ladder entry while its pages are rendered and OCRed,
+        # when the search is known to probe it first (no allocation plan, no predicted start)
+        prebuilt = {}
+        first_params = strategy['params_sequence'][0]
+        if (session.pipeline_chunk_pages and not allocate and first_params['dpi'] == max_dpi
+                and not (predict and session.pdf_page_count() >= predictor.MIN_PAGES_FOR_PREDICTION)):
+            output_pdf_path = session.temp_dir / f"output_{pdf_path.stem}_0.pdf"
+            with accounting.tagged(strategy=strategy['name'], attempt=1, params=dict(first_params)), \
+                    trace.span("attempt 1 (streamed)", 'attempt', strategy=strategy['name'], **first_params):
+                streamed = session.stream(max_dpi, first_params, output_pdf_path)
+            if streamed:
+                prebuilt[0] = (utils.get_file_size_mb(output_pdf_path), output_pdf_path)
+
         logging.info(f"Generate one-time images and hOCR (using DPI={max_dpi}) for reuse across all attempts")
-        # Generate image (using highest dpi) and run OCR once
-        image_files = pipeline.deconstruct_pdf_to_images(pdf_path, temp_dir, max_dpi)
-        if not image_files:
-            logging.error("Failed while generating image for hOCR, terminating compression process.")
+        staged = session.stage(max_dpi)
+        if not staged:
+            logging.error("Failed to generate images and hOCR, terminate the compression process.")
             return False, None
+        logging.info(f"The hOCR file will be reused: {staged[2]}")
 
-        hocr_file = pipeline.analyze_images_to_hocr(image_files, temp_dir)
-        if not hocr_file:
-            logging.error("Failed to generate hOCR file, terminate the compression process.")
-            return False, None
+        if allocate:
+            success, final_path = _allocate_per_page(pdf_path, output_dir, target_size_mb, strategy, session, max_dpi)
+            if success:
+                return success, final_path
+            logging.info("Per-page allocation did not meet the target, fall back to the parameter search")
 
-        logging.info(f"The hOCR file will be reused: {hocr_file}")
+        start_index = 0
+        if predict:
+            start_index = session.size_predictor.start_index(strategy['params_sequence'], target_size_mb)
 
-        # First perform the 1st attempt
-        first_params = strategy['params_sequence'][0]
-        encoder = first_params.get('jpeg2000_encoder', 'openjpeg')
-        logging.info(f"--- First try (conservative): DPI={first_params['dpi']}, BG-Downsample={first_params['bg_downsample']}, JPEG2000={encoder} ---")
-        output_pdf_path = temp_dir / f"output_{pdf_path.stem}_first.pdf"
-        if pipeline.reconstruct_pdf(image_files, hocr_file, temp_dir, first_params, output_pdf_path):
-            result_size_mb = utils.get_file_size_mb(output_pdf_path)
-            logging.info(f"First attempt result size: {result_size_mb:.2f}MB (target: < {target_size_mb}MB)")
-            if result_size_mb <= target_size_mb:
-                final_path = output_dir / f"{pdf_path.stem}_compressed.pdf"
-                final_path.parent.mkdir(parents=True, exist_ok=True)
-                utils.copy_file(output_pdf_path, final_path)
-                logging.info(f"Success! The file has been compressed and saved to: {final_path}")
-                return True, final_path
-
-            # If it is far from the target (threshold: 1.5x), directly try the most aggressive parameters
-            threshold_factor = 1.5
-            if result_size_mb > target_size_mb * threshold_factor:
-                logging.info("The first result is far from the target, try the most aggressive strategy directly")
-                last_index = len(strategy['params_sequence']) - 1
-                last_params = strategy['params_sequence'][last_index]
-                logging.info(f"--- Directly try the most aggressive parameters: DPI={last_params['dpi']}, BG-Downsample={last_params['bg_downsample']} ---")
-                last_output = temp_dir / f"output_{pdf_path.stem}_last.pdf"
-                if not pipeline.reconstruct_pdf(image_files, hocr_file, temp_dir, last_params, last_output):
-                    logging.error("The most aggressive parameter attempt failed, and the overall compression failed.")
-                    return False, None
-
-                last_size = utils.get_file_size_mb(last_output)
-                logging.info(f"Most aggressive attempt result size: {last_size:.2f}MB (target: < {target_size_mb}MB)")
-                if last_size > target_size_mb:
-                    logging.error("The most aggressive attempt still failed to reach the goal and declared failure.")
-                    return False, None
-
-                # The most aggressive success, backtracking upward to improve quality
-                logging.info("The most aggressive attempt was successful, starting to backtrack upwards to try higher quality parameters")
-                # Backtrack from last_index-1 to 0 until the first one that does not meet the goal is found
-                chosen_path = last_output
-                for idx in range(last_index - 1, -1, -1):
-                    params = strategy['params_sequence'][idx]
-                    logging.info(f"--- Backtrace attempt idx={idx}: DPI={params['dpi']}, BG-Downsample={params['bg_downsample']} ---")
-                    test_output = temp_dir / f"output_{pdf_path.stem}_back_{idx}.pdf"
-                    if not pipeline.reconstruct_pdf(image_files, hocr_file, temp_dir, params, test_output):
-                        logging.warning(f"Backtracking attempt idx={idx} failed to rebuild, retaining the previous successful result")
-                        break
-                    test_size = utils.get_file_size_mb(test_output)
-                    logging.info(f"Backtracking attempt result size: {test_size:.2f}MB")
-                    if test_size <= target_size_mb:
-                        chosen_path = test_output
-                    else:
-                        # If the current quality exceeds the target, stop backtracking and use the last successful result.
-                        logging.info("The current backtracking attempt exceeds the target, stop backtracking, and use the last successful result")
-                        break
-
-                final_path = output_dir / f"{pdf_path.stem}_compressed.pdf"
-                final_path.parent.mkdir(parents=True, exist_ok=True)
-                utils.copy_file(chosen_path, final_path)
-                logging.info(f"Success! The final file has been saved to: {final_path}")
-                return True, final_path
-
-            # Otherwise continue the subsequent configuration in order (try sequentially starting from 2)
+        success, final_path = _search_params_sequence(
+            pdf_path, output_dir, target_size_mb, strategy, session.stage,
+            speculative_jobs=speculative_jobs, search_mode=search_mode, start_index=start_index,
+            rebuild_jobs=session.rebuild_jobs, prebuilt=prebuilt, on_rebuilt=session.record_size
+        )
+        return success, final_path
+    finally:
+        if own_session:
+            session.close(success)
         else:
-            logging.warning("The first attempt to rebuild failed, continue to try subsequent parameters in sequence")
-
-        # Try the remaining configurations in order (starting with the second item)
-        for i in range(1, len(strategy['params_sequence'])):
-            params = strategy['params_sequence'][i]
-            encoder = params.get('jpeg2000_encoder', 'openjpeg')
-            logging.info(f"--- Sequential attempts {i+1}/{len(strategy['params_sequence'])}: DPI={params['dpi']}, BG-Downsample={params['bg_downsample']}, JPEG2000={encoder} ---")
-            output_pdf_path = temp_dir / f"output_{pdf_path.stem}_{i}.pdf"
-            try:
-                if not pipeline.reconstruct_pdf(image_files, hocr_file, temp_dir, params, output_pdf_path):
-                    continue
-                result_size_mb = utils.get_file_size_mb(output_pdf_path)
-                logging.info(f"Try result size: {result_size_mb:.2f}MB (target: < {target_size_mb}MB)")
-                if result_size_mb <= target_size_mb:
-                    final_path = output_dir / f"{pdf_path.stem}_compressed.pdf"
-                    final_path.parent.mkdir(parents=True, exist_ok=True)
-                    utils.copy_file(output_pdf_path, final_path)
-                    logging.info(f"Success! The file has been compressed and saved to: {final_path}")
-                    return True, final_path
-            except Exception as e:
-                logging.error(f"An error occurred while trying {i+1} in sequence: {e}")
-                continue
+            session.trim_scratch()
 
+def _allocate_per_page(pdf_path, output_dir, target_size_mb, strategy, session, dpi):
+    """
+    Rebuild once with a per-page parameter plan chosen within the target size budget.
+    Return (bool, Path): (whether successful, output file path)
+    """
+    page_params = allocator.plan_pages(session, dpi, strategy['params_sequence'], target_size_mb)
+    if page_params is None:
+        return False, None
+    output_pdf_path = session.temp_dir / f"output_{pdf_path.stem}_per_page.pdf"
+    if not allocator.rebuild_with_plan(session, page_params, output_pdf_path):
+        return False, None
+    result_size_mb = utils.get_file_size_mb(output_pdf_path)
+    if result_size_mb > target_size_mb:
+        logging.warning(f"Per-page plan result size {result_size_mb:.2f}MB exceeds the target {target_size_mb}MB")
+        scratch.discard(output_pdf_path)
+        return False, None
+
+    final_path = output_dir / f"{pdf_path.stem}_compressed.pdf"
+    final_path.parent.mkdir(parents=True, exist_ok=True)
+    utils.copy_file(output_pdf_path, final_path)
+    scratch.discard(output_pdf_path)
+    logging.info(f"Success! The file has been compressed and saved to: {final_path}")
+    return True, final_path
+
+def _search_params_sequence(pdf_path, output_dir, target_size_mb, strategy, stage, speculative_jobs=1, search_mode='legacy', start_index=0, rebuild_jobs=1, prebuilt=None, on_rebuilt=None):
+    """
+    Try the parameter ladder of a strategy. stage(dpi) returns (temp_dir, image_files, hocr_file)
+    with the page images and hOCR at the DPI of a parameter set (e.g. DocumentSession.stage).
+    search_mode selects the search over the ladder (see compressor.search), start_index the
+    first entry to try. With speculative_jobs > 1, up to that many candidates are rebuilt in
+    parallel ahead of the search; rebuild_jobs > 1 splits each rebuild into parallel page ranges.
+    prebuilt maps ladder indexes to (size_mb, output_path) results that were already rebuilt.
+    on_rebuilt(params, size_mb) is called for every rebuild of the whole document.
+    Return (bool, Path): (whether successful, output file path)
+    """
+    params_sequence = strategy['params_sequence']
+    prebuilt = dict(prebuilt or {})
+    outputs = [path for size_mb, path in prebuilt.values()]  # candidate PDFs, deleted once the search is over
+    if on_rebuilt:
+        for index, (size_mb, path) in prebuilt.items():
+            on_rebuilt(params_sequence[index], size_mb)
+
+    def rebuild(index):
+        if index in prebuilt:
+            return prebuilt[index]
+        params = params_sequence[index]
+        try:
+            with accounting.tagged(strategy=strategy['name'], attempt=index + 1, params=dict(params)), \
+                    trace.span(f"attempt {index + 1}", 'attempt', strategy=strategy['name'], **params):
+                staged = stage(params['dpi'])
+                if not staged:
+                    return None
+                temp_dir, image_files, hocr_file = staged
+                output_pdf_path = temp_dir / f"output_{pdf_path.stem}_{index}.pdf"
+                outputs.append(output_pdf_path)
+                if not pipeline.rebuild_pdf(image_files, hocr_file, temp_dir, params, output_pdf_path, jobs=rebuild_jobs):
+                    return None
+                size_mb = utils.get_file_size_mb(output_pdf_path)
+                if on_rebuilt:
+                    on_rebuilt(params, size_mb)
+                return size_mb, output_pdf_path
+        except Exception as e:
+            logging.error(f"An error occurred while trying parameter set {index+1}: {e}")
+            return None
+
+    outcome = search.run_search(
+        params_sequence, target_size_mb, rebuild,
+        mode=search_mode, speculative_jobs=speculative_jobs, start_index=start_index
+    )
+    if outcome.index is None:
         logging.warning(f"All compression attempts failed, unable to compress {pdf_path.name} to target size.")
+        scratch.discard(*outputs)
         return False, None
 
-    finally:
-        #Determine whether to delete the temporary directory based on the keep_temp_on_failure flag
-        if keep_temp_on_failure:
-            logging.info(f"Keep temporary directory for debugging: {temp_dir_str}")
-        else:
-            utils.cleanup_directory(temp_dir_str)
+    final_path = output_dir / f"{pdf_path.stem}_compressed.pdf"
+    final_path.parent.mkdir(parents=True, exist_ok=True)
+    utils.copy_file(outcome.output_path, final_path)
+    scratch.discard(*outputs)
+    logging.info(f"Success! The file has been compressed and saved to: {final_path}")
+    return True, final_path
 
-def run_aggressive_compression(pdf_path, output_dir, target_size_mb, keep_temp_on_failure=False):
+def run_aggressive_compression(pdf_path, output_dir, target_size_mb, keep_temp_on_failure=False, ocr_jobs=None, cache=None, session=None, page_range=None):
     """
     Runs the most aggressive compression strategy for split file fragments.
+    With a session, page_range=(first_page, last_page) selects the fragment from the session's
+    pages and pdf_path is only used to name the output; otherwise pdf_path is processed from scratch.
     """
     logging.info(f"Run aggressive compression strategy on split file fragment {pdf_path.name}...")
     
     # Use the most aggressive parameter combination
-    aggressive_params = [
-        {'dpi': 150, 'bg_downsample': 4},
-        {'dpi': 150, 'bg_downsample': 5},
-        {'dpi': 120, 'bg_downsample': 3},
-        {'dpi': 100, 'bg_downsample': 2},
-    ]
+    aggressive_params = AGGRESSIVE_PARAMS
     
     # For aggressive compression, also generate hOCR once (using highest dpi) and reuse in multiple aggressive parameters
     max_dpi = max(p['dpi'] for p in aggressive_params)
-    temp_dir_str = utils.create_temp_directory()
-    temp_dir = Path(temp_dir_str)
+    first_page, last_page = page_range or (1, None)
+    own_session = session is None
+    if own_session:
+        session = DocumentSession(pdf_path, ocr_jobs=ocr_jobs, cache=cache, keep_temp_on_failure=keep_temp_on_failure)
+    success = False
     try:
-        logging.info(f"Aggressive compression: generate image and hOCR (DPI={max_dpi}) once for multiple subsequent attempts")
-        image_files = pipeline.deconstruct_pdf_to_images(pdf_path, temp_dir, max_dpi)
-        if not image_files:
-            logging.error("Failed to generate image for aggressive compression.")
-            return False, None
+        # A streaming session rebuilds the first attempt while its pages are rendered and OCRed
+        prebuilt_path = None
+        if page_range is None and aggressive_params[0]['dpi'] == max_dpi:
+            output_pdf_path = session.temp_dir / f"compressed_{pdf_path.stem}_0.pdf"
+            with accounting.tagged(strategy=AGGRESSIVE_NAME, attempt=1, params=dict(aggressive_params[0])), \
+                    trace.span("attempt 1 (streamed)", 'attempt', strategy=AGGRESSIVE_NAME, **aggressive_params[0]):
+                streamed = session.stream(max_dpi, aggressive_params[0], output_pdf_path)
+            if streamed:
+                prebuilt_path = output_pdf_path
 
-        hocr_file = pipeline.analyze_images_to_hocr(image_files, temp_dir)
-        if not hocr_file:
-            logging.error("Failed to generate hOCR file (aggressive compression).")
+        logging.info(f"Aggressive compression: prepare images and hOCR (DPI={max_dpi}) once for multiple subsequent attempts")
+        if not session.stage(max_dpi, first_page, last_page):
+            logging.error("Failed to generate images and hOCR for aggressive compression.")
             return False, None
 
         for i, params in enumerate(aggressive_params):
             logging.info(f"--- Aggressive compression attempt {i+1}/{len(aggressive_params)}: DPI={params['dpi']}, BG-Downsample={params['bg_downsample']} ---")
-            output_pdf_path = temp_dir / f"compressed_{pdf_path.stem}_{i}.pdf"
             try:
-                if not pipeline.reconstruct_pdf(image_files, hocr_file, temp_dir, params, output_pdf_path):
-                    continue
+                if i == 0 and prebuilt_path is not None:
+                    output_pdf_path = prebuilt_path
+                else:
+                    with accounting.tagged(strategy=AGGRESSIVE_NAME, attempt=i + 1, params=dict(params)), \
+                            trace.span(f"attempt {i + 1}", 'attempt', strategy=AGGRESSIVE_NAME, **params):
+                        # Page images at the DPI of the attempt
+                        staged = session.stage(params['dpi'], first_page, last_page)
+                        if not staged:
+                            continue
+                        temp_dir, image_files, hocr_file = staged
+                        output_pdf_path = temp_dir / f"compressed_{pdf_path.stem}_{i}.pdf"
+                        if not pipeline.rebuild_pdf(image_files, hocr_file, temp_dir, params, output_pdf_path, jobs=session.rebuild_jobs):
+                            continue
 
                 result_size_mb = utils.get_file_size_mb(output_pdf_path)
                 logging.info(f"Aggressive compression result size: {result_size_mb:.2f}MB (target: < {target_size_mb}MB)")
@@ -222,8 +270,11 @@ def run_aggressive_compression(pdf_path, output_dir, target_size_mb, keep_temp_o
                     final_path = output_dir / f"{pdf_path.stem}_compressed.pdf"
                     final_path.parent.mkdir(parents=True, exist_ok=True)
                     utils.copy_file(output_pdf_path, final_path)
+                    scratch.discard(output_pdf_path)
                     logging.info(f"Aggressive compression successful! File saved to: {final_path}")
+                    success = True
                     return True, final_path
+                scratch.discard(output_pdf_path)
             except Exception as e:
                 logging.error(f"Error occurred during aggressive compression attempt {i+1}: {e}")
                 continue
@@ -231,7 +282,7 @@ def run_aggressive_compression(pdf_path, output_dir, target_size_mb, keep_temp_o
         logging.error(f"Aggressive compression failed, unable to compress {pdf_path.name} to target size.")
         return False, None
     finally:
-        if keep_temp_on_failure:
-            logging.info(f"Keep aggressively compressed temporary directory for debugging: {temp_dir_str}")
+        if own_session:
+            session.close(success)
         else:
-            utils.cleanup_directory(temp_dir_str)
\ No newline at end of file
+            session.trim_scratch()
@@ -0,0 +1,242 @@
+# compressor/streaming.py
+
+"""
+Streaming render -> OCR -> rebuild over page chunks.
+
+Without it every stage finishes for the whole document before the next one starts. Here
+pdftoppm renders ranges of chunk_pages pages (-f/-l), OCR workers take the pages as soon as they
+land, and a chunk whose pages all have their hOCR is rebuilt with recode_pdf while later chunks
+are still being rendered and OCRed; the chunk PDFs are joined losslessly with qpdf at the end.
+
+Backpressure: a chunk holds one of queue_chunks slots from the moment its rendering starts until
+it has been OCRed (and rebuilt, when rebuilding), so the renderer waits when OCR or the rebuild
+fall behind and no more than queue_chunks chunks of page images are in flight at a time.
+"""
+
+import logging
+import queue
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from . import commands, hocr, pipeline, utils
+
+DEFAULT_CHUNK_PAGES = 8
+DEFAULT_QUEUE_CHUNKS = 2
+
+# image_files/hocr_files: per-page paths in page order; rebuilt: whether the output PDF was built
+StreamResult = namedtuple('StreamResult', ['image_files', 'hocr_files', 'rebuilt'])
+
+_DONE = None  # end-of-work marker in the queues
+
+
+def page_chunks(page_count, chunk_pages):
+    """Split pages 1..page_count into (first_page, last_page) ranges of chunk_pages pages."""
+    return [(first, min(first + chunk_pages - 1, page_count)) for first in range(1, page_count + 1, chunk_pages)]
+
+
+class StreamingPipeline:
+    """Render, OCR and optionally rebuild the pages of one PDF chunk by chunk, with the stages overlapping."""
+
+    def __init__(self, pdf_path, render_dir, dpi, page_count, chunk_pages=DEFAULT_CHUNK_PAGES,
+                 queue_chunks=DEFAULT_QUEUE_CHUNKS, ocr_jobs=None, rebuild_jobs=1, cache=None,
+                 image_format=pipeline.DEFAULT_IMAGE_FORMAT, text_layer=None, color_modes=None,
+                 page_analysis=None, ocr_dpi=None):
+        self.pdf_path = Path(pdf_path)
+        self.render_dir = Path(render_dir)
+        self.dpi = dpi
+        self.page_count = page_count
+        self.chunk_pages = max(1, chunk_pages)
+        self.chunks = page_chunks(page_count, self.chunk_pages)
+        self.queue_chunks = max(1, queue_chunks)
+        self.ocr_jobs = max(1, min(ocr_jobs or pipeline.default_ocr_jobs(), page_count))
+        self.rebuild_jobs = max(1, rebuild_jobs or 1)
+        self.cache = cache
+        self.image_format = image_format
+        self.text_layer = text_layer  # pages with a reliable text layer skip OCR (compressor.textlayer)
+        self.color_modes = color_modes  # colour mode per page (compressor.colormode), None: all colour
+        self.page_analysis = page_analysis  # blank and duplicate pages (compressor.dedup)
+        # OCR on grayscale copies at this lower resolution (pipeline.ocr_downscaled), None: at dpi
+        self.ocr_dpi = ocr_dpi if pipeline.ocr_downscale_enabled(dpi, ocr_dpi) else None
+        self._digests = cache.page_digests(self.pdf_path) if cache else None
+        self._images = [None] * page_count
+        self._hocr = [None] * page_count
+        self._remaining = [last - first + 1 for first, last in self.chunks]  # pages left to OCR per chunk
+        self._chunk_pdfs = [None] * len(self.chunks)
+        self._pages = queue.Queue()      # (page, image) waiting for OCR
+        self._ready = queue.Queue()      # chunk indexes waiting for the rebuild
+        self._slots = threading.Semaphore(self.queue_chunks)
+        self._lock = threading.Lock()
+        self._scope = commands.CancelScope()
+        self._failed = False
+        self._started = None
+        self._params = None
+
+    def run(self, params=None, output_pdf_path=None):
+        """
+        Render and OCR all pages; with params, also rebuild them into output_pdf_path.
+        Returns a StreamResult, or None if rendering or OCR failed.
+        """
+        self._params = params
+        rebuild = params is not None
+        work_dir = self.render_dir / f"{Path(output_pdf_path).stem}_chunks" if rebuild else None
+        logging.info(f"Streaming pipeline: {self.page_count} pages in {len(self.chunks)} chunks of up to "
+                     f"{self.chunk_pages} pages, at most {self.queue_chunks} chunks in flight"
+                     + (f", rebuild with {params}" if rebuild else ""))
+        self._started = time.monotonic()
+        workers = 1 + self.ocr_jobs + (self.rebuild_jobs if rebuild else 0)
+        try:
+            with self._scope, ThreadPoolExecutor(max_workers=workers) as executor:
+                run = utils.in_current_context(self._guarded)
+                renderer = executor.submit(run, self._render)
+                ocr_workers = [executor.submit(run, self._ocr) for _ in range(self.ocr_jobs)]
+                rebuilders = [executor.submit(run, self._rebuild, work_dir) for _ in range(self.rebuild_jobs)] if rebuild else []
+                renderer.result()
+                for worker in ocr_workers:
+                    worker.result()
+                for _ in rebuilders:
+                    self._ready.put(_DONE)
+                for worker in rebuilders:
+                    worker.result()
+            if self._failed or None in self._hocr:
+                return None
+            rebuilt = rebuild and None not in self._chunk_pdfs and self._join(output_pdf_path)
+            return StreamResult(list(self._images), list(self._hocr), rebuilt)
+        finally:
+            if work_dir is not None:
+                utils.cleanup_directory(str(work_dir))
+
+    def _guarded(self, stage, *args):
+        try:
+            stage(*args)
+        except Exception as e:
+            logging.error(f"Streaming pipeline stage failed: {e}")
+            self._fail()
+
+    def _fail(self):
+        """Stop all stages: kill the running commands and wake up a waiting renderer."""
+        with self._lock:
+            if self._failed:
+                return
+            self._failed = True
+        self._scope.cancel()
+        self._slots.release(self.queue_chunks)
+
+    def _render(self):
+        try:
+            for index, (first_page, last_page) in enumerate(self.chunks):
+                self._slots.acquire()  # backpressure: wait until a chunk in flight is done
+                if self._failed:
+                    return
+                image_files = pipeline.render_page_range(
+                    self.pdf_path, self.render_dir, self.dpi, first_page, last_page, self.page_count,
+                    cache=self.cache, digests=self._digests, image_format=self.image_format, color_modes=self.color_modes)
+                if image_files is None:
+                    if not commands.cancelled():
+                        logging.error(f"Rendering pages {first_page}-{last_page} failed.")
+                    self._fail()
+                    return
+                logging.debug(f"Streaming pipeline: chunk {index + 1}/{len(self.chunks)} rendered")
+                for page, image in zip(range(first_page, last_page + 1), image_files):
+                    self._images[page - 1] = image
+                    self._pages.put((page, image))
+        finally:
+            for _ in range(self.ocr_jobs):
+                self._pages.put(_DONE)
+
+    def _ocr(self):
+        while True:
+            item = self._pages.get()
+            if item is _DONE:
+                return
+            if self._failed:
+                continue
+            page, image = item
+            hocr_file = None
+            if self.page_analysis is not None:
+                hocr_file = self._reuse_hocr(page, image)
+            if hocr_file is None and self.text_layer is not None:
+                hocr_file = self.text_layer.write_hocr(page, self.render_dir / f"{image.stem}.hocr", self.dpi)
+            if hocr_file is None and self.ocr_dpi:
+                hocr_files = pipeline.ocr_downscaled([image], self.render_dir, self.dpi, self.ocr_dpi, thread_limit=1, cache=self.cache)
+                hocr_file = hocr_files[0] if hocr_files else None
+            elif hocr_file is None:
+                hocr_file = pipeline.ocr_image(image, self.render_dir, thread_limit=1, cache=self.cache)
+            if hocr_file is None:
+                self._fail()
+                continue
+            index = (page - 1) // self.chunk_pages
+            with self._lock:
+                self._hocr[page - 1] = hocr_file
+                self._remaining[index] -= 1
+                chunk_done = self._remaining[index] == 0
+            if chunk_done:
+                first_page, last_page = self.chunks[index]
+                logging.info(f"Complete OCR: pages {first_page}-{last_page} ({self._hocr.count(None)} pages left)")
+                if self._params is not None:
+                    self._ready.put(index)
+                else:
+                    self._slots.release()
+
+    def _reuse_hocr(self, page, image):
+        """
+        hOCR of a blank page, or that of the original of a duplicate page once it has been OCRed
+        (the original can still be in the hands of another OCR worker; then the page is OCRed).
+        """
+        original = self.page_analysis.duplicates.get(page)
+        if original is not None:
+            with self._lock:
+                return self._hocr[original - 1]
+        return self.page_analysis.write_hocr(page, self.render_dir / f"{image.stem}.hocr", self.dpi)
+
+    def _rebuild(self, work_dir):
+        while True:
+            index = self._ready.get()
+            if index is _DONE:
+                return
+            try:
+                if not self._failed:
+                    self._chunk_pdfs[index] = self._rebuild_chunk(work_dir, index)
+            finally:
+                self._slots.release()
+
+    def _rebuild_chunk(self, work_dir, index):
+        """Rebuild the pages of one chunk into their own PDF; returns its path, or None."""
+        first_page, last_page = self.chunks[index]
+        chunk_dir = work_dir / f"chunk{index + 1:03d}"
+        chunk_dir.mkdir(parents=True, exist_ok=True)
+        pages = range(first_page, last_page + 1)
+        sources = pages
+        if self.page_analysis is not None:
+            sources = [self.page_analysis.source_page(page, self._images) for page in pages]
+        images = [self._images[page - 1] for page in sources]
+        width = len(str(len(images)))
+        staged = []
+        for number, image in enumerate(images, 1):
+            target = chunk_dir / f"page-{number:0{width}d}{image.suffix}"
+            utils.link_or_copy(image, target)
+            staged.append(target)
+        hocr_file = chunk_dir / "chunk.hocr"
+        try:
+            hocr.merge_hocr_files([self._hocr[page - 1] for page in pages], hocr_file)
+        except (IOError, hocr.HocrError) as e:
+            logging.error(f"Error merging the hOCR of pages {first_page}-{last_page}: {e}")
+            return None
+        chunk_pdf = chunk_dir / "chunk.pdf"
+        if not pipeline.reconstruct_pdf(staged, hocr_file, chunk_dir, self._params, chunk_pdf):
+            return None
+        if index == 0:
+            logging.info(f"Streaming pipeline: first chunk rebuilt {time.monotonic() - self._started:.1f}s after the start")
+        return chunk_pdf
+
+    def _join(self, output_pdf_path):
+        """Join the chunk PDFs into output_pdf_path."""
+        if not pipeline.concatenate_pdfs(self._chunk_pdfs, output_pdf_path):
+            logging.error("Joining the streamed chunks failed.")
+            return False
+        if pipeline.get_pdf_page_count(Path(output_pdf_path)) != self.page_count:
+            logging.error("The joined PDF does not have the expected number of pages.")
+            return False
+        logging.info(f"PDF reconstruction successful, output to {output_pdf_path}")
+        return True
@@ -0,0 +1,188 @@
+# compressor/textlayer.py
+
+"""
+Text layers of born-digital pages.
+
+Generated documents (forms, reports, letters) already carry their text in the PDF; only the
+scanned pages need OCR. `pdftotext -bbox-layout` reports every word of the text layer with its
+position. A page whose text looks reliable - enough words, hardly any unmapped glyphs and no
+image covering most of the page (`pdfimages -list`), which could hold text the layer does not
+have - gets its hOCR written from that text at the render resolution, and tesseract only runs
+on the other pages.
+"""
+
+import logging
+import os
+import threading
+import unicodedata
+import xml.etree.ElementTree as ET
+from collections import namedtuple
+from html import escape
+from . import hocr, pipeline, scratch, trace, utils
+
+# A page needs at least this many words for its text layer to replace OCR
+MIN_WORDS = 10
+# Share of characters that must map to real text (not private-use or replacement glyphs)
+MIN_CLEAN_CHAR_RATIO = 0.95
+# Pages whose images cover more than this share of the page area are OCRed anyway
+MAX_IMAGE_COVERAGE = 0.5
+POINTS_PER_INCH = 72
+
+# Coordinates in PDF points, origin at the top left
+Word = namedtuple('Word', ['x_min', 'y_min', 'x_max', 'y_max', 'text'])
+# width/height in points; blocks: list of text blocks, each a list of lines (lists of Words)
+TextPage = namedtuple('TextPage', ['width', 'height', 'blocks'])
+
+_stats_lock = threading.Lock()
+_skipped = 0
+
+
+def skipped_ocr():
+    """Number of pages (in this process) whose hOCR came from the text layer instead of tesseract."""
+    return _skipped
+
+
+def _local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+def parse_bbox_layout(path):
+    """Parse the output of `pdftotext -bbox-layout` into a list of TextPage (one per page)."""
+    pages = []
+    line = None
+    for event, element in ET.iterparse(path, events=('start', 'end')):
+        tag = _local_name(element.tag)
+        if event == 'start':
+            if tag == 'page':
+                pages.append(TextPage(float(element.get('width')), float(element.get('height')), []))
+            elif tag == 'block' and pages:
+                pages[-1].blocks.append([])
+            elif tag == 'line':
+                line = []
+        elif tag == 'word' and line is not None:
+            coordinates = (float(element.get(name)) for name in ('xMin', 'yMin', 'xMax', 'yMax'))
+            line.append(Word(*coordinates, element.text or ''))
+        elif tag == 'line':
+            if line and pages and pages[-1].blocks:
+                pages[-1].blocks[-1].append(line)
+            line = None
+        elif tag == 'page':
+            element.clear()
+    return pages
+
+
+def image_areas(page_images):
+    """Area in square points covered by images on each page (page number -> area), from pipeline.PageImage rows."""
+    areas = {}
+    for image in page_images:
+        if image.type != 'image' or image.x_ppi <= 0 or image.y_ppi <= 0:
+            continue  # masks only shape other images
+        area = (image.width / image.x_ppi * POINTS_PER_INCH) * (image.height / image.y_ppi * POINTS_PER_INCH)
+        areas[image.page] = areas.get(image.page, 0.0) + area
+    return areas
+
+
+def _clean_ratio(text):
+    bad = sum(1 for ch in text if ch == '\ufffd' or unicodedata.category(ch) in ('Co', 'Cc', 'Cn', 'Cs'))
+    return 1 - bad / len(text)
+
+
+def is_reliable(page, image_area=0.0):
+    """Whether the text layer of a page can stand in for OCR."""
+    words = [word for block in page.blocks for line in block for word in line]
+    if len(words) < MIN_WORDS:
+        return False
+    if page.width > 0 and page.height > 0 and image_area / (page.width * page.height) > MAX_IMAGE_COVERAGE:
+        return False
+    text = "".join(word.text for word in words)
+    return bool(text) and _clean_ratio(text) >= MIN_CLEAN_CHAR_RATIO
+
+
+def _bbox(x_min, y_min, x_max, y_max, scale):
+    return f"bbox {round(x_min * scale)} {round(y_min * scale)} {round(x_max * scale)} {round(y_max * scale)}"
+
+
+def _union(words):
+    return (min(w.x_min for w in words), min(w.y_min for w in words),
+            max(w.x_max for w in words), max(w.y_max for w in words))
+
+
+def write_page_hocr(page, output_path, dpi, page_number=1):
+    """Write a TextPage as a one-page hOCR file with coordinates in pixels at dpi."""
+    scale = dpi / POINTS_PER_INCH
+    parts = [hocr.HOCR_HEADER,
+             f"<div class='ocr_page' id='page_{page_number}' title='{_bbox(0, 0, page.width, page.height, scale)}; ppageno {page_number - 1}'>\n"]
+    line_id = word_id = 0
+    for block_id, block in enumerate(page.blocks, 1):
+        if not block:
+            continue
+        box = _bbox(*_union([word for line in block for word in line]), scale)
+        parts.append(f"<div class='ocr_carea' id='block_{page_number}_{block_id}' title='{box}'>\n"
+                     f"<p class='ocr_par' id='par_{page_number}_{block_id}' title='{box}'>\n")
+        for line in block:
+            line_id += 1
+            parts.append(f"<span class='ocr_line' id='line_{page_number}_{line_id}' title='{_bbox(*_union(line), scale)}; baseline 0 0'>")
+            for word in line:
+                word_id += 1
+                parts.append(f"<span class='ocrx_word' id='word_{page_number}_{word_id}' "
+                             f"title='{_bbox(word.x_min, word.y_min, word.x_max, word.y_max, scale)}; x_wconf 100'>{escape(word.text)}</span> ")
+            parts.append("</span>\n")
+        parts.append("</p>\n</div>\n")
+    parts.append("</div>\n" + hocr.HOCR_FOOTER)
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write("".join(parts))
+    return output_path
+
+
+class TextLayer:
+    """The text layer of a PDF and the pages on which it replaces OCR."""
+
+    def __init__(self, pages, image_areas=None):
+        self.pages = pages
+        image_areas = image_areas or {}
+        self.reliable = {number for number, page in enumerate(pages, 1) if is_reliable(page, image_areas.get(number, 0.0))}
+
+    def write_hocr(self, page_number, output_path, dpi):
+        """
+        Write the hOCR of a page (1-based) at dpi from its text layer.
+        Returns output_path, or None when the page needs OCR.
+        """
+        global _skipped
+        if page_number not in self.reliable:
+            return None
+        write_page_hocr(self.pages[page_number - 1], output_path, dpi, page_number)
+        scratch.record('textlayer', output_path)
+        with _stats_lock:
+            _skipped += 1
+        return output_path
+
+
+@trace.traced('text layer')
+def extract(pdf_path, work_dir):
+    """
+    Read the text layer of a PDF (work_dir holds the pdftotext output while it is parsed).
+    Returns a TextLayer, or None when no text could be extracted.
+    """
+    output_path = work_dir / "text_layer.html"
+    result = utils.run_command_result(["pdftotext", "-bbox-layout", str(pdf_path), str(output_path)],
+                                      stage='textlayer', outputs=[output_path])
+    try:
+        if result.returncode != 0:
+            logging.warning(f"Unable to read the text layer ({result.error or result.stderr or result.returncode}), OCR every page")
+            return None
+        pages = parse_bbox_layout(output_path)
+    except (ET.ParseError, OSError, TypeError, ValueError) as e:
+        logging.warning(f"Unable to parse the text layer, OCR every page: {e}")
+        return None
+    finally:
+        try:
+            os.remove(output_path)
+        except OSError:
+            pass
+
+    page_images = pipeline.list_page_images(pdf_path)
+    if page_images is None:
+        logging.debug("No image list, judge the pages by their text alone")
+    layer = TextLayer(pages, image_areas(page_images or []))
+    logging.info(f"Text layer: {len(layer.reliable)} of {len(pages)} pages carry reliable text, their OCR is skipped")
+    return layer
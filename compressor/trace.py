@@ -0,0 +1,150 @@
+# compressor/trace.py
+
+"""
+Timeline of a processing run in Chrome trace-event format (main.py --trace out.json).
+
+Spans are recorded for every file, pipeline stage, strategy attempt, split plan and part on the
+lane of the Python thread that runs them, and for every external command twice: on the calling
+thread from the request to the result (including the wait for the CPU/memory budget) and on one
+of the lanes of the "external commands" process while the tool runs. A command takes the first
+free lane, so the number of busy lanes at a moment is the number of tools running then; gaps
+show idle cores and serial bottlenecks. Open the file in chrome://tracing or ui.perfetto.dev.
+
+Without configure(path) nothing is recorded and span() costs one check.
+"""
+
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Lanes: Python threads of the run, and the external tools
+THREADS_PID = 1
+COMMANDS_PID = 2
+
+
+class Tracer:
+    """Collects trace events in memory; write() saves them as one JSON file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._start = time.perf_counter()
+        self._events = []
+        self._threads = {}        # thread ident -> lane
+        self._command_lanes = []  # end time (microseconds) of the last command on each lane
+        self._lock = threading.Lock()
+
+    def now(self):
+        """Microseconds since the start of the trace."""
+        return (time.perf_counter() - self._start) * 1e6
+
+    def _thread_lane(self):
+        ident = threading.get_ident()
+        lane = self._threads.get(ident)
+        if lane is None:
+            lane = self._threads[ident] = len(self._threads) + 1
+            self._events.append({'ph': 'M', 'name': 'thread_name', 'pid': THREADS_PID, 'tid': lane,
+                                 'args': {'name': threading.current_thread().name}})
+        return lane
+
+    def complete(self, name, category, start, end, args=None):
+        """Add a span of the current thread from start to end (microseconds)."""
+        with self._lock:
+            self._events.append({'ph': 'X', 'name': name, 'cat': category, 'pid': THREADS_PID, 'tid': self._thread_lane(),
+                                 'ts': round(start, 1), 'dur': round(end - start, 1), 'args': args or {}})
+
+    def command(self, name, start, end, args=None):
+        """Add the run of an external tool on the first command lane that is free at start."""
+        with self._lock:
+            for lane, busy_until in enumerate(self._command_lanes):
+                if busy_until <= start:
+                    break
+            else:
+                lane = len(self._command_lanes)
+                self._command_lanes.append(0)
+                self._events.append({'ph': 'M', 'name': 'thread_name', 'pid': COMMANDS_PID, 'tid': lane + 1,
+                                     'args': {'name': f"slot {lane + 1}"}})
+            self._command_lanes[lane] = end
+            self._events.append({'ph': 'X', 'name': name, 'cat': 'command', 'pid': COMMANDS_PID, 'tid': lane + 1,
+                                 'ts': round(start, 1), 'dur': round(end - start, 1), 'args': args or {}})
+
+    def write(self):
+        with self._lock:
+            events = [{'ph': 'M', 'name': 'process_name', 'pid': THREADS_PID, 'args': {'name': 'pdf_compressor'}},
+                      {'ph': 'M', 'name': 'process_name', 'pid': COMMANDS_PID, 'args': {'name': 'external commands'}}]
+            events += self._events
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms',
+                       'otherData': {'pid': os.getpid()}}, f)
+        logging.info(f"Trace with {len(events)} events written to {self.path} (open it in chrome://tracing or ui.perfetto.dev)")
+
+
+_tracer = None
+
+
+def configure(path=None):
+    """Record a trace for path (None: stop tracing)."""
+    global _tracer
+    _tracer = Tracer(path) if path else None
+    return _tracer
+
+
+def tracer():
+    """The active Tracer, or None."""
+    return _tracer
+
+
+@contextmanager
+def span(name, category, **args):
+    """Record the block as a span of the current thread."""
+    active = _tracer
+    if active is None:
+        yield
+        return
+    start = active.now()
+    try:
+        yield
+    finally:
+        active.complete(name, category, start, active.now(), args)
+
+
+def traced(name, category='stage'):
+    """Decorator: record every call of the function as a span."""
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return function(*args, **kwargs)
+            with span(name, category):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def command(command, stage, seconds, wall_seconds, args=None):
+    """
+    Record an external command that just finished: seconds from its request to its result on
+    the calling thread, wall_seconds (None if it never started) of the process on a command lane.
+    """
+    active = _tracer
+    if active is None:
+        return
+    end = active.now()
+    name = f"{os.path.basename(str(command[0]))} ({stage})" if command else stage
+    args = dict(args or {})
+    args.setdefault('command', ' '.join(str(part) for part in command))
+    active.complete(name, 'command', end - seconds * 1e6, end, args)
+    if wall_seconds is not None:
+        active.command(name, end - wall_seconds * 1e6, end, args)
+
+
+def finish():
+    """Write the trace file, if tracing."""
+    if _tracer is not None:
+        try:
+            _tracer.write()
+        except OSError as e:
+            logging.error(f"Unable to write the trace {_tracer.path}: {e}")
@@ -1,15 +1,35 @@
 # compressor/utils.py
 
+import contextvars
 import logging
 import os
 import subprocess
 import sys
 import tempfile
 import shutil
+import threading
+import time
+from contextlib import contextmanager
 from pathlib import Path
+from . import accounting, commands, scratch, trace
 
 LOG_DIR = "logs"
 
+# Records logged while a per-file buffer is active (see buffered_logging)
+_log_buffer = contextvars.ContextVar('log_buffer', default=None)
+_log_flush_lock = threading.Lock()
+
+
+class _BufferFilter(logging.Filter):
+    """Divert records to the per-file buffer of the current context, if there is one."""
+
+    def filter(self, record):
+        buffer = _log_buffer.get()
+        if buffer is None:
+            return True
+        buffer.append(record)
+        return False
+
 def setup_logging():
     """Configure the logger to output to both the console and a file."""
     log_dir = Path(LOG_DIR)
@@ -28,6 +48,40 @@ def setup_logging():
             logging.StreamHandler(sys.stdout)
         ]
     )
+    root = logging.getLogger()
+    if not any(isinstance(f, _BufferFilter) for f in root.filters):
+        root.addFilter(_BufferFilter())
+
+@contextmanager
+def buffered_logging():
+    """
+    Collect the log records of the current context (one file being processed) and write them
+    in one block when the context ends, so parallel files do not interleave their logs.
+    Worker threads must be started with in_current_context() to log into the same buffer.
+    """
+    buffer = []
+    token = _log_buffer.set(buffer)
+    try:
+        yield
+    finally:
+        _log_buffer.reset(token)
+        root = logging.getLogger()
+        with _log_flush_lock:
+            for record in buffer:
+                for handler in root.handlers:
+                    if record.levelno >= handler.level:
+                        handler.handle(record)
+
+def in_current_context(function):
+    """
+    Wrap function so that it runs in a copy of the caller's context (per-file log buffer),
+    also when called from a pool thread.
+    """
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        return context.copy().run(function, *args, **kwargs)
+    return run
 
 def get_file_size_mb(file_path):
     """Get the file size in MB."""
@@ -37,19 +91,60 @@ def get_file_size_mb(file_path):
         logging.error(f"File not found: {file_path}")
         return 0
 
-def run_command(command, cwd=None):
+def run_command(command, cwd=None, env=None, timeout=None, stage=None, outputs=None):
     """
     Execute an external command line command.
 
     Args:
         command (list): A list of commands and their parameters.
         cwd (str, optional): Working directory for command execution.
+        env (dict, optional): Extra environment variables for the command.
+        timeout (float, optional): Seconds after which the command is killed
+            (defaults to the engine timeout, see compressor.commands).
+        stage (str, optional): Pipeline stage of the command for its resource record
+            (see compressor.accounting), defaults to the tool name.
+        outputs (list, optional): Paths or glob patterns of the files the command writes;
+            their bytes are recorded when the command log is enabled.
 
     Returns:
         bool: Whether the command was executed successfully.
     """
-    command_str = ' '.join(command)
+    command_str = ' '.join(str(part) for part in command)
     logging.info(f"Execute command: {command_str}")
+    result = run_command_result(command, cwd=cwd, env=env, timeout=timeout, stage=stage, outputs=outputs)
+    if result.error == commands.NOT_FOUND:
+        logging.error(f"Command not found: {command[0]}. Please make sure the tool is installed and in the system PATH.")
+        logging.error(f"Tip: If you use pipx to install, please make sure ~/.local/bin is in PATH")
+        return False
+    if result.error == commands.CANCELLED:
+        logging.info(f"Command cancelled: {command_str}")
+        return False
+    if result.error == commands.TIMEOUT:
+        logging.error(f"Command timed out and was stopped: {command_str}")
+        return False
+    if result.returncode != 0:
+        logging.error(f"Command execution failed: {command_str}")
+        logging.error(f"Return code: {result.returncode}")
+        logging.error(f"standard output:\n{result.stdout}")
+        logging.error(f"Standard Error:\n{result.stderr}")
+        return False
+    if result.stderr:
+        # Distinguish between normal messages and real errors
+        stderr_content = result.stderr.strip()
+        if any(keyword in stderr_content.lower() for keyword in ['detected', 'diacritics', 'processing']):
+            #Normal informational output from tools such as Tesseract
+            logging.debug(f"Command information output:\n{stderr_content}")
+        elif stderr_content:
+            # Possible warnings or errors
+            logging.warning(f"Command standard error output:\n{stderr_content}")
+    return True
+
+def run_command_result(command, cwd=None, env=None, timeout=None, stage=None, outputs=None):
+    """
+    Run an external command and return its commands.CommandResult (for callers that parse its
+    output). Arguments as for run_command; the command's resource record is kept as well.
+    """
+    extra_env = env
     
     # Make sure to include possible pipx installation paths
     env = os.environ.copy()
@@ -59,40 +154,20 @@ def run_command(command, cwd=None):
     if local_bin not in env.get("PATH", ""):
         env["PATH"] = f"{local_bin}:{env.get('PATH', '')}"
         logging.debug(f"Add {local_bin} to PATH")
+    if extra_env:
+        env.update(extra_env)
     
-    try:
-        result = subprocess.run(
-            command,
-            check=True,
-            capture_output=True,
-            text=True,
-            encoding='utf-8',
-            errors='ignore',
-            cwd=cwd,
-            env=env # Use modified environment variables
-        )
-        if result.stdout:
-            logging.debug(f"Command output:\n{result.stdout}")
-        if result.stderr:
-            # Distinguish between normal messages and real errors
-            stderr_content = result.stderr.strip()
-            if any(keyword in stderr_content.lower() for keyword in ['detected', 'diacritics', 'processing']):
-                #Normal informational output from tools such as Tesseract
-                logging.debug(f"Command information output:\n{stderr_content}")
-            else:
-                # Possible warnings or errors
-                logging.warning(f"Command standard error output:\n{stderr_content}")
-        return True
-    except subprocess.CalledProcessError as e:
-        logging.error(f"Command execution failed: {command_str}")
-        logging.error(f"Return code: {e.returncode}")
-        logging.error(f"standard output:\n{e.stdout}")
-        logging.error(f"Standard Error:\n{e.stderr}")
-        return False
-    except FileNotFoundError:
-        logging.error(f"Command not found: {command[0]}. Please make sure the tool is installed and in the system PATH.")
-        logging.error(f"Tip: If you use pipx to install, please make sure ~/.local/bin is in PATH")
-        return False
+    # The engine waits for a CPU slot and memory from the shared budget (see resources.py)
+    # and logs the output while the command runs
+    command_log = accounting.command_log()
+    before = accounting.snapshot(outputs) if outputs and command_log.enabled else None
+    start = time.monotonic()
+    result = commands.run(command, cwd=cwd, env=env, timeout=timeout)
+    seconds = time.monotonic() - start
+    written = accounting.written_bytes(outputs, before) if before is not None else None
+    entry = accounting.record(command, stage or os.path.basename(str(command[0])), result, seconds, written)
+    trace.command(command, entry['stage'], seconds, result.usage.wall_seconds if result.usage else None, entry)
+    return result
 
 def create_temp_directory():
     """Create a temporary directory."""
@@ -102,10 +177,18 @@ def cleanup_directory(directory_path):
     """Clean up the temporary directory."""
     try:
         shutil.rmtree(directory_path)
+        scratch.ledger().forget_tree(directory_path)
         logging.debug(f"The temporary directory has been cleaned: {directory_path}")
     except Exception as e:
         logging.warning(f"Failed to clear temporary directory: {directory_path}, error: {e}")
 
+def link_or_copy(src, dst):
+    """Hard-link src to dst when both are on the same file system, otherwise copy it."""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
 def copy_file(src, dst):
     """Copy the file to the target location."""
     try:
@@ -91,11 +91,10 @@ LOG_FILE_BACKUP_COUNT = 3 # Number of log files retained
 # Concurrent processing settings (may be supported in future versions)
 MAX_PARALLEL_JOBS = 1 # The current version only supports single thread
 
-#Memory usage limit
-MAX_MEMORY_USAGE_MB = 1024 # Maximum memory usage (MB)
+# The memory budget and the command timeout are set on the command line
+# (--max-memory-mb, --process-address-space-mb, --command-timeout)
 
 # Timeout settings
-COMMAND_TIMEOUT = 300 # Maximum execution time of a single command (seconds)
 TOTAL_PROCESS_TIMEOUT = 1800 # Maximum processing time of a single file (seconds)
 
 # =============================================================================
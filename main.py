@@ -4,7 +4,7 @@ import argparse
 import logging
 import sys
 from pathlib import Path
-from compressor import utils
+from compressor import accounting, commands, pipeline, resources, scratch, textlayer, trace, utils
 import orchestrator
 
 def create_argument_parser():
@@ -61,6 +61,232 @@ Things to note:
         help="Maximum number of splits allowed. Default is 4."
     )
     
+    parser.add_argument(
+        "--ocr-jobs",
+        type=int,
+        default=None,
+        help="Number of pages to OCR in parallel. Default is the number of CPU cores."
+    )
+    
+    parser.add_argument(
+        "--ocr-batch-pages",
+        type=int,
+        default=pipeline.DEFAULT_OCR_BATCH_PAGES,
+        help="Pages OCRed by one tesseract process (the language model is loaded once per batch).\n"
+             f"Default is {pipeline.DEFAULT_OCR_BATCH_PAGES}; 1 starts one process per page."
+    )
+    
+    parser.add_argument(
+        "--ocr-dpi",
+        type=int,
+        default=None,
+        help="Run OCR on grayscale copies of the page images downscaled to this resolution (e.g. 200);\n"
+             "the text boxes are scaled back to the render resolution. Needs Pillow.\n"
+             "Default is to OCR the page images at the render resolution."
+    )
+    
+    parser.add_argument(
+        "-j", "--jobs",
+        type=int,
+        default=1,
+        help="Number of PDF files processed in parallel in directory mode. Default is 1.\n"
+             "All files share the CPU/memory budget (--cpus, --max-memory-mb)."
+    )
+    
+    parser.add_argument(
+        "--schedule",
+        choices=["lpt", "fifo"],
+        default="lpt",
+        help="Order in which parallel files are started (with --jobs > 1):\n"
+             "lpt  - largest estimated processing time first, small files fill in (default)\n"
+             "fifo - file name order"
+    )
+    
+    parser.add_argument(
+        "--cpus",
+        type=int,
+        default=None,
+        help="Maximum number of external tool processes running at the same time, across all\n"
+             "files, OCR workers and rebuilds. Default is the number of CPU cores."
+    )
+    
+    parser.add_argument(
+        "--max-memory-mb",
+        type=float,
+        default=None,
+        help="Memory budget (MB) for external tool processes: a tool only starts while the measured peak\n"
+             "memory of the running tools plus its own fits. Default is 75%% of physical memory."
+    )
+    
+    parser.add_argument(
+        "--process-address-space-mb",
+        type=float,
+        default=None,
+        help="Cap the virtual address space (RLIMIT_AS) of every external tool process at this many MB.\n"
+             "Off by default: tesseract and recode_pdf reserve much more address space than they use,\n"
+             "so a cap near their resident memory makes them fail."
+    )
+    
+    parser.add_argument(
+        "--tool-limit",
+        action="append",
+        default=None,
+        metavar="TOOL=N",
+        help="Run at most N processes of an external tool at once (e.g. recode_pdf=2); can be repeated."
+    )
+    
+    parser.add_argument(
+        "--command-timeout",
+        type=float,
+        default=None,
+        help="Kill an external command (and the processes it started) after this many seconds. Default is no timeout."
+    )
+    
+    parser.add_argument(
+        "--command-log",
+        default=None,
+        help="Append one JSON line per external command to this file: wall/CPU time, peak memory and bytes\n"
+             "written, tagged with the stage, file, strategy attempt and split part."
+    )
+    
+    parser.add_argument(
+        "--trace",
+        default=None,
+        metavar="OUT.json",
+        help="Write a timeline of the run in Chrome trace-event format (files, stages, strategy attempts,\n"
+             "split parts and external commands per thread); open it in chrome://tracing or ui.perfetto.dev."
+    )
+    
+    parser.add_argument(
+        "--speculative-jobs",
+        type=int,
+        default=1,
+        help="Rebuild up to N compression parameter sets in parallel ahead of the search.\n"
+             "The selected result is the same as with the sequential search. Default is 1 (sequential)."
+    )
+    
+    parser.add_argument(
+        "--rebuild-jobs",
+        type=int,
+        default=1,
+        help="Rebuild each PDF with up to N recode_pdf processes working on page ranges in parallel;\n"
+             "the parts are joined losslessly with qpdf. Default is 1 (one process per rebuild)."
+    )
+    
+    parser.add_argument(
+        "--pipeline-chunk-pages",
+        type=int,
+        default=0,
+        help="Stream the first render/OCR pass in chunks of N pages: OCR starts on the pages that are\n"
+             "rendered, and the first attempt is rebuilt chunk by chunk while later chunks are still\n"
+             "rendered and OCRed. Default is 0 (each stage finishes for the whole document first)."
+    )
+    
+    parser.add_argument(
+        "--pipeline-queue-chunks",
+        type=int,
+        default=None,
+        help="With --pipeline-chunk-pages: at most N chunks are in flight between rendering and the end\n"
+             "of their rebuild; the renderer waits when later stages fall behind. Default is 2."
+    )
+    
+    parser.add_argument(
+        "--search-mode",
+        choices=["legacy", "binary", "model"],
+        default="legacy",
+        help="How the compression parameter ladder is searched:\n"
+             "legacy - first entry, then a jump to the last entry or a sequential scan (default)\n"
+             "binary - bisection for the first parameter set that fits the target\n"
+             "model  - fit a size model to the rebuilds so far and jump to the predicted boundary"
+    )
+    
+    parser.add_argument(
+        "--per-page-allocation",
+        action="store_true",
+        help="Choose the compression parameters per page within the target size budget\n"
+             "(photo pages keep more background resolution than text pages) and rebuild once.\n"
+             "Falls back to the uniform parameter search if the result does not fit."
+    )
+    
+    parser.add_argument(
+        "--no-predict",
+        action="store_true",
+        help="Do not rebuild a page sample to predict the output size.\n"
+             "By default, documents with many pages start the parameter search and the splitting\n"
+             "at the setting or split count predicted from a stratified page sample."
+    )
+    
+    parser.add_argument(
+        "--no-text-layer",
+        action="store_true",
+        help="OCR every page. By default, pages that already carry reliable text (born-digital pages)\n"
+             "get their hOCR from the PDF text layer (pdftotext -bbox-layout) and skip tesseract."
+    )
+    
+    parser.add_argument(
+        "--dedup-pages",
+        action="store_true",
+        help="Detect blank and duplicate pages on a low-resolution render. Blank pages are encoded\n"
+             "bitonal without OCR; a page scanned twice reuses the OCR of its first copy, and its\n"
+             "image too when both renders are identical."
+    )
+    
+    parser.add_argument(
+        "--drop-blank-pages",
+        action="store_true",
+        help="Remove blank pages (separator sheets) from the output."
+    )
+    
+    parser.add_argument(
+        "--image-format",
+        choices=list(pipeline.IMAGE_FORMATS),
+        default=pipeline.DEFAULT_IMAGE_FORMAT,
+        help="Format of the intermediate page images (all lossless). Compressed TIFF or PNG write far\n"
+             "less scratch data than the default uncompressed TIFF at some CPU cost."
+    )
+    
+    parser.add_argument(
+        "--color-mode",
+        choices=["color", "auto"],
+        default="color",
+        help="Colour mode of the page images. 'auto' classifies every page on a low-resolution render\n"
+             "and renders it as colour, grayscale or bitonal (1-bit scans), whichever is faithful."
+    )
+    
+    parser.add_argument(
+        "--scratch-dir",
+        default=None,
+        help="Directory for temporary files (e.g. a tmpfs such as /dev/shm). Default is the system temporary directory."
+    )
+    
+    parser.add_argument(
+        "--scratch-budget-mb",
+        type=float,
+        default=None,
+        help="Scratch space budget in MB; above it, page images are dropped between phases and restored when needed."
+    )
+    
+    parser.add_argument(
+        "--cache-dir",
+        default=None,
+        help="Keep a persistent page image/hOCR cache in this directory (off by default). Reruns and other\n"
+             "target sizes of the same documents then skip rendering and OCR; every rendered document costs\n"
+             "an extra qpdf pass that hashes its pages."
+    )
+    
+    parser.add_argument(
+        "--cache-size-mb",
+        type=float,
+        default=None,
+        help="Maximum size of the page cache in MB; least recently used entries are evicted. Default is 2048."
+    )
+    
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Do not read or write the page cache, even with --cache-dir."
+    )
+    
     parser.add_argument(
         "--copy-small-files",
         action="store_true",
@@ -185,6 +411,13 @@ def main():
         logging.error("Parameter verification failed")
         sys.exit(1)
     
+    # One CPU/memory budget for all external tools of all files
+    resources.configure(args.cpus, args.max_memory_mb, args.process_address_space_mb)
+    commands.configure(orchestrator.parse_tool_limits(args.tool_limit), args.command_timeout)
+    scratch.configure(args.scratch_dir, args.scratch_budget_mb)
+    accounting.configure(args.command_log)
+    trace.configure(args.trace)
+    
     # Check dependency tools
     logging.info("Check necessary tools...")
     if not utils.check_dependencies():
@@ -233,7 +466,16 @@ def main():
     except Exception as e:
         logging.critical(f"An unexpected error occurred during program execution: {e}", exc_info=True)
         sys.exit(1)
+    finally:
+        trace.finish()
     
+    logging.info(scratch.ledger().report())
+    logging.info(accounting.command_log().report())
+    if textlayer.skipped_ocr():
+        logging.info(f"OCR skipped for {textlayer.skipped_ocr()} pages with a reliable text layer")
+    peaks = resources.peak_report()
+    if peaks:
+        logging.info("Measured peak memory per tool: " + ", ".join(f"{tool} {mb:.0f}MB" for tool, mb in sorted(peaks.items())))
     logging.info("=== All tasks completed ===")
     print("\nProcessing completed! Please check the logs/process.log file for detailed logs.")
 
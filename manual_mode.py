@@ -8,7 +8,7 @@ Supports batch manual processing of individual files or directories; optionally
 import logging
 from pathlib import Path
 from types import SimpleNamespace
-from compressor import pipeline, utils, splitter
+from compressor import cache, pipeline, textlayer, utils, splitter
 
 
 def prompt(prompt_text, default=None, cast=str):
@@ -28,20 +28,27 @@ def prompt(prompt_text, default=None, cast=str):
         return prompt(prompt_text, default, cast)
 
 
-def run_single_manual(pdf_path: Path, dest_path: Path, dpi: int, bg_downsample: int, jpeg2000: str, keep_temp_on_failure: bool = False):
-    """Run the manual DAR process on a single PDF and write the results to dest_path(Path)."""
+def run_single_manual(pdf_path: Path, dest_path: Path, dpi: int, bg_downsample: int, jpeg2000: str, keep_temp_on_failure: bool = False, page_cache=None):
+    """Run the manual DAR process on a single PDF and write the results to dest_path(Path).
+
+    page_cache (PageCache, optional) is checked for page images and hOCR before rendering/OCR.
+    Pages with a reliable text layer take their hOCR from it instead of OCR.
+    """
     temp_dir_str = utils.create_temp_directory()
     temp_dir = Path(temp_dir_str)
     success = False
     try:
         logging.info(f"Manual mode: Convert {pdf_path} to image (DPI={dpi})")
-        image_files = pipeline.deconstruct_pdf_to_images(pdf_path, temp_dir, dpi)
+        image_files = pipeline.deconstruct_pdf_to_images(pdf_path, temp_dir, dpi, cache=page_cache)
         if not image_files:
             logging.error("Failed to generate image, manual process aborted.")
             return False
 
         logging.info("Run OCR to generate hOCR...")
-        hocr_file = pipeline.analyze_images_to_hocr(image_files, temp_dir)
+        text_layer = textlayer.extract(pdf_path, temp_dir)
+        if text_layer is not None and len(text_layer.pages) != len(image_files):
+            text_layer = None
+        hocr_file = pipeline.analyze_images_to_hocr(image_files, temp_dir, cache=page_cache, text_layer=text_layer, dpi=dpi)
         if not hocr_file:
             logging.error("Failed to generate hOCR, manual process aborted.")
             return False
@@ -67,6 +74,8 @@ def run_single_manual(pdf_path: Path, dest_path: Path, dpi: int, bg_downsample:
                 return False
             return False
     finally:
+        if page_cache:
+            page_cache.log_stats()
         # Clean only if retention is not requested or if successful
         if not (keep_temp_on_failure and not success):
             utils.cleanup_directory(temp_dir_str)
@@ -151,6 +160,8 @@ def run_manual_interactive():
                 break
             print("Target size must be greater than 0, please try again.")
 
+    page_cache = cache.open_cache(SimpleNamespace())
+
     # Process files or directories
     if src_path.is_file() and src_path.suffix.lower() == '.pdf':
         # If the target is a directory, construct the file name
@@ -165,7 +176,7 @@ def run_manual_interactive():
             print("Start split protocol (interactive manual)...")
             return splitter.run_splitting_protocol(src_path, dest_path, args)
         else:
-            return run_single_manual(src_path, out_file, dpi, bg_downsample, jpeg2000, keep_temp_on_failure=keep_temp_on_failure)
+            return run_single_manual(src_path, out_file, dpi, bg_downsample, jpeg2000, keep_temp_on_failure=keep_temp_on_failure, page_cache=page_cache)
 
     elif src_path.is_dir():
         # Batch directory: Make sure the destination is a directory
@@ -184,7 +195,7 @@ def run_manual_interactive():
                 ok = splitter.run_splitting_protocol(pdf, out_dir, args)
             else:
                 out_file = out_dir / f"{pdf.stem}_manual.pdf"
-                ok = run_single_manual(pdf, out_file, dpi, bg_downsample, jpeg2000, keep_temp_on_failure=keep_temp_on_failure)
+                ok = run_single_manual(pdf, out_file, dpi, bg_downsample, jpeg2000, keep_temp_on_failure=keep_temp_on_failure, page_cache=page_cache)
 
             if ok:
                 success_count += 1
@@ -1,15 +1,26 @@
 # orchestrator.py
 
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from compressor import utils, strategy, splitter
+from compressor import accounting, dedup, pipeline, utils, strategy, splitter, scheduler, trace
+from compressor.session import DocumentSession
 
 def process_file(file_path, args):
     """
     General entry point for processing single PDF files.
     """
+    # The external commands of the file are recorded under its name (see compressor.accounting)
+    with accounting.tagged(file=file_path.name), trace.span(file_path.name, 'file'):
+        return _process_file(file_path, args)
+
+def _process_file(file_path, args):
     logging.info(f"================== Start processing files: {file_path.name} ==================")
     
+    session = None
+    success = False
+    work_dir = None
     try:
         original_size_mb = utils.get_file_size_mb(file_path)
         logging.info(f"Original file size: {original_size_mb:.2f}MB")
@@ -23,13 +34,24 @@ def process_file(file_path, args):
                 logging.info(f"The original file has been copied to the output directory: {output_path}")
             return True
 
+        if args.drop_blank_pages:
+            work_dir = utils.create_temp_directory()
+            file_path = _without_blank_pages(file_path, Path(work_dir))
+
+        # One session per document: the images and hOCR of the iterative compression are reused by the splitting protocol
+        session = DocumentSession.from_args(file_path, args)
+
         # Run iterative compression
         logging.info(f"Start the iterative compression process...")
         success, result_path = strategy.run_iterative_compression(
             file_path,
             Path(args.output_dir),
             args.target_size,
-            keep_temp_on_failure=getattr(args, 'keep_temp_on_failure', False)
+            session=session,
+            speculative_jobs=args.speculative_jobs,
+            search_mode=args.search_mode,
+            predict=not args.no_predict,
+            allocate=args.per_page_allocation
         )
 
         if success:
@@ -40,8 +62,10 @@ def process_file(file_path, args):
             split_success = splitter.run_splitting_protocol(
                 file_path, 
                 Path(args.output_dir), 
-                args
+                args,
+                session=session
             )
+            success = split_success
             if split_success:
                 logging.info(f"✓ Split and compress successfully: {file_path.name}")
                 return True
@@ -56,8 +80,34 @@ def process_file(file_path, args):
         logging.critical(f"An unexpected error occurred while processing file {file_path.name}: {e}", exc_info=True)
         return False
     finally:
+        if session:
+            session.close(success)
+        if work_dir:
+            utils.cleanup_directory(work_dir)
         logging.info(f"================== End of file processing: {file_path.name} ==================\n")
 
+def _without_blank_pages(file_path, work_dir):
+    """
+    Copy of the PDF without its blank pages (see compressor.dedup), written to work_dir under the
+    same file name so that the outputs are still named after the input.
+    Returns file_path itself when no page is dropped.
+    """
+    page_count = pipeline.get_pdf_page_count(file_path)
+    analysis = dedup.analyze_pdf(file_path, page_count) if page_count else None
+    if not analysis or not analysis.blank:
+        return file_path
+    if len(analysis.blank) == page_count:
+        logging.warning("Every page looks blank, no page is dropped")
+        return file_path
+    kept = [(file_path, page) for page in range(1, page_count + 1) if page not in analysis.blank]
+    trimmed_path = work_dir / file_path.name
+    if not pipeline.assemble_pdf(kept, trimmed_path):
+        logging.warning("Unable to remove the blank pages, process all pages")
+        return file_path
+    logging.info(f"Dropped {len(analysis.blank)} blank pages ({', '.join(map(str, sorted(analysis.blank)))}), "
+                 f"{len(kept)} of {page_count} pages remain")
+    return trimmed_path
+
 def process_directory(input_dir, args):
     """
     Process all PDF files in the directory.
@@ -81,21 +131,35 @@ def process_directory(input_dir, args):
     logging.info(f"Found {len(unique_files)} PDF files, ready to process...")
     
     results = []
-    successful_count = 0
-    failed_count = 0
-    
-    for i, pdf_file in enumerate(unique_files, 1):
-        logging.info(f"\n>>> Processing progress: {i}/{len(unique_files)} <<<")
-        success = process_file(pdf_file, args)
-        results.append({
-            'file': pdf_file,
-            'success': success
-        })
-        
-        if success:
-            successful_count += 1
-        else:
-            failed_count += 1
+    jobs = max(1, min(args.jobs or 1, len(unique_files)))
+    
+    if jobs == 1:
+        for i, pdf_file in enumerate(unique_files, 1):
+            logging.info(f"\n>>> Processing progress: {i}/{len(unique_files)} <<<")
+            success, seconds = _timed_process_file(pdf_file, args)
+            results.append({'file': pdf_file, 'success': success, 'seconds': seconds})
+    else:
+        # Files run side by side; their external tools share the CPU/memory budget of resources.py.
+        # Each file logs into its own buffer, written out in one block when the file is done.
+        logging.info(f"Process up to {jobs} files in parallel (per-file logs are written when a file is finished)")
+        outcomes = {}
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            dispatch = scheduler.dispatch_order(unique_files, args.target_size, args.schedule)
+            futures = {
+                executor.submit(_process_file_buffered, pdf_file, args): pdf_file
+                for pdf_file in dispatch
+            }
+            for completed, future in enumerate(as_completed(futures), 1):
+                pdf_file = futures[future]
+                outcomes[pdf_file] = future.result()
+                logging.info(f">>> Processing progress: {completed}/{len(unique_files)} ({pdf_file.name} finished) <<<")
+        # Report in input order, independent of completion order
+        for pdf_file in unique_files:
+            success, seconds = outcomes[pdf_file]
+            results.append({'file': pdf_file, 'success': success, 'seconds': seconds})
+    
+    successful_count = sum(1 for result in results if result['success'])
+    failed_count = len(results) - successful_count
     
     # Generate processing report
     logging.info(f"\n" + "="*60)
@@ -115,6 +179,17 @@ def process_directory(input_dir, args):
     
     return results
 
+def _timed_process_file(file_path, args):
+    """Run process_file and measure its wall time. Returns (success, seconds)."""
+    start = time.monotonic()
+    success = process_file(file_path, args)
+    return success, time.monotonic() - start
+
+def _process_file_buffered(file_path, args):
+    """process_file for a pool thread: the file's log records are written in one block."""
+    with utils.buffered_logging():
+        return _timed_process_file(file_path, args)
+
 def generate_summary_report(results, output_dir):
     """
     Generate a summary report of processing results.
@@ -133,20 +208,21 @@ def generate_summary_report(results, output_dir):
             f.write(f"Total number of files: {len(results)}\n")
             f.write(f"Successful processing: {len(successful)}\n")
             f.write(f"Processing failed: {len(failed)}\n")
-            f.write(f"Success rate: {(len(successful)/len(results)*100):.1f}%\n\n")
+            f.write(f"Success rate: {(len(successful)/len(results)*100):.1f}%\n")
+            f.write(f"Total processing time (sum over files): {sum(r.get('seconds', 0) for r in results):.1f}s\n\n")
             
             if successful:
                 f.write("File processed successfully:\n")
                 f.write("-" * 30 + "\n")
                 for result in successful:
-                    f.write(f"✓ {result['file'].name}\n")
+                    f.write(f"✓ {result['file'].name}{_format_seconds(result)}\n")
                 f.write("\n")
             
             if failed:
                 f.write("File processing failed:\n")
                 f.write("-" * 30 + "\n")
                 for result in failed:
-                    f.write(f"✗ {result['file'].name}\n")
+                    f.write(f"✗ {result['file'].name}{_format_seconds(result)}\n")
                 f.write("\n")
             
             f.write("For detailed logs, please view the logs/process.log file\n")
@@ -156,6 +232,23 @@ def generate_summary_report(results, output_dir):
     except Exception as e:
         logging.error(f"Error generating report: {e}")
 
+def _format_seconds(result):
+    return f" ({result['seconds']:.1f}s)" if 'seconds' in result else ""
+
+def parse_tool_limits(values):
+    """Parse --tool-limit TOOL=N values into {tool: n}; None if a value is invalid."""
+    limits = {}
+    for value in values or []:
+        tool, _, count = value.partition('=')
+        try:
+            limits[tool.strip()] = int(count)
+        except ValueError:
+            limits[tool.strip()] = 0
+        if not tool.strip() or limits[tool.strip()] < 1:
+            logging.error(f"Invalid tool limit (expected TOOL=N with N >= 1): {value}")
+            return None
+    return limits
+
 def validate_arguments(args):
     """
     Verify the validity of command line parameters.
@@ -178,7 +271,79 @@ def validate_arguments(args):
         logging.error(f"The maximum number of splits should be between 2-10: {args.max_splits}")
         return False
     
-    #Create output directory
+    # Check the number of parallel OCR workers
+    ocr_jobs = args.ocr_jobs
+    if ocr_jobs is not None and ocr_jobs < 1:
+        logging.error(f"The number of OCR workers must be at least 1: {ocr_jobs}")
+        return False
+    
+    ocr_batch_pages = args.ocr_batch_pages
+    if ocr_batch_pages is not None and ocr_batch_pages < 1:
+        logging.error(f"The number of pages per OCR batch must be at least 1: {ocr_batch_pages}")
+        return False
+    
+    ocr_dpi = args.ocr_dpi
+    if ocr_dpi is not None and ocr_dpi < 1:
+        logging.error(f"The OCR resolution must be at least 1 DPI: {ocr_dpi}")
+        return False
+    
+    # Check the number of speculative rebuilds
+    speculative_jobs = args.speculative_jobs
+    if speculative_jobs is not None and speculative_jobs < 1:
+        logging.error(f"The number of speculative rebuilds must be at least 1: {speculative_jobs}")
+        return False
+    
+    # Check the number of parallel rebuild processes
+    rebuild_jobs = args.rebuild_jobs
+    if rebuild_jobs is not None and rebuild_jobs < 1:
+        logging.error(f"The number of rebuild processes must be at least 1: {rebuild_jobs}")
+        return False
+    
+    # Check the streaming pipeline settings
+    pipeline_chunk_pages = args.pipeline_chunk_pages
+    if pipeline_chunk_pages is not None and pipeline_chunk_pages < 0:
+        logging.error(f"The number of pages per pipeline chunk cannot be negative: {pipeline_chunk_pages}")
+        return False
+    pipeline_queue_chunks = args.pipeline_queue_chunks
+    if pipeline_queue_chunks is not None and pipeline_queue_chunks < 1:
+        logging.error(f"The number of pipeline chunks in flight must be at least 1: {pipeline_queue_chunks}")
+        return False
+    
+    # Check the number of files processed in parallel and the resource budget
+    jobs = args.jobs
+    if jobs is not None and jobs < 1:
+        logging.error(f"The number of parallel files must be at least 1: {jobs}")
+        return False
+    cpus = args.cpus
+    if cpus is not None and cpus < 1:
+        logging.error(f"The CPU budget must be at least 1: {cpus}")
+        return False
+    max_memory_mb = args.max_memory_mb
+    if max_memory_mb is not None and max_memory_mb <= 0:
+        logging.error(f"The memory budget must be greater than 0: {max_memory_mb}")
+        return False
+    process_address_space_mb = args.process_address_space_mb
+    if process_address_space_mb is not None and process_address_space_mb <= 0:
+        logging.error(f"The process address space limit must be greater than 0: {process_address_space_mb}")
+        return False
+    scratch_budget_mb = args.scratch_budget_mb
+    if scratch_budget_mb is not None and scratch_budget_mb <= 0:
+        logging.error(f"The scratch budget must be greater than 0: {scratch_budget_mb}")
+        return False
+    command_timeout = args.command_timeout
+    if command_timeout is not None and command_timeout <= 0:
+        logging.error(f"The command timeout must be greater than 0: {command_timeout}")
+        return False
+    if parse_tool_limits(args.tool_limit) is None:
+        return False
+    
+    # Check the page cache size
+    cache_size_mb = args.cache_size_mb
+    if cache_size_mb is not None and cache_size_mb <= 0:
+        logging.error(f"The page cache size must be greater than 0: {cache_size_mb}")
+        return False
+    
+        #Create output directory
     try:
         output_path.mkdir(parents=True, exist_ok=True)
     except Exception as e:
@@ -0,0 +1,63 @@
+"""Per-page parameter allocation: multiple-choice knapsack within a size budget"""
+import itertools
+import random
+import sys
+from pathlib import Path
+
+import pytest
+
+project_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(project_root))
+
+from compressor import allocator
+
+
+def brute_force(page_sizes, page_values, budget):
+    best = None
+    for choice in itertools.product(*(range(len(s)) for s in page_sizes)):
+        size = sum(s[o] for s, o in zip(page_sizes, choice))
+        if size <= budget:
+            value = sum(v[o] for v, o in zip(page_values, choice))
+            best = value if best is None else max(best, value)
+    return best
+
+
+@pytest.mark.parametrize("seed", range(25))
+def test_allocation_fits_budget_and_is_near_optimal(seed):
+    rng = random.Random(seed)
+    pages = rng.randint(1, 5)
+    options = 4
+    page_sizes = [sorted(rng.uniform(0.1, 2) for _ in range(options)) for _ in range(pages)]
+    page_values = [sorted(rng.uniform(0, 10) for _ in range(options)) for _ in range(pages)]
+    budget = rng.uniform(sum(s[0] for s in page_sizes), sum(s[-1] for s in page_sizes))
+
+    choice = allocator.allocate(page_sizes, page_values, budget)
+    assert sum(s[o] for s, o in zip(page_sizes, choice)) <= budget + 1e-9
+    value = sum(v[o] for v, o in zip(page_values, choice))
+    # Greedy on the convex hulls loses at most one page's largest upgrade
+    largest_gain = max(v[-1] - v[0] for v in page_values)
+    assert value >= brute_force(page_sizes, page_values, budget) - largest_gain - 1e-9
+
+
+def test_budget_goes_to_photo_pages():
+    ladder = [{'dpi': 300, 'bg_downsample': bg} for bg in (1, 2, 4)]
+    text_page = [0.2 / bg for bg in (1, 2, 4)]
+    photo_page = [2.0 / bg for bg in (1, 2, 4)]
+    page_sizes = [text_page, photo_page, text_page]
+    page_values = [[allocator.option_quality(p, w) for p in ladder] for w in (0.05, 1.0, 0.05)]
+    # Enough for the photo page at full quality only if the text pages go aggressive
+    choice = allocator.allocate(page_sizes, page_values, 2.0 + 2 * 0.05 + 0.01)
+    assert choice == [2, 0, 2]
+    assert allocator.allocate(page_sizes, page_values, 0.1) is None
+
+
+def test_page_size_model_adds_up_to_prediction():
+    ladder = [{'dpi': dpi, 'bg_downsample': bg} for dpi, bg in ((300, 1), (300, 2), (250, 3), (200, 4))]
+    predicted = [0.5 * p['dpi'] / 300 + 4.0 * (p['dpi'] / 300) ** 2 / p['bg_downsample'] ** 2 for p in ladder]
+    complexity = [1, 1, 10, 1]
+    page_sizes = allocator.page_size_model(predicted, ladder, complexity)
+    for option, size in enumerate(predicted):
+        assert sum(page[option] for page in page_sizes) == pytest.approx(size)
+    # The photo page carries most of the background bytes
+    assert page_sizes[2][0] > 5 * page_sizes[0][0]
+    assert allocator.photo_weights(complexity) == [0.0, 0.0, 1.0, 0.0]
@@ -0,0 +1,43 @@
+"""Benchmark suite: the synthetic corpus is reproducible and the comparison flags regressions"""
+import re
+import sys
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(project_root))
+sys.path.insert(0, str(project_root / "benchmarks"))
+
+import bench_pipeline
+import corpus
+
+DOCUMENT = corpus.Document('sample', ('text', 'photo', 'mixed'), 7)
+
+
+def test_corpus_is_reproducible(tmp_path):
+    first = corpus.build_document(DOCUMENT, tmp_path / "first.pdf")
+    second = corpus.build_document(DOCUMENT, tmp_path / "second.pdf")
+    assert corpus.digest(first) == corpus.digest(second)
+
+    data = first.read_bytes()
+    assert data.count(b"/Type /Page ") == 3
+    # Every xref entry points at the start of its object
+    xref = int(re.search(rb"startxref\n(\d+)", data).group(1))
+    offsets = re.findall(rb"(\d{10}) 00000 n ", data[xref:])
+    for number, offset in enumerate(offsets, 1):
+        assert data[int(offset):].startswith(b"%d 0 obj" % number)
+
+
+def result(median, sha="abc"):
+    return {'settings': {'dpi': 300}, 'documents': {
+        'sample': {'sha256': sha, 'stages': {'analyze': {'median': median}, 'split': {'median': 0.01}}}}}
+
+
+def test_compare_flags_regressions():
+    rows, regressions, warnings = bench_pipeline.compare_results(result(1.0), result(1.25), threshold=0.1)
+    assert [row[1] for row in regressions] == ['analyze']
+    assert len(rows) == 2 and not warnings
+
+    # Within the threshold, or too small in absolute terms, or another corpus
+    assert not bench_pipeline.compare_results(result(1.0), result(1.05), threshold=0.1)[1]
+    assert not bench_pipeline.compare_results(result(0.01), result(0.03), threshold=0.1)[1]
+    assert bench_pipeline.compare_results(result(1.0), result(1.0, sha="def"))[2]
@@ -0,0 +1,71 @@
+"""Persistent page cache: hits, misses and LRU eviction"""
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+project_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(project_root))
+
+from compressor.cache import PageCache, open_cache
+
+
+def write(path, size):
+    path.write_bytes(b"x" * size)
+    return path
+
+
+def test_put_and_get(tmp_path):
+    cache = PageCache(tmp_path / "cache", max_size_mb=1)
+    key = cache.image_key("ab" * 32, 300)
+    assert not cache.get(key, tmp_path / "miss.tif")
+    cache.put(key, write(tmp_path / "page.tif", 100))
+    assert cache.get(key, tmp_path / "hit.tif")
+    assert (tmp_path / "hit.tif").read_bytes() == b"x" * 100
+    assert cache.stats["image"] == [1, 1]
+
+
+def test_hocr_key_follows_rendered_image(tmp_path):
+    cache = PageCache(tmp_path / "cache")
+    image = tmp_path / "page-1.tif"
+    assert cache.hocr_key_for_image(image, "eng") is None
+    cache.remember_image(image, "cd" * 32, 200)
+    assert cache.hocr_key_for_image(image, "eng") == cache.hocr_key("cd" * 32, 200, "eng")
+    # OCR of a downscaled grayscale copy has its own key
+    assert cache.hocr_key_for_image(image, "eng", 150) == f"hocr-{'cd' * 32}-200-eng-ocr150g"
+    assert cache.hocr_key_for_image(image, "eng", 200) == cache.hocr_key("cd" * 32, 200, "eng")
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = PageCache(tmp_path / "cache", max_size_mb=2.5 / 1024)  # 2.5KB
+    keys = [cache.image_key(f"{i:02d}" * 32, 300) for i in range(3)]
+    cache.put(keys[0], write(tmp_path / "a", 1024))
+    time.sleep(0.01)
+    cache.put(keys[1], write(tmp_path / "b", 1024))
+    time.sleep(0.01)
+    assert cache.get(keys[0], tmp_path / "a2")  # keys[0] is now the most recently used
+    time.sleep(0.01)
+    cache.put(keys[2], write(tmp_path / "c", 1024))
+
+    assert cache.get(keys[0], tmp_path / "a3")
+    assert cache.get(keys[2], tmp_path / "c3")
+    assert not cache.get(keys[1], tmp_path / "b3")
+
+
+def test_objects_are_not_shared_with_scratch_files(tmp_path):
+    cache = PageCache(tmp_path / "cache")
+    key = cache.hocr_key("ef" * 32, 300, "eng")
+    source = write(tmp_path / "page-1.hocr", 10)
+    cache.put(key, source)
+    source.write_bytes(b"rewritten in place")  # e.g. a rescale writing into the staged file
+    assert cache.get(key, tmp_path / "restored.hocr")
+    (tmp_path / "restored.hocr").write_bytes(b"changed again")
+    assert cache.get(key, tmp_path / "again.hocr")
+    assert (tmp_path / "again.hocr").read_bytes() == b"x" * 10
+
+
+def test_cache_is_opt_in(tmp_path):
+    assert open_cache(SimpleNamespace(cache_dir=None, cache_size_mb=None, no_cache=False)) is None
+    assert open_cache(SimpleNamespace(cache_dir=str(tmp_path / "c"), cache_size_mb=None, no_cache=True)) is None
+    cache = open_cache(SimpleNamespace(cache_dir=str(tmp_path / "c"), cache_size_mb=None, no_cache=False))
+    assert cache.cache_dir == tmp_path / "c" and (tmp_path / "c" / "objects").is_dir()
@@ -0,0 +1,68 @@
+"""Colour modes: page classification and rendering a mixed stack of colour, grayscale and bitonal pages"""
+import sys
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(project_root))
+
+from compressor import colormode, pipeline, utils
+
+IMAGE_LIST = """page   num  type   width height color comp bpc  enc interp  object ID x-ppi y-ppi size ratio
+--------------------------------------------------------------------------------------------
+   1     0 image    2550  3300  gray    1   1  ccitt  no        10  0   300   300  50K 0.5%
+   2     1 image    2550  3300  gray    1   8  jpeg   no        11  0   300   300  400K 4.8%
+   3     2 image    2550  3300  gray    1   1  jbig2  no        12  0   300   300  40K 0.4%
+   3     3 smask    2550  3300  gray    1   8  image  no        13  0   300   300  20K 0.1%
+"""
+
+
+def gray_pixels(count, value=128):
+    return bytes([value, value, value]) * count
+
+
+def test_hue_needs_a_noticeable_share_of_coloured_pixels():
+    # Anti-aliased text on white: black, white and midtones, but no hue
+    text = gray_pixels(5000, 255) + gray_pixels(3000, 0) + gray_pixels(2000, 140)
+    assert not colormode.has_hue(text)
+    # A red stamp
+    assert colormode.has_hue(text + bytes([200, 30, 30]) * 100)
+    # A few stray coloured pixels (scanner noise) do not make a colour page
+    assert not colormode.has_hue(text + bytes([200, 30, 30]) * 5)
+    # Slight tints below HUE_LEVELS quantization steps are gray
+    assert not colormode.has_hue(bytes([250, 244, 240]) * 1000)
+    assert not colormode.has_hue(b"")
+
+
+def test_classify_page_by_hue_and_image_depth():
+    assert colormode.bitonal_pages(pipeline.parse_image_list(IMAGE_LIST)) == {1}
+    text = gray_pixels(1000, 255) + gray_pixels(200, 0)
+    assert colormode.classify_page(text, True) == colormode.BITONAL
+    assert colormode.classify_page(text, False) == colormode.GRAY
+    assert colormode.classify_page(text + bytes([0, 0, 255]) * 100, True) == colormode.COLOR
+
+
+def test_mode_runs():
+    modes = ['bitonal', 'bitonal', 'color', 'gray', 'gray', 'bitonal']
+    assert colormode.mode_runs(modes, 2, 6) == [(2, 2, 'bitonal'), (3, 3, 'color'), (4, 5, 'gray'), (6, 6, 'bitonal')]
+    assert colormode.mode_runs(None, 1, 3) == [(1, 3, 'color')]
+
+
+def test_render_mixed_stack(monkeypatch, tmp_path):
+    commands = []
+
+    def fake_run(command, **kwargs):
+        commands.append(command)
+        first, last = int(command[command.index("-f") + 1]), int(command[command.index("-l") + 1])
+        suffix = {"-gray": ".pgm", "-mono": ".pbm"}.get(command[1], ".ppm")
+        for page in range(first, last + 1):
+            (tmp_path / f"page-{page:02d}{suffix}").write_bytes(b"P")
+        return True
+
+    monkeypatch.setattr(utils, "run_command", fake_run)
+    modes = ['color', 'gray', 'gray', 'bitonal'] + ['bitonal'] * 6
+    images = pipeline.render_page_range(tmp_path / "doc.pdf", tmp_path, 300, 1, 4, 10, image_format="pnm", color_modes=modes)
+    assert [image.name for image in images] == ["page-01.ppm", "page-02.pgm", "page-03.pgm", "page-04.pbm"]
+    assert [command[1:3] for command in commands] == [["-r", "300"], ["-gray", "-r"], ["-mono", "-r"]]
+    # recode_pdf gets one glob for the whole stack
+    assert pipeline._suffix_pattern([image.suffix for image in images]) == ".p[bgp]m"
+    assert pipeline._suffix_pattern([".tif", ".tif"]) == ".tif"
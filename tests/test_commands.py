@@ -0,0 +1,174 @@
+"""Asyncio command engine: streaming, timeouts, cancellation, per-tool limits"""
+import asyncio
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(project_root))
+
+from compressor import accounting, commands, resources, search, utils
+
+
+def _alive(pid):
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().split(')')[-1].split()[0] != 'Z'
+    except FileNotFoundError:
+        return False
+
+
+def test_run_collects_output_and_exit_status():
+    result = commands.run(["sh", "-c", "echo one; echo two >&2; exit 3"])
+    assert result.returncode == 3
+    assert result.stdout == "one"
+    assert result.stderr == "two"
+    assert result.error is None
+
+
+def test_run_command_wrapper_keeps_boolean_result():
+    assert utils.run_command(["true"]) is True
+    assert utils.run_command(["false"]) is False
+    assert utils.run_command(["no-such-tool-for-this-test"]) is False
+
+
+def test_output_is_logged_while_the_command_runs():
+    seen = threading.Event()
+
+    class Watch(logging.Handler):
+        def emit(self, record):
+            if "started" in record.getMessage():
+                seen.set()
+
+    handler = Watch(level=logging.DEBUG)
+    root = logging.getLogger()
+    old_level = root.level
+    root.addHandler(handler)
+    root.setLevel(logging.DEBUG)
+    try:
+        begin = time.monotonic()
+        thread = threading.Thread(target=commands.run, args=(["sh", "-c", "echo started; sleep 1"],))
+        thread.start()
+        assert seen.wait(5)
+        assert time.monotonic() - begin < 0.9
+        thread.join()
+    finally:
+        root.removeHandler(handler)
+        root.setLevel(old_level)
+
+
+def test_timeout_kills_the_process_group():
+    begin = time.monotonic()
+    result = commands.run(["sh", "-c", "sleep 30 & echo $!; wait"], timeout=0.5)
+    assert result.error == commands.TIMEOUT
+    assert result.returncode is None
+    assert time.monotonic() - begin < 5
+    helper_pid = int(result.stdout)
+    time.sleep(0.1)
+    assert not _alive(helper_pid)
+
+
+def test_cancel_scope_kills_running_commands():
+    scope = commands.CancelScope()
+    results = []
+
+    def worker():
+        with scope:
+            results.append(commands.run(["sh", "-c", "sleep 30"]))
+            # Commands started after the cancellation do not run at all
+            results.append(commands.run(["true"]))
+
+    thread = threading.Thread(target=worker)
+    begin = time.monotonic()
+    thread.start()
+    time.sleep(0.3)
+    scope.cancel()
+    thread.join(10)
+    assert time.monotonic() - begin < 5
+    assert [r.error for r in results] == [commands.CANCELLED, commands.CANCELLED]
+
+
+def test_tool_limit_serializes_one_tool():
+    engine = commands.CommandEngine(tool_limits={"sleep": 1})
+
+    async def three():
+        return await asyncio.gather(*(engine.run_async(["sleep", "0.3"]) for _ in range(3)))
+
+    begin = time.monotonic()
+    results = asyncio.run(three())
+    assert all(r.returncode == 0 for r in results)
+    assert time.monotonic() - begin >= 0.85
+
+
+def test_speculative_probe_stops_running_losers():
+    def rebuild(index):
+        if index == 0:
+            time.sleep(0.2)
+            return (1.0, "first")
+        # Still running when the first result makes it a loser
+        ok = utils.run_command(["sleep", "30"])
+        return (0.5, "second") if ok else None
+
+    begin = time.monotonic()
+    probe = search.SpeculativeProbe(rebuild, [0, 1], 2, lambda results: [1] if 0 in results else [])
+    assert probe.result(0) == (1.0, "first")
+    probe.close()
+    assert time.monotonic() - begin < 5
+    assert 1 not in probe.known()
+
+
+def test_launcher_reports_peak_memory_and_applies_the_limit(monkeypatch):
+    monkeypatch.setattr(resources, "_peaks", {})
+    allocate = [sys.executable, "-c", "x = bytearray(150 * 1024 * 1024)"]
+    result = commands.run(allocate)
+    assert result.returncode == 0 and result.stderr == ""
+    assert resources.peak_report()[Path(sys.executable).name] >= 150
+
+    monkeypatch.setattr(resources, "_budget", resources.ResourceBudget(cpus=2, process_limit_mb=100))
+    result = commands.run(allocate)
+    assert result.returncode != 0
+    assert "MemoryError" in result.stderr
+
+
+def test_memory_budget_does_not_cap_the_address_space_of_tools(monkeypatch):
+    # 16 threads reserve 8MB stacks each: far more address space than resident memory
+    threaded = [sys.executable, "-c",
+                "import threading; b = threading.Barrier(16, timeout=5); t = [threading.Thread(target=b.wait, daemon=True) for _ in range(16)]; "
+                "[x.start() for x in t]; [x.join() for x in t]; print('done')"]
+    monkeypatch.setattr(resources, "_budget", resources.ResourceBudget(cpus=2, memory_mb=100))
+    result = commands.run(threaded)
+    assert result.returncode == 0 and result.stdout == "done"
+    assert result.usage.peak_rss_mb < 100
+
+    # The same child fails under an address space cap of the budget's size
+    monkeypatch.setattr(resources, "_budget", resources.ResourceBudget(cpus=2, memory_mb=100, process_limit_mb=100))
+    assert commands.run(threaded).returncode != 0
+
+
+def test_commands_run_without_the_launcher(monkeypatch):
+    monkeypatch.setattr(commands, "launcher", None)
+    result = commands.run(["sh", "-c", "echo one; echo two >&2; exit 3"])
+    assert result.returncode == 3 and result.stdout == "one" and result.stderr == "two"
+    assert result.usage.wall_seconds > 0 and result.usage.peak_rss_mb is None
+
+
+def test_command_records_carry_usage_and_tags(monkeypatch, tmp_path):
+    log_path = tmp_path / "commands.jsonl"
+    monkeypatch.setattr(accounting, "_log", accounting.CommandLog(log_path))
+    output = tmp_path / "out.bin"
+    busy = [sys.executable, "-c", f"open({str(output)!r}, 'wb').write(b'x' * 5000); sum(range(3_000_000))"]
+    with accounting.tagged(file="doc.pdf"), accounting.tagged(attempt=2):
+        assert utils.run_command(busy, stage="rebuild", outputs=[tmp_path / "*.bin"])
+    assert not utils.run_command(["false"])
+    accounting.command_log().close()
+
+    first, second = [json.loads(line) for line in log_path.read_text().splitlines()]
+    assert first["stage"] == "rebuild" and first["file"] == "doc.pdf" and first["attempt"] == 2
+    assert first["status"] == "ok" and first["bytes_written"] == 5000
+    assert first["wall_seconds"] > 0 and first["user_seconds"] > 0 and first["peak_rss_mb"] > 0
+    assert second["stage"] == "false" and second["status"] == "failed" and "file" not in second
+    assert "rebuild 1x" in accounting.command_log().report()
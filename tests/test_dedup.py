@@ -0,0 +1,111 @@
+"""Blank and near-duplicate pages: detection on low-resolution renders and reuse of their OCR"""
+import random
+import sys
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(project_root))
+
+from compressor import colormode, dedup, hocr, pipeline
+
+WIDTH, HEIGHT = 120, 160
+
+
+def text_page(seed):
+    """A page of 'text lines': dark runs of random length on white, different for every seed."""
+    rng = random.Random(seed)
+    pixels = bytearray([255]) * (WIDTH * HEIGHT)
+    for top in range(15, HEIGHT - 15, 8):
+        x = 12
+        while x < WIDTH - 20:
+            length = rng.randint(3, 12)
+            for row in range(top, top + 3):
+                pixels[row * WIDTH + x:row * WIDTH + x + length] = bytes([20]) * length
+            x += length + rng.randint(2, 5)
+    return bytes(pixels)
+
+
+def with_specks(gray, positions, value=0):
+    pixels = bytearray(gray)
+    for position in positions:
+        pixels[position] = value
+    return bytes(pixels)
+
+
+def thumb(gray):
+    return dedup.thumbnail(WIDTH, HEIGHT, gray)
+
+
+def test_blank_pages_ignore_borders_and_dust():
+    white = bytes([250]) * (WIDTH * HEIGHT)
+    # A dark scanner border along the left edge and a few dust specks
+    border = with_specks(white, [row * WIDTH + column for row in range(HEIGHT) for column in range(4)])
+    dusty = with_specks(border, [50 * WIDTH + 60, 80 * WIDTH + 30, 81 * WIDTH + 30])
+    assert dedup.ink_share(WIDTH, HEIGHT, dusty) <= dedup.BLANK_INK_SHARE
+    assert dedup.ink_share(WIDTH, HEIGHT, text_page(1)) > 0.05
+    analysis = dedup.PageAnalysis([thumb(dusty), thumb(text_page(1)), thumb(white)])
+    assert analysis.blank == {1, 3}
+    assert analysis.color_modes(None) == [colormode.BITONAL, colormode.COLOR, colormode.BITONAL]
+
+
+def test_hash_index_finds_every_hash_within_the_distance():
+    index = dedup.HashIndex(bits=64, bands=8)
+    rng = random.Random(7)
+    stored = [rng.getrandbits(64) for _ in range(50)]
+    for key, value in enumerate(stored):
+        index.add(key, value)
+    query = stored[20]
+    for bit in rng.sample(range(64), 7):  # fewer flipped bits than bands
+        query ^= 1 << bit
+    assert 20 in index.candidates(query)
+    assert len(index.candidates(query)) < len(stored)
+
+
+def test_near_duplicates_are_found_and_distinct_pages_are_not():
+    pages = [text_page(1), text_page(2), with_specks(text_page(1), [40 * WIDTH + 100, 90 * WIDTH + 5]), text_page(3), text_page(2)]
+    analysis = dedup.PageAnalysis([thumb(page) for page in pages])
+    assert analysis.blank == set()
+    assert analysis.duplicates == {3: 1, 5: 2}
+    assert analysis.skips_ocr(3) and not analysis.skips_ocr(4)
+    # Same layout, different content in one line: not a duplicate
+    altered = bytearray(text_page(1))
+    for row in range(39, 42):
+        altered[row * WIDTH + 12:row * WIDTH + 100] = bytes([255, 20] * 44)
+    assert not dedup.is_duplicate(thumb(text_page(1)), thumb(bytes(altered)))
+
+
+def test_blank_and_duplicate_pages_skip_ocr(monkeypatch, tmp_path):
+    pages = [text_page(1), bytes([255]) * (WIDTH * HEIGHT), text_page(1)]
+    analysis = dedup.PageAnalysis([thumb(page) for page in pages])
+    ocr_calls = []
+
+    def fake_ocr(img_path, temp_dir, thread_limit=None, cache=None):
+        ocr_calls.append(img_path.name)
+        hocr_file = temp_dir / f"{img_path.stem}.hocr"
+        hocr_file.write_text("<div class='ocr_page' title='bbox 0 0 10 10'></div>")
+        return hocr_file
+
+    monkeypatch.setattr(pipeline, "ocr_image", fake_ocr)
+    images = [tmp_path / f"page-{page}.tif" for page in (1, 2, 3)]
+    hocr_files = pipeline.ocr_images(images, tmp_path, jobs=2, dpi=300, page_analysis=analysis)
+    assert ocr_calls == ["page-1.tif"]
+    assert [path.name for path in hocr_files] == ["page-1.hocr", "page-2.hocr", "page-1.hocr"]
+    # The blank page gets an empty page at the render resolution (ANALYSIS_DPI -> 300 DPI)
+    assert f"bbox 0 0 {WIDTH * 10} {HEIGHT * 10}" in hocr_files[1].read_text()
+    assert hocr.merge_hocr_files(hocr_files, tmp_path / "combined.hocr") == 3
+    # The duplicate is built from the image of its original only when the renders are identical
+    images[0].write_bytes(b"render")
+    images[2].write_bytes(b"render")
+    assert analysis.source_page(3, images) == 1
+    images[2].write_bytes(b"render with a signature")
+    assert analysis.source_page(3, images) == 3
+    assert analysis.source_page(1, images) == 1
+
+
+def test_stacks_with_duplicate_images(tmp_path):
+    original = tmp_path / "page-1.tif"
+    original.write_bytes(b"image")
+    (tmp_path / "page-2.tif").write_bytes(b"image")
+    assert not dedup.shares_images([original, tmp_path / "page-2.tif"])
+    (tmp_path / "page-3.tif").hardlink_to(original)
+    assert dedup.shares_images([original, tmp_path / "page-2.tif", tmp_path / "page-3.tif"])
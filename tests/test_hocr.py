@@ -0,0 +1,103 @@
+"""hOCR merging and rewriting helpers"""
+import io
+import sys
+from pathlib import Path
+
+import pytest
+
+project_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(project_root))
+
+from compressor import hocr
+
+PAGE = """<?xml version="1.0" encoding="UTF-8"?>
+<html><head><title></title><meta name='ocr-system' content='tesseract' /></head>
+<body>
+  <div class='ocr_page' id='page_1' title='image "page-{n}.tif"; bbox 0 0 2480 3508; ppageno 0'>
+   <div class='ocr_carea' id='block_1_1' title="bbox 10 20 400 80">
+    <p class='ocr_par' id='par_1_1' lang='eng'>
+     <span class='ocr_line' id='line_1_1' title="bbox 10 20 400 80"><span class='ocrx_word' id='word_1_1' title='bbox 10 20 90 80; x_wconf 96'>Page&amp;{n}</span><br/></span>
+    </p>
+   </div>
+  </div>
+</body>
+</html>
+"""
+
+
+def page_body(n):
+    text = PAGE.format(n=n)
+    start = text.index("<div class='ocr_page'")
+    end = text.index("</body>")
+    return text[start:end].rstrip() + "\n"
+
+
+def test_split_restores_page_ranges(tmp_path):
+    files = []
+    for n in range(1, 8):
+        path = tmp_path / f"p{n}.hocr"
+        path.write_text(PAGE.format(n=n), encoding="utf-8")
+        files.append(path)
+    combined = tmp_path / "combined.hocr"
+    hocr.merge_hocr_files(files, combined)
+
+    parts = [tmp_path / f"part{i}.hocr" for i in range(3)]
+    hocr.split_hocr_file(combined, [3, 3, 1], parts, chunk_size=50)
+    for part, pages in zip(parts, [(1, 2, 3), (4, 5, 6), (7,)]):
+        expected = hocr.HOCR_HEADER + "".join(page_body(n) for n in pages) + hocr.HOCR_FOOTER
+        assert part.read_text(encoding="utf-8") == expected
+
+    with pytest.raises(hocr.HocrError):
+        hocr.split_hocr_file(combined, [3, 3], parts[:2])
+    with pytest.raises(hocr.HocrError):
+        hocr.split_hocr_file(combined, [4, 4], parts[:2])
+
+
+def test_merge_keeps_order_and_subtrees(tmp_path):
+    files = []
+    for n in (3, 1, 2):
+        path = tmp_path / f"p{n}.hocr"
+        path.write_text(PAGE.format(n=n), encoding="utf-8")
+        files.append(path)
+    out = tmp_path / "combined.hocr"
+    assert hocr.merge_hocr_files(files, out) == 3
+    merged = out.read_text(encoding="utf-8")
+    assert merged == hocr.HOCR_HEADER + page_body(3) + page_body(1) + page_body(2) + hocr.HOCR_FOOTER
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 64, 4096])
+def test_copy_pages_is_independent_of_chunk_size(chunk_size):
+    out = io.StringIO()
+    assert hocr.copy_pages(io.StringIO(PAGE.format(n=1) + PAGE.format(n=2)), out, chunk_size=chunk_size) == 2
+    assert out.getvalue() == page_body(1) + page_body(2)
+
+
+def test_copy_pages_rejects_bad_nesting():
+    broken = PAGE.format(n=1).replace("</p>", "</span>", 1)
+    with pytest.raises(hocr.HocrError):
+        hocr.copy_pages(io.StringIO(broken), io.StringIO())
+
+
+def test_copy_pages_rejects_missing_page():
+    with pytest.raises(hocr.HocrError):
+        hocr.copy_pages(io.StringIO("<html><body></body></html>"), io.StringIO())
+    unterminated = PAGE.format(n=1).split("</body>")[0].rsplit("</div>", 1)[0]
+    with pytest.raises(hocr.HocrError):
+        hocr.copy_pages(io.StringIO(unterminated), io.StringIO())
+
+
+def test_rescale_title_scales_pixel_properties_only():
+    title = 'image "page-1.tif"; bbox 10 20 401 81; baseline 0.012 -11; x_size 39.5; x_wconf 96; ppageno 0'
+    assert hocr.rescale_title(title, 0.5) == (
+        'image "page-1.tif"; bbox 5 10 200 40; baseline 0.012 -6; x_size 19.75; x_wconf 96; ppageno 0'
+    )
+
+
+def test_rescale_hocr_file_keeps_structure(tmp_path):
+    source = tmp_path / "page.hocr"
+    source.write_text(PAGE.format(n=1), encoding="utf-8")
+    target = tmp_path / "scaled.hocr"
+    hocr.rescale_hocr_file(source, target, 2)
+    scaled = target.read_text(encoding="utf-8")
+    assert "bbox 0 0 4960 7016" in scaled and "bbox 20 40 180 160" in scaled
+    assert scaled.replace("4960 7016", "2480 3508").count("ocrx_word") == PAGE.count("ocrx_word")
@@ -0,0 +1,75 @@
+"""Parallel OCR pool: page order is preserved and a failing page stops the run"""
+import random
+import sys
+import time
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(project_root))
+
+from compressor import pipeline
+
+
+def test_ocr_images_keeps_page_order(monkeypatch, tmp_path):
+    def fake_ocr_image(img_path, temp_dir, thread_limit=None, cache=None):
+        # Finish pages in random order to make sure the result is re-ordered
+        time.sleep(random.random() / 100)
+        return temp_dir / f"{img_path.stem}.hocr"
+
+    monkeypatch.setattr(pipeline, "ocr_image", fake_ocr_image)
+    images = [tmp_path / f"page-{i:02d}.tif" for i in range(1, 21)]
+    hocr_files = pipeline.ocr_images(images, tmp_path, jobs=4)
+    assert [h.stem for h in hocr_files] == [img.stem for img in images]
+
+
+def test_ocr_images_stops_on_first_failure(monkeypatch, tmp_path):
+    started = []
+
+    def fake_ocr_image(img_path, temp_dir, thread_limit=None, cache=None):
+        started.append(img_path)
+        if img_path.stem == "page-02":
+            return None
+        time.sleep(0.01)
+        return temp_dir / f"{img_path.stem}.hocr"
+
+    monkeypatch.setattr(pipeline, "ocr_image", fake_ocr_image)
+    images = [tmp_path / f"page-{i:02d}.tif" for i in range(1, 101)]
+    assert pipeline.ocr_images(images, tmp_path, jobs=2) is None
+    # Pages still waiting in the queue are not processed after the failure
+    assert len(started) < len(images)
+
+
+def fake_tesseract(calls):
+    """utils.run_command stand-in for tesseract: one hOCR page per image of a list file."""
+    def run_command(command, env=None, **kwargs):
+        source, output_prefix = Path(command[1]), command[2]
+        images = source.read_text().split() if source.suffix == ".txt" else [str(source)]
+        calls.append([Path(image).name for image in images])
+        pages = "".join(f"<div class='ocr_page' id='page_{n}' title='image \"{image}\"; bbox 0 0 10 10'>"
+                        f"<span class='ocrx_word'>{Path(image).stem}</span></div>\n" for n, image in enumerate(images, 1))
+        Path(f"{output_prefix}.hocr").write_text(f"<html><body>{pages}</body></html>")
+        return True
+    return run_command
+
+
+def test_batches_share_one_tesseract_process(monkeypatch, tmp_path):
+    calls = []
+    monkeypatch.setattr(pipeline.utils, "run_command", fake_tesseract(calls))
+    images = [tmp_path / f"page-{i:02d}.tif" for i in range(1, 11)]
+    hocr_files = pipeline.ocr_images(images, tmp_path, jobs=2, batch_pages=4)
+    # Three processes instead of ten, every page still gets its own hOCR file in page order
+    assert sorted(len(call) for call in calls) == [2, 4, 4]
+    assert [h.name for h in hocr_files] == [f"{img.stem}.hocr" for img in images]
+    for image, hocr_file in zip(images, hocr_files):
+        text = hocr_file.read_text()
+        assert text.count("ocr_page") == 1 and f">{image.stem}<" in text
+    # The list files and multi-page outputs are removed
+    assert not list(tmp_path.glob("*_batch*"))
+
+
+def test_batches_shrink_to_keep_workers_busy(monkeypatch, tmp_path):
+    calls = []
+    monkeypatch.setattr(pipeline.utils, "run_command", fake_tesseract(calls))
+    images = [tmp_path / f"page-{i}.tif" for i in range(1, 7)]
+    assert len(pipeline.ocr_images(images, tmp_path, jobs=3, batch_pages=8)) == 6
+    assert [len(call) for call in calls] == [2, 2, 2]
@@ -0,0 +1,96 @@
+"""OCR resolution: tesseract reads downscaled grayscale copies, the hOCR comes back at the render resolution"""
+import sys
+from pathlib import Path
+
+import pytest
+
+project_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(project_root))
+
+from compressor import hocr, pipeline, pyramid
+from compressor.cache import PageCache
+
+# What tesseract reports for a letter page rendered at 200 DPI
+HOCR_200 = (
+    "<div class='ocr_page' id='page_{n}' title='image \"{image}\"; bbox 0 0 1700 2200; ppageno {p}'>"
+    "<span class='ocr_line' title='bbox 200 400 601 440; baseline 0.01 -7; x_size 30; x_descenders 6'>"
+    "<span class='ocrx_word' title='bbox 200 400 601 440; x_wconf 96'>{stem}</span></span></div>\n"
+)
+
+
+def fake_tools(monkeypatch, calls):
+    downscaled = []
+
+    def fake_downscale(source_path, target_path, factor, dpi, grayscale=False):
+        downscaled.append((Path(source_path).name, factor, dpi, grayscale))
+        Path(target_path).write_text("gray copy\n")
+        return target_path
+
+    def fake_tesseract(command, env=None, **kwargs):
+        source, output_prefix = Path(command[1]), command[2]
+        images = source.read_text().split() if source.suffix == ".txt" else [str(source)]
+        calls.append(images)
+        pages = "".join(HOCR_200.format(n=n, p=n - 1, image=image, stem=Path(image).stem) for n, image in enumerate(images, 1))
+        Path(f"{output_prefix}.hocr").write_text(f"<html><body>{pages}</body></html>")
+        return True
+
+    monkeypatch.setattr(pyramid, "available", lambda: True)
+    monkeypatch.setattr(pyramid, "downscale_image", fake_downscale)
+    monkeypatch.setattr(pipeline.utils, "run_command", fake_tesseract)
+    return downscaled
+
+
+@pytest.mark.parametrize("batch_pages", [1, 2])
+def test_hocr_is_rescaled_to_the_render_resolution(monkeypatch, tmp_path, batch_pages):
+    calls = []
+    downscaled = fake_tools(monkeypatch, calls)
+    images = [tmp_path / f"page-{page}.tif" for page in (1, 2, 3)]
+    hocr_files = pipeline.ocr_images(images, tmp_path, jobs=1, dpi=300, ocr_dpi=200, batch_pages=batch_pages)
+
+    # tesseract only saw the grayscale copies at 200 DPI
+    assert sorted(downscaled) == [(image.name, 200 / 300, 200, True) for image in images]
+    assert all("ocr_200_" in Path(image).parent.name for call in calls for image in call)
+    assert not list(tmp_path.glob("ocr_200_*"))  # the copies are removed
+    assert [path.name for path in hocr_files] == ["page-1.hocr", "page-2.hocr", "page-3.hocr"]
+    for image, hocr_file in zip(images, hocr_files):
+        text = hocr_file.read_text()
+        assert "bbox 0 0 2550 3300" in text
+        assert f"title='bbox 300 600 902 660; x_wconf 96'>{image.stem}<" in text
+        assert "baseline 0.01 -10; x_size 45; x_descenders 9" in text
+    assert hocr.merge_hocr_files(hocr_files, tmp_path / "combined.hocr") == 3
+
+
+def test_no_downscale_at_or_above_the_render_resolution(monkeypatch, tmp_path):
+    calls = []
+    downscaled = fake_tools(monkeypatch, calls)
+    images = [tmp_path / "page-1.tif"]
+    assert pipeline.ocr_images(images, tmp_path, jobs=1, dpi=200, ocr_dpi=300)
+    assert pipeline.ocr_images(images, tmp_path, jobs=1, dpi=200, ocr_dpi=None)
+    assert downscaled == []
+    assert calls == [[str(images[0])], [str(images[0])]]
+
+
+def test_downscaled_ocr_is_cached_apart_from_full_resolution_ocr(monkeypatch, tmp_path):
+    calls = []
+    fake_tools(monkeypatch, calls)
+    cache = PageCache(tmp_path / "cache")
+    image = tmp_path / "page-1.tif"
+    cache.remember_image(image, "ab" * 32, 300)
+    assert pipeline.ocr_downscaled([image], tmp_path, 300, 200, cache=cache)
+    assert pipeline.ocr_downscaled([image], tmp_path, 300, 200, cache=cache)
+    assert len(calls) == 1
+    # A full-resolution run does not get the low-resolution hOCR, and the other way round
+    assert pipeline.ocr_image(image, tmp_path, cache=cache)
+    assert calls[-1] == [str(image)] and len(calls) == 2
+    assert pipeline.ocr_downscaled([image], tmp_path, 300, 150, cache=cache)
+    assert len(calls) == 3
+
+
+def test_grayscale_copy(tmp_path):
+    Image = pytest.importorskip("PIL.Image")
+    source = tmp_path / "page-1.tif"
+    Image.new("RGB", (300, 390), "white").save(source, dpi=(300, 300))
+    pyramid.downscale_image(source, tmp_path / "ocr.tif", 200 / 300, 200, grayscale=True)
+    with Image.open(tmp_path / "ocr.tif") as copy:
+        assert copy.mode == "L"
+        assert copy.size == (200, 260)
@@ -0,0 +1,45 @@
+"""Parallel page-range reconstruction: every part gets its pages and hOCR slice, joined in order"""
+import sys
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(project_root))
+
+from compressor import hocr, pipeline
+
+
+def test_parts_are_rebuilt_and_joined_in_page_order(monkeypatch, tmp_path):
+    pages = 18
+    images = []
+    page_hocr = []
+    for n in range(1, pages + 1):
+        image = tmp_path / f"page-{n:02d}.tif"
+        image.write_text(f"image {n}")
+        images.append(image)
+        page_file = tmp_path / f"page-{n:02d}.hocr"
+        page_file.write_text(f"<div class='ocr_page' title='image \"{image.name}\"'>{n}</div>", encoding="utf-8")
+        page_hocr.append(page_file)
+    combined = tmp_path / "combined.hocr"
+    hocr.merge_hocr_files(page_hocr, combined)
+
+    def fake_reconstruct(image_files, hocr_file, temp_dir, params, output_pdf_path):
+        # A "PDF" listing the rebuilt images next to the page numbers found in the hOCR slice
+        image_text = [Path(f).read_text() for f in sorted(Path(temp_dir).glob("page-*.tif"))]
+        hocr_text = Path(hocr_file).read_text(encoding="utf-8")
+        hocr_pages = [line.split(">", 1)[1].split("<", 1)[0] for line in hocr_text.splitlines() if "ocr_page" in line]
+        Path(output_pdf_path).write_text("\n".join(f"{i}|{h}" for i, h in zip(image_text, hocr_pages)) + "\n")
+        return len(image_text) == len(hocr_pages)
+
+    def fake_concatenate(pdf_files, output_pdf_path):
+        Path(output_pdf_path).write_text("".join(Path(f).read_text() for f in pdf_files))
+        return True
+
+    monkeypatch.setattr(pipeline, "reconstruct_pdf", fake_reconstruct)
+    monkeypatch.setattr(pipeline, "concatenate_pdfs", fake_concatenate)
+    monkeypatch.setattr(pipeline, "get_pdf_page_count", lambda path: len(path.read_text().splitlines()))
+
+    output = tmp_path / "out.pdf"
+    assert pipeline.rebuild_pdf(images, combined, tmp_path, {'dpi': 300, 'bg_downsample': 2}, output, jobs=4)
+    assert output.read_text().splitlines() == [f"image {n}|{n}" for n in range(1, pages + 1)]
+    # The per-part working directories are removed
+    assert not (tmp_path / "out_chunks").exists()
@@ -0,0 +1,120 @@
+"""Parameter search over a strategy ladder: speculative rebuilds choose the same result as sequential ones"""
+import random
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+project_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(project_root))
+
+from compressor import pipeline, search, strategy
+
+
+def install_fake_rebuild(monkeypatch, sizes_mb, calls):
+    """reconstruct_pdf writes a file of sizes_mb[index] MB (None = rebuild failure)."""
+    def fake_reconstruct(image_files, hocr_file, temp_dir, params, output_pdf_path):
+        index = params['index']
+        calls.append(index)
+        if sizes_mb[index] is None:
+            return False
+        with open(output_pdf_path, 'wb') as f:
+            f.truncate(int(sizes_mb[index] * 1024 * 1024))
+        return True
+
+    monkeypatch.setattr(pipeline, "reconstruct_pdf", fake_reconstruct)
+
+
+def run_search(tmp_path, sizes_mb, target_mb, **kwargs):
+    ladder = {'name': 'test', 'params_sequence': [
+        {'dpi': 300, 'bg_downsample': i + 1, 'index': i} for i in range(len(sizes_mb))
+    ]}
+    out_dir = tmp_path / "out"
+    success, path = strategy._search_params_sequence(
+        Path("doc.pdf"), out_dir, target_mb, ladder, lambda dpi: (tmp_path, [], None), **kwargs
+    )
+    return path.stat().st_size if success else None
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_speculative_matches_sequential(monkeypatch, tmp_path, seed):
+    rng = random.Random(seed)
+    count = rng.randint(1, 7)
+    sizes = sorted((round(rng.uniform(0.5, 8), 2) for _ in range(count)), reverse=True)
+    sizes = [None if rng.random() < 0.15 else size for size in sizes]
+    target = rng.choice([1.0, 2.0, 3.0, 5.0])
+
+    (tmp_path / "seq").mkdir()
+    (tmp_path / "spec").mkdir()
+
+    install_fake_rebuild(monkeypatch, sizes, [])
+    expected = run_search(tmp_path / "seq", sizes, target)
+    install_fake_rebuild(monkeypatch, sizes, [])
+    actual = run_search(tmp_path / "spec", sizes, target, speculative_jobs=3)
+
+    assert actual == expected
+
+
+@pytest.mark.parametrize("mode", ["binary", "model"])
+@pytest.mark.parametrize("speculative_jobs", [1, 3])
+@pytest.mark.parametrize("seed", range(20))
+def test_bounded_searches_find_first_fitting_entry(mode, speculative_jobs, seed):
+    rng = random.Random(seed)
+    count = rng.randint(1, 12)
+    ladder = sorted(
+        ({'dpi': rng.choice([100, 150, 200, 300, 400]), 'bg_downsample': rng.randint(1, 8)} for _ in range(count)),
+        key=lambda p: -p['dpi'] ** 2 / p['bg_downsample']
+    )
+    sizes = [p['dpi'] ** 2 / p['bg_downsample'] / 20000 * rng.uniform(0.9, 1.1) for p in ladder]
+    sizes = sorted(sizes, reverse=True)
+    target = rng.uniform(0.5, 10)
+
+    def rebuild(index):
+        return sizes[index], f"out-{index}.pdf"
+
+    outcome = search.run_search(ladder, target, rebuild, mode=mode, speculative_jobs=speculative_jobs)
+    fitting = [i for i, size in enumerate(sizes) if size <= target]
+    assert outcome.index == (fitting[0] if fitting else None)
+    if speculative_jobs == 1:
+        # Bisection never needs more than ceil(log2(count + 1)) + 1 rebuilds
+        assert outcome.rebuilds <= count.bit_length() + 1
+
+
+@pytest.mark.parametrize("speculative_jobs", [1, 3])
+@pytest.mark.parametrize("start_index", range(6))
+def test_legacy_search_from_predicted_start(speculative_jobs, start_index):
+    sizes = [9.0, 6.5, 4.0, 2.8, 1.9, 1.2]
+    ladder = [{'dpi': 300, 'bg_downsample': i + 1} for i in range(len(sizes))]
+
+    outcome = search.run_search(
+        ladder, 3.0, lambda index: (sizes[index], f"out-{index}.pdf"),
+        speculative_jobs=speculative_jobs, start_index=start_index
+    )
+    assert outcome.index == 3
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_predicted_start_speculation_does_not_assume_monotone_sizes(seed):
+    rng = random.Random(seed)
+    count = rng.randint(2, 7)
+    sizes = [None if rng.random() < 0.1 else round(rng.uniform(0.5, 8), 2) for _ in range(count)]
+    delays = [rng.uniform(0, 0.02) for _ in range(count)]
+    ladder = [{'dpi': 300, 'bg_downsample': i + 1} for i in range(count)]
+    target = rng.choice([2.0, 3.0, 5.0])
+    start_index = rng.randint(1, count - 1)
+    serial = []
+
+    def rebuild(index):
+        time.sleep(delays[index])
+        if threading.current_thread() is threading.main_thread():
+            serial.append(index)
+        return (sizes[index], f"out-{index}.pdf") if sizes[index] is not None else None
+
+    expected = search.run_search(ladder, target, rebuild, start_index=start_index).index
+    serial.clear()
+    outcome = search.run_search(ladder, target, rebuild, speculative_jobs=count, start_index=start_index)
+    assert outcome.index == expected
+    # Every entry the search needs comes from the speculative rebuilds, none was stopped as a loser
+    assert serial == []
@@ -0,0 +1,67 @@
+"""Size prediction from a stratified page sample"""
+import random
+import sys
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(project_root))
+
+from compressor import pipeline, predictor
+
+
+def test_sample_pages_covers_every_stratum():
+    pages = predictor.sample_pages(100, 10)
+    assert len(pages) == 10
+    for stratum, page in enumerate(pages):
+        assert stratum * 10 < page <= (stratum + 1) * 10
+    assert predictor.sample_pages(5, 10) == [1, 2, 3, 4, 5]
+
+
+class FakeSession:
+    """Pages with a random output weight (MB at 300 dpi / bg 1)."""
+
+    def __init__(self, tmp_path, weights):
+        self.tmp_path = tmp_path
+        self.weights = weights
+        self.page_count = len(weights)
+
+    def stage_pages(self, dpi, pages):
+        stage_dir = self.tmp_path / "_".join(map(str, pages))
+        stage_dir.mkdir(exist_ok=True)
+        return stage_dir, list(pages), None
+
+
+def test_prediction_interval_contains_full_size(monkeypatch, tmp_path):
+    rng = random.Random(1)
+    weights = [rng.uniform(0.05, 0.15) for _ in range(200)]
+    session = FakeSession(tmp_path, weights)
+
+    def fake_reconstruct(image_files, hocr_file, temp_dir, params, output_pdf_path):
+        scale = (params['dpi'] / 300) ** 2 / params['bg_downsample']
+        size_mb = sum(weights[page - 1] for page in image_files) * scale
+        with open(output_pdf_path, 'wb') as f:
+            f.truncate(int(size_mb * 1024 * 1024))
+        return True
+
+    monkeypatch.setattr(pipeline, "reconstruct_pdf", fake_reconstruct)
+    sizes_predictor = predictor.SizePredictor(session)
+    ladder = [{'dpi': 300, 'bg_downsample': bg} for bg in (1, 2, 3, 4, 6)]
+    predictions = sizes_predictor.predict_ladder(ladder)
+    for params, prediction in zip(ladder, predictions):
+        actual = sum(weights) / params['bg_downsample']
+        assert prediction.low_mb <= actual <= prediction.high_mb
+        assert abs(prediction.size_mb - actual) / actual < 0.1
+
+    # The first entry predicted to fit a 7MB target is bg_downsample=3 (20MB / 3)
+    assert sizes_predictor.start_index(ladder, 7.0) == 2
+
+
+def test_sample_scales_with_the_document():
+    # Three sample rebuilds of a ladder stay within half of one full rebuild
+    assert predictor.sample_size_for(30) == 0
+    assert predictor.sample_size_for(predictor.MIN_PAGES_FOR_PREDICTION) == predictor.MIN_SAMPLE_PAGES
+    assert predictor.sample_size_for(48) == 8
+    assert predictor.sample_size_for(500) == predictor.DEFAULT_SAMPLE_PAGES
+    for page_count in range(1, 200):
+        size = predictor.sample_size_for(page_count)
+        assert size * predictor.LADDER_SAMPLES <= page_count * predictor.MAX_SAMPLE_SHARE
@@ -0,0 +1,77 @@
+"""Image pyramid: every DPI gets its own page images, derived from a higher render when possible"""
+import sys
+from pathlib import Path
+
+import pytest
+
+project_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(project_root))
+
+from compressor import pipeline, pyramid
+from compressor.session import DocumentSession
+
+HOCR_PAGE = (
+    '<div class="ocr_page" title="bbox 0 0 2550 3300">'
+    '<span class="ocrx_word" title="bbox 300 600 900 660; x_wconf 95">word</span></div>'
+)
+
+
+def fake_session(monkeypatch, tmp_path, derive):
+    renders = []
+
+    def fake_render(pdf_path, render_dir, dpi, cache=None, image_format="tiff", color_modes=None):
+        renders.append(dpi)
+        images = []
+        for page in (1, 2):
+            image = render_dir / f"page-{page}.tif"
+            image.write_text(f"{dpi}\n")
+            images.append(image)
+        return images
+
+    def fake_ocr(image_files, render_dir, **kwargs):
+        hocr_files = []
+        for image in image_files:
+            hocr_file = render_dir / f"{image.stem}.hocr"
+            hocr_file.write_text(HOCR_PAGE)
+            hocr_files.append(hocr_file)
+        return hocr_files
+
+    def fake_build_level(image_files, output_dir, source_dpi, dpi, jobs=None):
+        targets = [output_dir / image.name for image in image_files]
+        for target in targets:
+            target.write_text(f"{dpi} from {source_dpi}\n")
+        return targets
+
+    monkeypatch.setattr(pipeline, "deconstruct_pdf_to_images", fake_render)
+    monkeypatch.setattr(pipeline, "ocr_images", fake_ocr)
+    monkeypatch.setattr(pyramid, "available", lambda: derive)
+    monkeypatch.setattr(pyramid, "build_level", fake_build_level)
+    monkeypatch.setattr("compressor.utils.create_temp_directory", lambda: str(tmp_path))
+    return DocumentSession(tmp_path / "doc.pdf"), renders
+
+
+@pytest.mark.parametrize("derive", [True, False])
+def test_attempts_get_images_at_their_dpi(monkeypatch, tmp_path, derive):
+    session, renders = fake_session(monkeypatch, tmp_path, derive)
+    assert session.stage(300)
+    stage_dir, image_files, hocr_file = session.stage(150)
+
+    expected = "150 from 300\n" if derive else "150\n"
+    assert [image.read_text() for image in image_files] == [expected, expected]
+    assert renders == ([300] if derive else [300, 150])
+    # The hOCR of the 300 DPI OCR run is rescaled to the 150 DPI images
+    assert 'bbox 0 0 1275 1650' in hocr_file.read_text()
+    assert 'bbox 150 300 450 330' in hocr_file.read_text()
+
+
+def test_downscale_halves_the_pixels(tmp_path):
+    Image = pytest.importorskip("PIL.Image")
+    source = tmp_path / "page-1.tif"
+    Image.new("RGB", (250, 330), "white").save(source, dpi=(300, 300))
+
+    pyramid.downscale_image(source, tmp_path / "half.tif", 0.5, 150)
+    pyramid.downscale_image(source, tmp_path / "third.tif", 100 / 300, 100)
+    with Image.open(tmp_path / "half.tif") as half, Image.open(tmp_path / "third.tif") as third:
+        assert half.size == (125, 165)
+        assert third.size == (84, 110)  # integer reduction keeps the partial last block
+        assert round(half.info["dpi"][0]) == 150
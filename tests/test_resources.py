@@ -0,0 +1,91 @@
+"""Shared resource budget and per-file log buffering"""
+import logging
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(project_root))
+
+from compressor import resources, utils
+
+
+def test_budget_limits_nested_pools():
+    budget = resources.ResourceBudget(cpus=3, memory_mb=1000)
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def task(memory_mb):
+        with budget.acquire(1, memory_mb):
+            with lock:
+                # A request above the whole budget is clamped and runs alone
+                running.append(min(memory_mb, 1000))
+                peak.append((len(running), sum(running)))
+            time.sleep(0.005)
+            with lock:
+                running.remove(min(memory_mb, 1000))
+
+    def outer(i):
+        # A nested pool per outer task, like OCR workers inside a file
+        with ThreadPoolExecutor(max_workers=4) as inner:
+            list(inner.map(task, [100, 400, 100, 2000]))
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(outer, range(4)))
+    assert max(count for count, _ in peak) <= 3
+    assert max(memory for _, memory in peak) <= 1000
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+def test_buffered_logging_keeps_files_together(monkeypatch):
+    root = logging.getLogger()
+    handler = ListHandler()
+    monkeypatch.setattr(root, "handlers", [handler])
+    monkeypatch.setattr(root, "filters", [])
+    root.addFilter(utils._BufferFilter())
+    monkeypatch.setattr(root, "level", logging.INFO)
+
+    def process(name):
+        with utils.buffered_logging():
+            logging.info(f"{name} start")
+            with ThreadPoolExecutor(max_workers=3) as pool:
+                log_page = utils.in_current_context(lambda page: (time.sleep(0.002), logging.info(f"{name} page {page}")))
+                list(pool.map(log_page, range(5)))
+            logging.info(f"{name} end")
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        list(executor.map(process, ["a", "b", "c"]))
+
+    assert len(handler.messages) == 21
+    for i in range(0, 21, 7):
+        block = handler.messages[i:i + 7]
+        name = block[0].split()[0]
+        assert block[0] == f"{name} start" and block[-1] == f"{name} end"
+        assert all(message.startswith(name) for message in block)
+
+
+def test_memory_estimate_learns_from_measured_peaks(monkeypatch):
+    monkeypatch.setattr(resources, "_peaks", {})
+    render = ["pdftoppm", "-tiff", "-r", "600", "in.pdf", "page"]
+    # Before any measurement: the default, scaled by the pixel count
+    assert resources.memory_estimate(render) == resources.TOOL_MEMORY_MB["pdftoppm"] * 4
+
+    resources.record_peak(["pdftoppm", "-tiff", "-r", "300", "in.pdf", "page"], 50)
+    assert abs(resources.memory_estimate(render) - 200 * resources.PEAK_MARGIN) < 1e-9
+    resources.record_peak(render, 120)
+    assert abs(resources.memory_estimate(render) - 120 * resources.PEAK_MARGIN) < 1e-9
+    # Tools without a resolution are not scaled
+    resources.record_peak(["tesseract", "a.tif", "a", "hocr"], 80)
+    assert abs(resources.memory_estimate(["tesseract", "b.tif", "b", "hocr"]) - 80 * resources.PEAK_MARGIN) < 1e-9
+    assert resources.peak_report() == {"pdftoppm": 120, "tesseract": 80}
@@ -0,0 +1,27 @@
+"""Batch dispatch order: longest processing time first"""
+import sys
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(project_root))
+
+from compressor import scheduler
+
+
+def test_lpt_beats_name_order_with_large_file_last():
+    durations = [1, 1, 1, 1, 1, 1, 6]
+    names = [f"f{i}" for i in range(len(durations))]
+    fifo = scheduler.simulate_makespan(durations, workers=2)
+    ordered = scheduler.lpt_order(list(zip(names, durations)), durations)
+    lpt = scheduler.simulate_makespan([d for _, d in ordered], workers=2)
+    assert ordered[0] == ("f6", 6)
+    assert (fifo, lpt) == (9, 6)
+
+
+def test_cost_grows_with_pages_and_tier():
+    small = scheduler.cost_from_size(3, 20, 2)
+    large = scheduler.cost_from_size(200, 600, 2)
+    assert scheduler.cost_from_size(1.5, 10, 2) == scheduler.COPY_COST
+    assert large > 10 * small
+    # Unknown page counts are estimated from the size
+    assert scheduler.cost_from_size(30, 0, 2) == scheduler.cost_from_size(30, 100, 2)
@@ -0,0 +1,100 @@
+"""Scratch space: intermediate image formats, bytes written per stage and the scratch budget"""
+import sys
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(project_root))
+
+from compressor import pipeline, pyramid, scratch, utils
+from compressor.session import DocumentSession
+
+
+def test_ledger_counts_stages_usage_and_peak(tmp_path):
+    ledger = scratch.ScratchLedger(budget_mb=1)
+    files = []
+    for index, size in enumerate([300_000, 500_000, 400_000]):
+        path = tmp_path / "work" / f"page-{index}.tif"
+        path.parent.mkdir(exist_ok=True)
+        path.write_bytes(b"x" * size)
+        files.append(path)
+    ledger.add("render", files[:2])
+    ledger.add("rebuild", files[2:])
+    assert ledger.written == {"render": 800_000, "rebuild": 400_000}
+    assert ledger.usage_bytes == 1_200_000
+    assert ledger.over_budget()
+
+    ledger.remove(files[2:])
+    assert ledger.usage_bytes == 800_000 and not ledger.over_budget()
+    ledger.forget_tree(tmp_path / "work")
+    assert ledger.usage_bytes == 0
+    assert ledger.peak_bytes == 1_200_000
+    assert "render 781.2KB" in ledger.report()
+
+
+def test_render_uses_the_selected_format(monkeypatch, tmp_path):
+    commands = []
+    monkeypatch.setattr(utils, "run_command", lambda command, **kwargs: commands.append(command) or True)
+    pipeline.render_pages(tmp_path / "doc.pdf", tmp_path / "page", 300, 2, 5, image_format="tiff-deflate")
+    pipeline.render_pages(tmp_path / "doc.pdf", tmp_path / "page", 150, image_format="png")
+    assert commands[0][:6] == ["pdftoppm", "-tiff", "-tiffcompression", "deflate", "-r", "300"]
+    assert commands[0][6:10] == ["-f", "2", "-l", "5"]
+    assert commands[1][:4] == ["pdftoppm", "-png", "-r", "150"]
+
+
+def fake_session(monkeypatch, tmp_path, renders, budget_mb):
+    """A session whose renders are 2 pages of dpi KB each, with OCR and scratch budget faked."""
+
+    def fake_render(pdf_path, render_dir, dpi, cache=None, image_format="tiff", color_modes=None):
+        renders.append(dpi)
+        images = []
+        for page in (1, 2):
+            image = render_dir / f"page-{page}.png"
+            image.write_bytes(b"x" * (dpi * 1000))
+            images.append(image)
+        scratch.record("render", *images)
+        return images
+
+    def fake_ocr(image_files, render_dir, **kwargs):
+        hocr_files = []
+        for image in image_files:
+            hocr_file = render_dir / f"{image.stem}.hocr"
+            hocr_file.write_text('<div class="ocr_page" title="bbox 0 0 100 100"></div>')
+            hocr_files.append(hocr_file)
+        return hocr_files
+
+    monkeypatch.setattr(pipeline, "deconstruct_pdf_to_images", fake_render)
+    monkeypatch.setattr(pipeline, "ocr_images", fake_ocr)
+    monkeypatch.setattr(pyramid, "available", lambda: False)
+    monkeypatch.setattr(scratch, "_ledger", scratch.ScratchLedger(budget_mb=budget_mb))
+    monkeypatch.setattr(utils, "create_temp_directory", lambda: str(tmp_path))
+    return DocumentSession(tmp_path / "doc.pdf", image_format="png")
+
+
+def test_trim_drops_page_images_over_budget(monkeypatch, tmp_path):
+    renders = []
+    session = fake_session(monkeypatch, tmp_path, renders, budget_mb=0.7)
+    assert session.stage(300) and session.stage(100)
+    assert scratch.ledger().over_budget()  # 2 x 300KB + 2 x 100KB
+
+    session.trim_scratch()
+    # The lowest resolution goes first, only as much as needed to get within the budget
+    assert not scratch.ledger().over_budget()
+    assert sorted(session._images) == [300]
+    assert not (tmp_path / "render_100" / "page-1.png").exists()
+
+    # Dropped images come back when a later phase needs them; the hOCR is kept
+    stage_dir, image_files, hocr_file = session.stage(100)
+    assert renders == [300, 100, 100]
+    assert all(image.exists() for image in image_files) and session.page_count == 2
+
+
+def test_trim_keeps_the_ocr_render_and_the_current_stage(monkeypatch, tmp_path):
+    renders = []
+    session = fake_session(monkeypatch, tmp_path, renders, budget_mb=0.7)
+    # OCR at 100 DPI, then phases at 300 and 200 DPI: 200 + 600 + 400KB
+    assert session.stage(100) and session.stage(300) and session.stage(200)
+    assert session.ocr_dpi == 100
+
+    session.trim_scratch()
+    assert not scratch.ledger().over_budget()
+    assert sorted(session._images) == [100, 200]
@@ -0,0 +1,82 @@
+"""Size-aware split planning: minimum part count and balanced contiguous ranges"""
+import itertools
+import random
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+project_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(project_root))
+
+from compressor import pipeline, split_planner, splitter, strategy
+from compressor.session import DocumentSession
+
+
+def brute_force_best_max(costs, k):
+    """Smallest achievable largest part cost with at most k contiguous parts."""
+    best = sum(costs)
+    n = len(costs)
+    for parts in range(1, min(k, n) + 1):
+        for cuts in itertools.combinations(range(1, n), parts - 1):
+            bounds = (0,) + cuts + (n,)
+            best = min(best, max(sum(costs[a:b]) for a, b in zip(bounds, bounds[1:])))
+    return best
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_partition_is_optimal_and_contiguous(seed):
+    rng = random.Random(seed)
+    costs = [rng.choice([0.05, 0.1, 0.2, 1.5]) * rng.uniform(0.5, 1.5) for _ in range(rng.randint(1, 9))]
+    k = rng.randint(1, 4)
+    ranges = split_planner.partition(costs, k)
+
+    assert len(ranges) <= k
+    assert ranges[0][0] == 1 and ranges[-1][1] == len(costs)
+    assert all(a[1] + 1 == b[0] for a, b in zip(ranges, ranges[1:]))
+    largest = max(sum(costs[first - 1:last]) for first, last in ranges)
+    assert largest == pytest.approx(brute_force_best_max(costs, k), rel=1e-6)
+
+
+def test_min_parts_and_plan():
+    costs = [0.5, 0.5, 1.8, 0.2, 0.2, 0.2, 0.5]
+    assert split_planner.min_parts(costs, 2.0) == 3
+    assert split_planner.min_parts(costs, 1.0) is None
+    ranges = split_planner.plan_split(costs, 2.0, max_parts=5)
+    assert len(ranges) == 3
+    assert all(sum(costs[first - 1:last]) <= 2.0 for first, last in ranges)
+
+
+def test_plan_beyond_max_parts_is_the_most_balanced():
+    costs = [0.5, 0.5, 1.8, 0.2, 0.2, 0.2, 0.5]
+    # Three parts are needed for a 2MB capacity (or a page is too large): the best
+    # two-part plan is still returned so that it can be tried
+    for capacity in (2.0, 1.0):
+        ranges = split_planner.plan_split(costs, capacity, max_parts=2)
+        assert len(ranges) == 2
+        largest = max(sum(costs[first - 1:last]) for first, last in ranges)
+        assert largest == pytest.approx(brute_force_best_max(costs, 2))
+
+
+def test_costs_without_prediction_come_from_earlier_rebuilds(monkeypatch, tmp_path):
+    session = DocumentSession(tmp_path / "doc.pdf")
+    images = []
+    for page, size in enumerate((100, 300), 1):
+        images.append(tmp_path / f"page-{page}.pgm")
+        images[-1].write_bytes(random.Random(page).randbytes(size))
+    monkeypatch.setattr(session, "prepare", lambda dpi: True)
+    monkeypatch.setattr(session, "page_images", lambda dpi: images)
+    monkeypatch.setattr(pipeline, "rebuild_pdf", lambda *args, **kwargs: pytest.fail("calibration rebuild"))
+    args = SimpleNamespace(no_predict=True)
+
+    # Nothing measured yet: equal page counts instead of an extra rebuild
+    assert splitter._estimate_page_costs(session, args) is None
+    session.record_size({'dpi': 300, 'bg_downsample': 2}, 8.0)
+    expected = session.estimate_size(strategy.AGGRESSIVE_PARAMS[0])
+    assert 0 < expected < 8.0
+    costs = splitter._estimate_page_costs(session, args)
+    assert sum(costs) == pytest.approx(expected) and costs[1] > costs[0]
+    session.record_size(strategy.AGGRESSIVE_PARAMS[0], 1.5)
+    assert session.estimate_size(strategy.AGGRESSIVE_PARAMS[0]) == 1.5
+    session.close()
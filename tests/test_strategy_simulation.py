@@ -12,13 +12,21 @@ from compressor import strategy, utils
 # Monkey-patch pipeline methods to simulate behavior
 from compressor import pipeline
 
-def fake_deconstruct(pdf_path, temp_dir, dpi):
-    # Simulate and generate a set of image file paths
-    return [Path(temp_dir) / f"page-{i:02d}.tif" for i in range(1, 11)]
-
-def fake_analyze(images, temp_dir):
-    # Simulate and generate hocr files
-    return Path(temp_dir) / "combined.hocr"
+def fake_deconstruct(pdf_path, temp_dir, dpi, **kwargs):
+    # Simulate and generate a set of (empty) image files
+    images = [Path(temp_dir) / f"page-{i:02d}.tif" for i in range(1, 11)]
+    for image in images:
+        image.touch()
+    return images
+
+def fake_ocr_images(images, temp_dir, **kwargs):
+    # Simulate and generate one minimal hocr file per page
+    hocr_files = []
+    for image in images:
+        hocr_file = Path(temp_dir) / f"{image.stem}.hocr"
+        hocr_file.write_text("<div class='ocr_page' title='bbox 0 0 2480 3508'></div>")
+        hocr_files.append(hocr_file)
+    return hocr_files
 
 # reconstruct simulation: return different sizes according to params
 def fake_reconstruct(images, hocr, temp_dir, params, output_pdf_path):
@@ -31,12 +39,15 @@ def fake_reconstruct(images, hocr, temp_dir, params, output_pdf_path):
         f.write(str(size))
     return True
 
-pipeline.deconstruct_pdf_to_images = fake_deconstruct
-pipeline.analyze_images_to_hocr = fake_analyze
-pipeline.reconstruct_pdf = fake_reconstruct
+def install_fakes():
+    # Patch only when the simulation runs, so importing this module does not affect other tests
+    pipeline.deconstruct_pdf_to_images = fake_deconstruct
+    pipeline.ocr_images = fake_ocr_images
+    pipeline.reconstruct_pdf = fake_reconstruct
 
 
 def run_sim():
+    install_fakes()
     tmp_out = Path('tests')
     tmp_out.mkdir(exist_ok=True)
     pdf = Path('dummy.pdf')
@@ -0,0 +1,134 @@
+"""Streaming pipeline: render, OCR and rebuild of page chunks overlap, bounded by the chunk queue"""
+import sys
+import threading
+import time
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(project_root))
+
+from compressor import pipeline, streaming
+from compressor.session import DocumentSession
+
+HOCR_PAGE = '<div class="ocr_page" title="bbox 0 0 100 100"></div>'
+
+
+def fake_tools(monkeypatch, events, fail_page=None):
+    lock = threading.Lock()
+
+    def log(*event):
+        with lock:
+            events.append(event)
+
+    def fake_render(pdf_path, temp_dir, dpi, first_page, last_page, page_count, cache=None, digests=None, image_format="tiff", color_modes=None):
+        log("render", first_page)
+        time.sleep(0.02)
+        images = []
+        for page in range(first_page, last_page + 1):
+            image = pipeline.page_image_path(temp_dir, page, page_count, image_format)
+            image.write_text(f"page {page}\n")
+            images.append(image)
+        return images
+
+    def fake_ocr(image, temp_dir, thread_limit=None, cache=None):
+        if image.stem.endswith(f"-{fail_page}"):
+            return None
+        time.sleep(0.01)
+        hocr_file = temp_dir / f"{image.stem}.hocr"
+        hocr_file.write_text(HOCR_PAGE)
+        return hocr_file
+
+    def fake_reconstruct(image_files, hocr_file, temp_dir, params, output_pdf_path):
+        log("rebuild", temp_dir.name)
+        time.sleep(0.05)
+        Path(output_pdf_path).write_text(f"{len(image_files)}\n")
+        log("rebuilt", temp_dir.name)
+        return True
+
+    def fake_concatenate(pdf_files, output_pdf_path):
+        Path(output_pdf_path).write_text(f"{sum(int(Path(f).read_text()) for f in pdf_files)}\n")
+        return True
+
+    monkeypatch.setattr(pipeline, "render_page_range", fake_render)
+    monkeypatch.setattr(pipeline, "ocr_image", fake_ocr)
+    monkeypatch.setattr(pipeline, "reconstruct_pdf", fake_reconstruct)
+    monkeypatch.setattr(pipeline, "concatenate_pdfs", fake_concatenate)
+    monkeypatch.setattr(pipeline, "get_pdf_page_count", lambda path: int(Path(path).read_text()))
+
+
+def test_page_chunks():
+    assert streaming.page_chunks(10, 4) == [(1, 4), (5, 8), (9, 10)]
+    assert streaming.page_chunks(3, 8) == [(1, 3)]
+
+
+def test_rebuild_overlaps_rendering_within_the_queue_bound(monkeypatch, tmp_path):
+    events = []
+    fake_tools(monkeypatch, events)
+    stream = streaming.StreamingPipeline(tmp_path / "doc.pdf", tmp_path, 300, 20, chunk_pages=4, queue_chunks=2, ocr_jobs=2)
+    result = stream.run({'dpi': 300, 'bg_downsample': 2}, tmp_path / "out.pdf")
+
+    assert result.rebuilt and (tmp_path / "out.pdf").read_text() == "20\n"
+    assert [image.name for image in result.image_files[:2]] == ["page-01.tif", "page-02.tif"]
+    assert all(hocr_file.exists() for hocr_file in result.hocr_files)
+    # The first chunk is rebuilt before the last one is rendered
+    assert events.index(("rebuild", "chunk001")) < events.index(("render", 17))
+    # Backpressure: a chunk is only rendered once fewer than queue_chunks chunks are in flight
+    in_flight = peak = 0
+    for event in events:
+        in_flight += {"render": 1, "rebuilt": -1}.get(event[0], 0)
+        peak = max(peak, in_flight)
+    assert peak <= 2
+
+
+def test_ocr_failure_stops_the_pipeline(monkeypatch, tmp_path):
+    events = []
+    fake_tools(monkeypatch, events, fail_page="03")
+    stream = streaming.StreamingPipeline(tmp_path / "doc.pdf", tmp_path, 300, 40, chunk_pages=4, queue_chunks=1, ocr_jobs=2)
+    assert stream.run({'dpi': 300, 'bg_downsample': 2}, tmp_path / "out.pdf") is None
+    assert len([event for event in events if event[0] == "render"]) < 10
+
+
+def test_session_streams_the_first_pass_only(monkeypatch, tmp_path):
+    events = []
+    fake_tools(monkeypatch, events)
+    monkeypatch.setattr("compressor.utils.create_temp_directory", lambda: str(tmp_path))
+    session = DocumentSession(tmp_path / "doc.pdf", ocr_jobs=2, pipeline_chunk_pages=4)
+    monkeypatch.setattr(session, "pdf_page_count", lambda: 10)
+
+    assert session.stream(300, {'dpi': 300, 'bg_downsample': 2}, tmp_path / "first.pdf")
+    assert session.page_count == 10 and session.ocr_dpi == 300
+    assert session.stage(300)
+    # The pages are rendered and OCRed now: later attempts rebuild from the session as usual
+    assert not session.stream(300, {'dpi': 300, 'bg_downsample': 3}, tmp_path / "second.pdf")
+
+
+def test_failed_stream_falls_back_to_the_batch_path(monkeypatch, tmp_path):
+    events = []
+    fake_tools(monkeypatch, events, fail_page="03")
+    monkeypatch.setattr("compressor.utils.create_temp_directory", lambda: str(tmp_path))
+    session = DocumentSession(tmp_path / "doc.pdf", ocr_jobs=2, pipeline_chunk_pages=4)
+    monkeypatch.setattr(session, "pdf_page_count", lambda: 10)
+    assert not session.stream(300, {'dpi': 300, 'bg_downsample': 2}, tmp_path / "first.pdf")
+
+    def fake_batch_render(pdf_path, render_dir, dpi, **kwargs):
+        events.append(("batch render", dpi))
+        images = [render_dir / f"page-{page:02d}.tif" for page in range(1, 11)]
+        for image in images:
+            image.write_text("page\n")
+        return images
+
+    def fake_batch_ocr(image_files, render_dir, **kwargs):
+        events.append(("batch ocr", len(image_files)))
+        hocr_files = [render_dir / f"{image.stem}.hocr" for image in image_files]
+        for hocr_file in hocr_files:
+            hocr_file.write_text(HOCR_PAGE)
+        return hocr_files
+
+    monkeypatch.setattr(pipeline, "deconstruct_pdf_to_images", fake_batch_render)
+    monkeypatch.setattr(pipeline, "ocr_images", fake_batch_ocr)
+    streamed_renders = len([event for event in events if event[0] == "render"])
+    # The retry does not stream the pages again
+    assert session.stage(300)
+    assert len([event for event in events if event[0] == "render"]) == streamed_renders
+    assert events[-2:] == [("batch render", 300), ("batch ocr", 10)]
+    assert session.page_count == 10 and session.ocr_dpi == 300
@@ -0,0 +1,83 @@
+"""Text layers of born-digital pages: reliable pages get their hOCR from the PDF text and skip OCR"""
+import sys
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(project_root))
+
+from compressor import hocr, pipeline, textlayer
+
+WORDS = " ".join(f'<word xMin="{72 + 40 * i}" yMin="72" xMax="{102 + 40 * i}" yMax="84">w{i}</word>' for i in range(12))
+BBOX_LAYOUT = f"""<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.0 Transitional//EN"
+"http://www.w3.org/TR/xhtml1/DTD/xhtml1-transitional.dtd">
+<html xmlns="http://www.w3.org/1999/xhtml">
+<head><title></title></head>
+<body>
+<doc>
+  <page width="612.000000" height="792.000000">
+    <flow><block xMin="72" yMin="72" xMax="542" yMax="84">
+      <line xMin="72" yMin="72" xMax="542" yMax="84">{WORDS}</line>
+    </block></flow>
+  </page>
+  <page width="612.000000" height="792.000000">
+    <flow><block xMin="72" yMin="72" xMax="200" yMax="84">
+      <line xMin="72" yMin="72" xMax="200" yMax="84"><word xMin="72" yMin="72" xMax="120" yMax="84">Scan&amp;Co</word></line>
+    </block></flow>
+  </page>
+  <page width="612.000000" height="792.000000">
+    <flow><block xMin="72" yMin="72" xMax="542" yMax="84">
+      <line xMin="72" yMin="72" xMax="542" yMax="84">{WORDS.replace(">w", ">&#xE001;")}</line>
+    </block></flow>
+  </page>
+</doc>
+</body>
+</html>
+"""
+
+IMAGE_LIST = """page   num  type   width height color comp bpc  enc interp  object ID x-ppi y-ppi size ratio
+--------------------------------------------------------------------------------------------
+   1     0 image    2550  3300  rgb     3   8  jpeg   no        10  0   300   300  500K 6.4%
+   2     1 smask    2550  3300  gray    1   8  image  no        11  0   300   300  20K 0.1%
+"""
+
+
+def test_reliable_pages_and_hocr_coordinates(tmp_path):
+    layout = tmp_path / "layout.html"
+    layout.write_text(BBOX_LAYOUT)
+    pages = textlayer.parse_bbox_layout(layout)
+    assert len(pages) == 3 and pages[1].blocks[0][0][0].text == "Scan&Co"
+
+    # Page 2 has too few words, page 3 only unmapped glyphs
+    layer = textlayer.TextLayer(pages)
+    assert layer.reliable == {1}
+    # A page covered by a scanned image keeps its OCR
+    assert textlayer.TextLayer(pages, textlayer.image_areas(pipeline.parse_image_list(IMAGE_LIST))).reliable == set()
+
+    hocr_file = layer.write_hocr(1, tmp_path / "page-1.hocr", 300)
+    assert layer.write_hocr(2, tmp_path / "page-2.hocr", 300) is None
+    text = hocr_file.read_text()
+    assert "bbox 0 0 2550 3300" in text
+    assert "title='bbox 300 300 425 350; x_wconf 100'>w0</span>" in text
+    assert hocr.merge_hocr_files([hocr_file], tmp_path / "combined.hocr") == 1
+
+
+def test_ocr_runs_only_for_pages_without_text(monkeypatch, tmp_path):
+    layout = tmp_path / "layout.html"
+    layout.write_text(BBOX_LAYOUT)
+    layer = textlayer.TextLayer(textlayer.parse_bbox_layout(layout))
+    ocr_calls = []
+
+    def fake_ocr(img_path, temp_dir, thread_limit=None, cache=None):
+        ocr_calls.append(img_path.name)
+        hocr_file = temp_dir / f"{img_path.stem}.hocr"
+        hocr_file.write_text("<div class='ocr_page' title='bbox 0 0 10 10'></div>")
+        return hocr_file
+
+    monkeypatch.setattr(pipeline, "ocr_image", fake_ocr)
+    images = [tmp_path / f"page-{page}.tif" for page in (1, 2, 3)]
+    skipped = textlayer.skipped_ocr()
+    hocr_files = pipeline.ocr_images(images, tmp_path, jobs=2, text_layer=layer, dpi=150)
+    assert [path.name for path in hocr_files] == ["page-1.hocr", "page-2.hocr", "page-3.hocr"]
+    assert sorted(ocr_calls) == ["page-2.tif", "page-3.tif"]
+    assert textlayer.skipped_ocr() == skipped + 1
+    assert "bbox 0 0 1275 1650" in hocr_files[0].read_text()
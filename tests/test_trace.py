@@ -0,0 +1,43 @@
+"""Chrome trace export: spans per thread, external commands on their own lanes"""
+import json
+import sys
+import threading
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(project_root))
+
+from compressor import resources, trace, utils
+
+
+def test_trace_has_thread_and_command_lanes(monkeypatch, tmp_path):
+    trace_path = tmp_path / "run.json"
+    monkeypatch.setattr(trace, "_tracer", trace.Tracer(trace_path))
+    monkeypatch.setattr(resources, "_budget", resources.ResourceBudget(cpus=2))
+
+    @trace.traced('ocr')
+    def ocr():
+        return utils.run_command(["sleep", "0.3"], stage="ocr")
+
+    with trace.span("doc.pdf", 'file'):
+        workers = [threading.Thread(target=ocr, name=f"ocr-{n}") for n in range(2)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+    trace.finish()
+
+    events = json.loads(trace_path.read_text())["traceEvents"]
+    spans = [event for event in events if event["ph"] == "X"]
+    threads = {event["args"]["name"]: event["tid"] for event in events if event["name"] == "thread_name" and event["pid"] == trace.THREADS_PID}
+    assert {"ocr-0", "ocr-1"} <= set(threads)
+
+    file_span = next(span for span in spans if span["cat"] == "file")
+    commands = [span for span in spans if span["pid"] == trace.COMMANDS_PID]
+    # The two overlapping tools run on two command lanes, inside the file span
+    assert len(commands) == 2 and {span["tid"] for span in commands} == {1, 2}
+    for span in commands:
+        assert span["name"] == "sleep (ocr)" and span["dur"] >= 250_000
+        assert file_span["ts"] <= span["ts"] and span["ts"] + span["dur"] <= file_span["ts"] + file_span["dur"]
+    stages = [span for span in spans if span["cat"] == "stage"]
+    assert sorted(span["tid"] for span in stages) == sorted(threads[name] for name in ("ocr-0", "ocr-1"))